@@ -4,14 +4,29 @@
 
 from collections import namedtuple
 import codecs
+import io
 import json
 import locale
 import sys
 from time import sleep
 import unicodedata
+import zlib
 
 import requests
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
+import dtaoldm.aol as aol_mod
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+GZIP_ENCODING = 'gzip'
+ZSTD_ENCODING = 'zstd'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
 
 
 DativeTopService = namedtuple(
@@ -22,10 +37,85 @@ DativeTopService = namedtuple(
 )
 
 
+def get_accept_encoding():
+    """Return the ``Accept-Encoding`` header value for requests to the
+    DativeTop Server. zstd is only accepted if ``zstandard`` is installed.
+    """
+    if zstandard is None:
+        return GZIP_ENCODING
+    return f'{ZSTD_ENCODING}, {GZIP_ENCODING}'
+
+
+def compress_chunks(chunks, encoding):
+    """Yield the byte strings of ``chunks`` compressed with ``encoding``."""
+    if encoding == ZSTD_ENCODING:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    else:
+        compressor = zlib.compressobj(
+            GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def get_zstd_reader(resp):
+    return io.BufferedReader(
+        zstandard.ZstdDecompressor().stream_reader(resp.raw))
+
+
+def iter_response_lines(resp):
+    """Yield the non-empty lines of the body of the streamed response
+    ``resp``. gzip bodies are decompressed by ``requests``; zstd bodies are
+    decompressed here, since ``requests`` may not support them.
+    """
+    if resp.headers.get('Content-Encoding') != ZSTD_ENCODING:
+        yield from (line for line in resp.iter_lines() if line)
+        return
+    for line in get_zstd_reader(resp):
+        line = line.rstrip(b'\r\n')
+        if line:
+            yield line
+
+
+def get_response_json(resp):
+    if resp.headers.get('Content-Encoding') != ZSTD_ENCODING:
+        return resp.json()
+    return json.loads(get_zstd_reader(resp).read().decode('utf8'))
+
+
 def get(dts, since=None):
-    return requests.get(dts.url).json()
+    """Return the list of the Appendable instances of the AOL of the DativeTop
+    Server that come after the appendable with integrated hash ``since``, or
+    all of them if ``since`` is ``None``. The appendables are streamed as
+    newline-delimited JSON, so the cost is proportional to the number of
+    appendables returned, and compressed if the server supports it.
+    """
+    params = {'offset': 0} if since is None else {'since': since}
+    resp = requests.get(dts.url, params=params, stream=True,
+                        headers={'Accept-Encoding': get_accept_encoding()})
+    resp.raise_for_status()
+    return [aol_mod.parse_appendable(line.decode('utf8')) for line in
+            iter_response_lines(resp)]
 
 
-def append(dts, appendables):
-    return (f'you want to append these appendables to the DativeTop Server AOL:'
-            f' {appendables}.')
+def append(dts, aol, content_encoding=GZIP_ENCODING):
+    """Merge the AOL ``aol`` into the AOL of the DativeTop Server. Return the
+    ``dtaoldm.aol.Patch`` that ``aol`` must be patched with (see
+    ``dtaoldm.aol.apply_patch``) in order to become identical with the
+    server's AOL. The AOL is uploaded as newline-delimited JSON, which the
+    server merges incrementally, compressed with ``content_encoding`` (gzip or,
+    if the server lists it in the ``Accept-Encoding`` header of its responses,
+    zstd), or uncompressed if ``content_encoding`` is ``None``.
+    """
+    body = (aol_mod.serialize_appendable(appendable).encode('utf8') for
+            appendable in aol)
+    headers = {'Content-Type': NDJSON_CONTENT_TYPE,
+               'Accept-Encoding': get_accept_encoding()}
+    if content_encoding:
+        body = compress_chunks(body, content_encoding)
+        headers['Content-Encoding'] = content_encoding
+    resp = requests.put(dts.url, data=body, headers=headers, stream=True)
+    resp.raise_for_status()
+    return aol_mod.dict_to_patch(get_response_json(resp))
@@ -26,6 +26,7 @@ import requests
 import dtaoldm.aol as aol_mod
 import dtaoldm.domain as domain
 
+import dativetop.client as client
 import dativetop.constants as c
 
 
@@ -58,17 +59,16 @@ def _convert_domain_entities_to_nts(domain_entities):
     return ret, None
 
 
-def _fetch_aol_from_dt_server():
-    """Request the AOL from the DativeTop server. It should be a JSON string
-    encoding an array of length-3 arrays (these latter being "appendables")
+def _fetch_dativetop_server_aol(since=None):
+    """Fetch the appendables of the AOL of the DativeTop Server that come after
+    integrated hash ``since`` (all of them if ``since`` is ``None``).
     """
     try:
-        resp = requests.get(c.DATIVETOP_SERVER_URL)
-        resp.raise_for_status()
-        return resp.json(), None
-    except json.decoder.JSONDecodeError:
-        msg = ('Failed to parse JSON from the DativeTop Server response to our'
-               ' GET request.')
+        return client.get(
+            client.DativeTopService(c.DATIVETOP_SERVER_URL), since=since), None
+    except (json.decoder.JSONDecodeError, TypeError):
+        msg = ('Failed to parse appendables from the DativeTop Server response'
+               ' to our GET request.')
         logger.exception(msg)
         return None, msg
     except requests.exceptions.RequestException:
@@ -77,26 +77,15 @@ def _fetch_aol_from_dt_server():
         return None, msg
 
 
-def _fetch_dativetop_server_aol():
-    """Fetch the AOL from the DativeTop Server."""
-    aol, err = _fetch_aol_from_dt_server()
-    if err:
-        return None, err
-    try:
-        return [aol_mod.Appendable(*appbl_lst) for appbl_lst in aol], None
-    except Exception as exc:  # pylint: disable=broad-except
-        return None, (f'Failed to convert list of lists from DativeTop Server'
-                      f' to list of AOL Appendables. Error: {exc}')
-
-
 def _push_aol_to_dativetop_server(aol):
     """Make a PUT request to the DativeTop server in order to push ``aol`` on to
-    the server's AOL.
+    the server's AOL. The AOL is sent compressed; the response is the patch
+    (see ``dtaoldm.aol.Patch``) that would make ``aol`` identical with the
+    server's AOL.
     """
     try:
-        resp = requests.put(c.DATIVETOP_SERVER_URL, json=aol)
-        resp.raise_for_status()
-        return resp.json(), None
+        return client.append(
+            client.DativeTopService(c.DATIVETOP_SERVER_URL), aol), None
     except json.decoder.JSONDecodeError:
         msg = ('Failed to parse JSON from DativeTop Server response to our PUT'
                ' request.')
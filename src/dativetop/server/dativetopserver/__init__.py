@@ -1,7 +1,8 @@
 from pyramid.config import Configurator
 from sqlalchemy import engine_from_config
 
-from .models import DBSession, Base
+from .archiver import get_archive_engine, start_archiver
+from .models import DBSession, Base, configure_archive, migrate_db
 import dativetopserver.views as v
 
 
@@ -11,10 +12,15 @@ def main(global_config, **settings):
     engine = engine_from_config(settings, 'sqlalchemy.')
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
+    migrate_db(engine)
+    archive_engine = get_archive_engine(settings, engine)
+    configure_archive(engine, archive_engine)
+    start_archiver(settings, engine, archive_engine)
     config = Configurator(settings=settings)
     config.include('pyramid_chameleon')
     config.include('pyramid_tm')
     config.include('dativetopserver.cors')
+    config.include('dativetopserver.compression')
     config.add_cors_preflight_handler()
 
     config.add_route('old-service', '/old_service')
@@ -32,6 +38,11 @@ def main(global_config, **settings):
                     route_name='old_state',
                     renderer='json')
 
+    config.add_route('old_history', '/olds/{old_id}/history')
+    config.add_view(v.old_history,
+                    route_name='old_history',
+                    renderer='json')
+
     config.add_route('old', '/olds/{old_id}')
     config.add_view(v.old,
                     route_name='old',
@@ -52,5 +63,15 @@ def main(global_config, **settings):
                     route_name='sync_old_commands',
                     renderer='json')
 
+    config.add_route('changes', '/changes')
+    config.add_view(v.changes,
+                    route_name='changes',
+                    renderer='json')
+
+    config.add_route('aol', '/')
+    config.add_view(v.aol,
+                    route_name='aol',
+                    renderer='json')
+
     config.scan()
     return config.make_wsgi_app()
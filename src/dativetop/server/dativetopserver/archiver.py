@@ -0,0 +1,69 @@
+"""Background archiving of closed temporal rows.
+
+Every update of an OLD, the Dative app, the OLD service or a sync-OLD! command
+closes a row and inserts a new one, so the database grows steadily while the
+SyncManager and SyncWorker loops run. The archiver thread periodically moves
+the rows that were closed more than a retention window ago to the archive
+tables (see ``dativetopserver.models.archive_closed_rows``). It is configured
+by these settings:
+
+- ``archive.retention_days``: how long closed rows stay in the main tables;
+  the archiver does not run if this is unset or 0.
+- ``archive.interval_seconds``: how often the archiver runs (default 3600).
+- ``archive.sqlalchemy.url``: the database of the archive tables, e.g., a
+  separate SQLite file; by default, the main database.
+"""
+
+import datetime
+import logging
+import threading
+
+from sqlalchemy import engine_from_config
+
+import dativetopserver.models as m
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 3600
+
+
+def get_archive_engine(settings, engine):
+    """Return the engine of the archive database configured in ``settings``,
+    or the main database ``engine`` if there is none.
+    """
+    if settings.get('archive.sqlalchemy.url'):
+        return engine_from_config(settings, 'archive.sqlalchemy.')
+    return engine
+
+
+def run_archiver(engine, archive_engine, retention, interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            counts = m.archive_closed_rows(
+                engine, retention, archive_engine=archive_engine)
+        except Exception:
+            logger.exception('Failed to archive closed rows.')
+            continue
+        if any(counts.values()):
+            logger.info('Archived closed rows: %s', counts)
+
+
+def start_archiver(settings, engine, archive_engine):
+    """Start the archiver thread if ``settings`` configure a retention window.
+    Return the ``threading.Event`` that stops it, or ``None``.
+    """
+    retention_days = float(settings.get('archive.retention_days') or 0)
+    if retention_days <= 0:
+        return None
+    interval = float(settings.get('archive.interval_seconds') or
+                     DEFAULT_INTERVAL_SECONDS)
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_archiver,
+        args=(engine, archive_engine,
+              datetime.timedelta(days=retention_days), interval, stop_event),
+        name='archiver',
+        daemon=True)
+    thread.start()
+    return stop_event
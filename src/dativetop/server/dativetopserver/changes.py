@@ -0,0 +1,106 @@
+"""Feed of the changes made through ``dativetopserver.models``.
+
+Every create, update, transition and delete of an OLD, the Dative app, the OLD
+service or a sync-OLD! command is recorded (see ``record_change``) and, once
+its transaction commits, published to an in-memory ring buffer of the last
+``BUFFER_SIZE`` changes. Each published change has a cursor; consumers resume
+the feed after the last cursor that they saw (see ``get_changes``), so they can
+stop polling the resources.
+
+Cursors are only meaningful to the server process that issued them. If a
+consumer's cursor was issued by another process, or has fallen out of the
+buffer, the consumer must re-fetch the resources, since changes were missed.
+"""
+
+from collections import deque, namedtuple
+import threading
+from uuid import uuid4
+
+import transaction
+
+
+BUFFER_SIZE = 1000
+
+# Identifies this server process in the cursors that it issues.
+STREAM_ID = uuid4().hex[:12]
+
+
+Change = namedtuple(
+    'Change', (
+        'cursor',  # string that identifies the change in the feed
+        'resource',  # e.g., 'old' or 'sync_old_command'
+        'action',  # e.g., 'create', 'update', 'transition' or 'delete'
+        'data',  # the serialized resource after the change
+    ))
+
+
+changes = deque(maxlen=BUFFER_SIZE)
+changes_published = threading.Condition()
+sequence = 0
+
+
+def get_cursor(sequence_number):
+    return f'{STREAM_ID}-{sequence_number}'
+
+
+def parse_cursor(cursor):
+    """Return the sequence number of ``cursor``, or ``None`` if it was not
+    issued by this process.
+    """
+    stream_id, _, sequence_number = (cursor or '').partition('-')
+    if stream_id != STREAM_ID:
+        return None
+    try:
+        return int(sequence_number)
+    except ValueError:
+        return None
+
+
+def get_head_cursor():
+    """Return the cursor of the latest change."""
+    with changes_published:
+        return get_cursor(sequence)
+
+
+def publish(committed, pending):
+    global sequence
+    if not committed:
+        return
+    with changes_published:
+        for resource, action, data in pending:
+            sequence += 1
+            changes.append(
+                Change(get_cursor(sequence), resource, action, data))
+        changes_published.notify_all()
+
+
+def record_change(resource, action, data):
+    """Record that ``resource`` was changed by ``action``. The change is
+    published once the current transaction commits, and dropped if it aborts.
+    """
+    transaction.get().addAfterCommitHook(
+        publish, args=([(resource, action, data)],))
+
+
+def get_changes(cursor):
+    """Return the changes published after ``cursor`` as a "maybe" 2-tuple. The
+    error means that changes after ``cursor`` can no longer be listed.
+    """
+    after = parse_cursor(cursor)
+    with changes_published:
+        if after is None or after > sequence:
+            return None, 'Unknown cursor'
+        oldest = sequence - len(changes)
+        if after < oldest:
+            return None, 'Cursor has expired'
+        return list(changes)[after - oldest:], None
+
+
+def wait_for_changes(cursor, timeout):
+    """Wait up to ``timeout`` seconds for a change to be published after
+    ``cursor``. Return whether one was.
+    """
+    after = parse_cursor(cursor)
+    with changes_published:
+        return changes_published.wait_for(
+            lambda: after is None or sequence > after, timeout=timeout)
@@ -0,0 +1,181 @@
+"""Content-negotiated compression of request and response bodies.
+
+Responses whose content type is in ``COMPRESSIBLE_CONTENT_TYPES`` are
+compressed with the best encoding that the client accepts (per its
+``Accept-Encoding`` header): zstd, if the optional ``zstandard`` package is
+installed, else gzip. Streamed responses (e.g., newline-delimited AOL suffixes)
+are compressed chunk by chunk as they are sent.
+
+Request bodies with a ``Content-Encoding`` of gzip or zstd are decompressed
+as they are read, so views see the plain body, whether they read
+``request.json_body`` or stream ``request.body_file``. A body that cannot be
+decompressed gets a 400 response. Every response advertises the encodings
+accepted for request bodies in its ``Accept-Encoding`` header.
+"""
+
+import gzip
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP_ENCODING = 'gzip'
+ZSTD_ENCODING = 'zstd'
+
+COMPRESSIBLE_CONTENT_TYPES = ('application/json', 'application/x-ndjson')
+COMPRESSION_MIN_SIZE = 512
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+BAD_BODY_ERR = 'The request body could not be decompressed'
+
+# The errors raised by the decompressing file objects on corrupt or truncated
+# input.
+DECOMPRESSION_ERRORS = (EOFError, OSError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+class DecompressionError(ValueError):
+    """Raised when a compressed request body cannot be decompressed."""
+
+
+def includeme(config):
+    config.add_subscriber(decompress_request, 'pyramid.events.NewRequest')
+    config.add_subscriber(compress_response, 'pyramid.events.NewResponse')
+    config.add_view(bad_body, context=DecompressionError, renderer='json')
+
+
+def bad_body(exc, request):
+    request.response.status = 400
+    return {'error': BAD_BODY_ERR}
+
+
+def get_supported_encodings():
+    """Return the supported content encodings, most preferred first."""
+    if zstandard is None:
+        return (GZIP_ENCODING,)
+    return (ZSTD_ENCODING, GZIP_ENCODING)
+
+
+def get_accepted_encodings(accept_encoding):
+    """Return the set of content codings that the ``Accept-Encoding`` header
+    value ``accept_encoding`` accepts, i.e., those without ``q=0``.
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """Return the most preferred supported encoding accepted by the
+    ``Accept-Encoding`` header value ``accept_encoding``, or ``None``.
+    """
+    accepted = get_accepted_encodings(accept_encoding or '')
+    for encoding in get_supported_encodings():
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def get_compressor(encoding):
+    """Return a compressor object (with ``compress`` and ``flush`` methods) for
+    ``encoding``.
+    """
+    if encoding == ZSTD_ENCODING:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress_iter(app_iter, encoding):
+    """Yield the chunks of ``app_iter`` compressed with ``encoding``."""
+    compressor = get_compressor(encoding)
+    try:
+        for chunk in app_iter:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(event):
+    request = event.request
+    response = event.response
+    # Advertise the encodings accepted for request bodies (RFC 7694).
+    response.headers['Accept-Encoding'] = ', '.join(get_supported_encodings())
+    if (response.content_encoding or
+            response.content_type not in COMPRESSIBLE_CONTENT_TYPES):
+        return
+    if (response.content_length is not None and
+            response.content_length < COMPRESSION_MIN_SIZE):
+        return
+    if 'Accept-Encoding' not in (response.vary or ()):
+        response.vary = tuple(response.vary or ()) + ('Accept-Encoding',)
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return
+    response.app_iter = compress_iter(response.app_iter, encoding)
+    response.content_length = None
+    response.content_encoding = encoding
+
+
+class DecompressingReader(io.RawIOBase):
+    """A raw reader of the decompressing file object ``decompressed`` that
+    raises ``DecompressionError`` if its input is corrupt or truncated.
+    """
+
+    def __init__(self, decompressed):
+        self.decompressed = decompressed
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            return self.decompressed.readinto(buffer)
+        except DECOMPRESSION_ERRORS as exc:
+            raise DecompressionError(str(exc)) from exc
+
+
+def get_decompressing_file(fileobj, encoding):
+    """Return a file object that reads ``fileobj`` decompressed with
+    ``encoding``, or ``None`` if ``encoding`` is not supported. Reading it
+    raises ``DecompressionError`` if ``fileobj`` is not validly compressed.
+    """
+    if encoding in (GZIP_ENCODING, 'x-gzip'):
+        decompressed = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif encoding == ZSTD_ENCODING and zstandard is not None:
+        decompressed = zstandard.ZstdDecompressor().stream_reader(fileobj)
+    else:
+        return None
+    return io.BufferedReader(DecompressingReader(decompressed))
+
+
+def decompress_request(event):
+    request = event.request
+    encoding = (request.headers.get('Content-Encoding') or '').strip().lower()
+    if not encoding or encoding == 'identity':
+        return
+    decompressing_file = get_decompressing_file(request.body_file, encoding)
+    if decompressing_file is None:
+        return
+    request.body_file = decompressing_file
+    del request.headers['Content-Encoding']
@@ -13,7 +13,10 @@ from .models import (
     DBSession,
     DativeApp,
     Base,
+    configure_archive,
+    migrate_db,
     )
+from .archiver import get_archive_engine
 
 
 def usage(argv):
@@ -32,3 +35,5 @@ def main(argv=sys.argv):
     engine = engine_from_config(settings, 'sqlalchemy.')
     DBSession.configure(bind=engine)
     Base.metadata.create_all(engine)
+    migrate_db(engine)
+    configure_archive(engine, get_archive_engine(settings, engine))
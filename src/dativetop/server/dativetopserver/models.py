@@ -2,6 +2,7 @@ from collections import namedtuple
 import datetime
 import json
 import logging
+import threading
 import transaction
 from uuid import uuid4
 
@@ -12,15 +13,18 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    MetaData,
     String,
+    Table,
     Text,
     Unicode,
     UnicodeText,
 )
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import asc
+from sqlalchemy import asc, inspect, select
 from sqlalchemy.orm.exc import (
     NoResultFound,
     MultipleResultsFound,
@@ -32,6 +36,8 @@ from sqlalchemy.orm import (
 
 from zope.sqlalchemy import register
 
+from dativetopserver.changes import record_change
+
 
 logger = logging.getLogger(__name__)
 
@@ -69,8 +75,15 @@ old_state_transitions = {
     old_state.failed_to_sync: [old_state.not_synced]
 }
 
+# Superseded rows are never removed from the tables below, so every query
+# for the current rows (``end > now``) is served by an index whose leading
+# columns are the other columns of the query's filter, followed by ``end``.
+
 class DativeApp(Base):
     __tablename__ = 'dativeapp'
+    __table_args__ = (
+        Index('ix_dativeapp_history_id_end', 'history_id', 'end'),
+    )
     uuid = Column(String(length=36), primary_key=True, default=gen_uuid)
     history_id = Column(String(length=36), default=gen_uuid, index=True)
     url = Column(Unicode(length=512))
@@ -80,6 +93,9 @@ class DativeApp(Base):
 
 class OLDService(Base):
     __tablename__ = 'oldservice'
+    __table_args__ = (
+        Index('ix_oldservice_history_id_end', 'history_id', 'end'),
+    )
     uuid = Column(String(length=36), primary_key=True, default=gen_uuid)
     history_id = Column(String(length=36), default=gen_uuid, index=True)
     url = Column(Text)
@@ -89,6 +105,10 @@ class OLDService(Base):
 
 class OLD(Base):
     __tablename__ = 'old'
+    __table_args__ = (
+        Index('ix_old_history_id_end', 'history_id', 'end'),
+        Index('ix_old_slug_end', 'slug', 'end'),
+    )
     uuid = Column(String(length=36), primary_key=True, default=gen_uuid)
     history_id = Column(String(length=36), default=gen_uuid, index=True)
     # suffixed to the URL of the local OLDService.url, e.g., "oka"
@@ -111,14 +131,164 @@ class OLD(Base):
 
 class SyncOLDCommand(Base):
     __tablename__ = 'syncoldcommand'
+    __table_args__ = (
+        Index('ix_syncoldcommand_history_id_end', 'history_id', 'end'),
+        Index('ix_syncoldcommand_old_id_end', 'old_id', 'end'),
+        # the queue: open commands in FIFO order
+        Index('ix_syncoldcommand_acked_end_start', 'acked', 'end', 'start'),
+        # acked commands whose leases have expired
+        Index('ix_syncoldcommand_acked_leased_until', 'acked', 'leased_until'),
+    )
     uuid = Column(String(length=36), primary_key=True, default=gen_uuid)
     history_id = Column(String(length=36), default=gen_uuid, index=True)
     old_id = Column(Integer, ForeignKey('old.history_id'), index=True)
     acked = Column(Boolean, default=False, index=True)
+    # An acked command whose lease has expired (e.g., because its worker
+    # crashed) can be popped again.
+    leased_until = Column(DateTime)
     start = Column(DateTime, default=get_now, index=True)
     end = Column(DateTime, default=datetime.datetime.max, index=True)
 
 
+def add_missing_columns(engine, metadata=Base.metadata):
+    """Add the columns of the existing tables in ``metadata`` that do not exist
+    yet. Only nullable columns without server defaults can be added this way,
+    which is how columns must be added to the models.
+    """
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not engine.dialect.has_table(conn, table.name):
+                continue
+            existing = {column['name'] for column in
+                        inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {preparer.quote(table.name)} ADD COLUMN'
+                    f' {preparer.quote(column.name)} {column_type}')
+
+
+def migrate_db(engine):
+    """Migrate the tables of a database that was built by an earlier version of
+    the models: add their missing columns and indexes.
+    """
+    add_missing_columns(engine)
+    create_indexes(engine)
+
+
+def create_indexes(engine):
+    """Create the indexes of the existing tables in ``Base`` that do not exist
+    yet. ``Base.metadata.create_all`` only creates the indexes of the tables
+    that it creates, so this migrates databases that were created before an
+    index was added.
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not engine.dialect.has_table(conn, table.name):
+                continue
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+# Archive of closed rows
+
+# The closed rows of the temporal tables above are never needed to serve the
+# current state, so rows that were closed more than a retention window ago can
+# be moved to archive tables (see ``archive_closed_rows``), which may live in a
+# separate database (see ``configure_archive``). ``get_history`` spans both.
+
+TEMPORAL_MODELS = (DativeApp, OLDService, OLD, SyncOLDCommand)
+
+ARCHIVE_BATCH_SIZE = 500
+
+archive_metadata = MetaData()
+
+
+def make_archive_table(model):
+    """Return the archive table of the temporal ``model``: a copy of its table
+    without constraints other than the primary key.
+    """
+    table = model.__table__
+    name = f'{table.name}_archive'
+    return Table(
+        name, archive_metadata,
+        *[Column(column.name, column.type, primary_key=column.primary_key)
+          for column in table.columns],
+        Index(f'ix_{name}_history_id_end', 'history_id', 'end'))
+
+
+ARCHIVE_TABLES = {model.__tablename__: make_archive_table(model)
+                  for model in TEMPORAL_MODELS}
+
+
+def configure_archive(engine, archive_engine=None):
+    """Create the archive tables in ``archive_engine`` (by default, the main
+    database ``engine``) and route ``DBSession`` queries of them there.
+    """
+    archive_engine = archive_engine or engine
+    archive_metadata.create_all(archive_engine)
+    add_missing_columns(archive_engine, archive_metadata)
+    if archive_engine is not engine:
+        DBSession.configure(binds={table: archive_engine for table in
+                                   ARCHIVE_TABLES.values()})
+
+
+def archive_closed_rows(engine, retention, archive_engine=None,
+                        batch_size=ARCHIVE_BATCH_SIZE, now=None):
+    """Move the rows of the temporal tables of ``engine`` that were closed
+    more than ``retention`` (a ``timedelta``) ago to their archive tables in
+    ``archive_engine`` (by default, ``engine``), in batches of ``batch_size``.
+    Return a dict from table names to the number of rows archived.
+
+    If the archive is in the main database, each batch is moved in a single
+    transaction. Otherwise, each batch is committed to the archive before it is
+    deleted from the main database, replacing any rows of the batch that a
+    previous, interrupted run already archived.
+    """
+    archive_engine = archive_engine or engine
+    cutoff = (now or get_now()) - retention
+    counts = {}
+    for model in TEMPORAL_MODELS:
+        table = model.__table__
+        archive_table = ARCHIVE_TABLES[table.name]
+        query = select(table).where(table.c.end < cutoff).limit(batch_size)
+        count = 0
+        while True:
+            with engine.begin() as conn:
+                rows = [dict(row._mapping) for row in conn.execute(query)]
+                if not rows:
+                    break
+                uuids = [row['uuid'] for row in rows]
+                if archive_engine is engine:
+                    conn.execute(archive_table.insert(), rows)
+                else:
+                    with archive_engine.begin() as archive_conn:
+                        archive_conn.execute(archive_table.delete().where(
+                            archive_table.c.uuid.in_(uuids)))
+                        archive_conn.execute(archive_table.insert(), rows)
+                conn.execute(table.delete().where(table.c.uuid.in_(uuids)))
+            count += len(rows)
+        counts[table.name] = count
+    return counts
+
+
+def get_history(model, history_id):
+    """Return all of the rows, current, closed and archived, of the entity of
+    the temporal ``model`` with ``history_id``, ordered by ``start``. Archived
+    rows are returned as read-only rows with the same attributes as ``model``
+    instances.
+    """
+    archive_table = ARCHIVE_TABLES[model.__tablename__]
+    rows = DBSession.query(model).filter(
+        model.history_id == history_id).all()
+    rows += DBSession.execute(select(archive_table).where(
+        archive_table.c.history_id == history_id)).fetchall()
+    return sorted(rows, key=lambda row: row.start)
+
+
 # Dative App helper functions
 
 DEFAULT_DATIVE_APP_URL = 'http://127.0.0.1:5678'
@@ -142,6 +312,7 @@ def get_dative_app():
     app = DativeApp(url=DEFAULT_DATIVE_APP_URL)
     DBSession.add(app)
     DBSession.flush()
+    record_change('dative_app', 'create', serialize_dative_app(app))
     return app
 
 
@@ -155,6 +326,7 @@ def update_dative_app(url):
     DBSession.add(app)
     DBSession.add(new_app)
     DBSession.flush()
+    record_change('dative_app', 'update', serialize_dative_app(new_app))
     return new_app
 
 
@@ -182,6 +354,7 @@ def get_old_service():
     old_service = OLDService(url=DEFAULT_OLD_SERVICE_URL)
     DBSession.add(old_service)
     DBSession.flush()
+    record_change('old_service', 'create', serialize_old_service(old_service))
     return old_service
 
 
@@ -195,6 +368,8 @@ def update_old_service(url):
     DBSession.add(old_service)
     DBSession.add(new_old_service)
     DBSession.flush()
+    record_change('old_service', 'update',
+                  serialize_old_service(new_old_service))
     return new_old_service
 
 
@@ -213,6 +388,14 @@ def serialize_old(old):
     }
 
 
+def serialize_old_revision(old):
+    """Serialize a row of the history of an OLD (see ``get_history``)."""
+    serialized = serialize_old(old)
+    serialized['start'] = old.start.isoformat()
+    serialized['end'] = old.end.isoformat()
+    return serialized
+
+
 def create_old(slug, name=None, leader=None, username=None, password=None,
                is_auto_syncing=False):
     existing_old = DBSession.query(OLD).filter(
@@ -229,6 +412,7 @@ def create_old(slug, name=None, leader=None, username=None, password=None,
               is_auto_syncing=is_auto_syncing)
     DBSession.add(old)
     DBSession.flush()
+    record_change('old', 'create', serialize_old(old))
     return old
 
 
@@ -246,6 +430,7 @@ def update_old(old, **kwargs):
     DBSession.add(old)
     DBSession.add(new_old)
     DBSession.flush()
+    record_change('old', 'update', serialize_old(new_old))
     return new_old
 
 
@@ -264,6 +449,7 @@ def transition_old(old, state):
     DBSession.add(old)
     DBSession.add(new_old)
     DBSession.flush()
+    record_change('old', 'transition', serialize_old(new_old))
     return new_old
 
 
@@ -271,6 +457,7 @@ def delete_old(old):
     old.end = get_now()
     DBSession.add(old)
     DBSession.flush()
+    record_change('old', 'delete', serialize_old(old))
     return old
 
 
@@ -299,9 +486,11 @@ def get_olds():
 # complete: c.end   < now
 
 def serialize_sync_old_command(sync_old_command):
+    leased_until = sync_old_command.leased_until
     return {'id': sync_old_command.history_id,
             'old_id': sync_old_command.old_id,
-            'acked': sync_old_command.acked}
+            'acked': sync_old_command.acked,
+            'leased_until': leased_until and leased_until.isoformat()}
 
 
 def get_open_sync_old_commands():
@@ -312,6 +501,32 @@ def get_open_sync_old_commands():
     ).order_by(asc(SyncOLDCommand.start)).all()
 
 
+# Long-polling pops wait on this condition for the enqueue count to change. The
+# count is incremented, and waiters are notified, after the transaction that
+# enqueued a command commits, so that woken waiters can see the command.
+sync_old_command_enqueued = threading.Condition()
+sync_old_command_enqueue_count = 0
+
+
+def notify_sync_old_command_enqueued(committed):
+    global sync_old_command_enqueue_count
+    if not committed:
+        return
+    with sync_old_command_enqueued:
+        sync_old_command_enqueue_count += 1
+        sync_old_command_enqueued.notify_all()
+
+
+def wait_for_sync_old_command(enqueue_count, timeout):
+    """Wait up to ``timeout`` seconds for a sync-OLD! command to be enqueued
+    after the enqueue count was ``enqueue_count``. Return whether one was.
+    """
+    with sync_old_command_enqueued:
+        return sync_old_command_enqueued.wait_for(
+            lambda: sync_old_command_enqueue_count != enqueue_count,
+            timeout=timeout)
+
+
 def enqueue_sync_old_command(old_id):
     """Enqueue a sync-OLD! command."""
     now = get_now()
@@ -324,6 +539,9 @@ def enqueue_sync_old_command(old_id):
     command = SyncOLDCommand(old_id=old_id) # enqueued
     DBSession.add(command)
     DBSession.flush()
+    transaction.get().addAfterCommitHook(notify_sync_old_command_enqueued)
+    record_change('sync_old_command', 'enqueue',
+                  serialize_sync_old_command(command))
     return command, 'created'
 
 
@@ -337,27 +555,87 @@ def get_sync_old_command(sync_old_command_id):
     return command
 
 
-def pop_sync_old_command():
-    """Get the next sync-OLD! command that needs to be run, or ``None`` if there
-    aren't any. Pop it from the end of the queue by acknowledging it."""
-    now = get_now()
-    next_command = DBSession.query(SyncOLDCommand).filter(
-        SyncOLDCommand.end > now,
-        SyncOLDCommand.acked.is_(False)
+# How long a worker may take to run a popped command before it can be popped
+# again.
+DEFAULT_LEASE = datetime.timedelta(minutes=30)
+
+
+def claim_sync_old_command(command, now, lease):
+    """Atomically acknowledge the active ``command``, leasing it to the caller
+    until ``now`` + ``lease``. Return the new acked command, or ``None`` if
+    another transaction closed ``command`` first.
+
+    The claim is a compare-and-set: ``command`` is only closed if it is still
+    open, and a single-statement ``UPDATE`` either closes it or finds it
+    closed, so two concurrent pops can never both claim it. Open rows are
+    matched by their ``end`` sentinel rather than by ``end > now``, since a pop
+    with a later ``now`` may have closed the row after ``now``.
+    """
+    claimed = DBSession.query(SyncOLDCommand).filter(
+        SyncOLDCommand.uuid == command.uuid,
+        SyncOLDCommand.end == datetime.datetime.max,
+    ).update({SyncOLDCommand.end: now}, synchronize_session='evaluate')
+    if not claimed:
+        return None
+    acked_command = SyncOLDCommand(history_id=command.history_id,
+                                   old_id=command.old_id,
+                                   acked=True,
+                                   leased_until=now + lease,
+                                   start=now)
+    DBSession.add(acked_command)
+    return acked_command
+
+
+def get_pop_candidates(now, limit):
+    """Return the first ``limit`` active sync-OLD! commands that are unacked
+    or whose leases have expired, in FIFO order. Each kind is queried
+    separately, so that both queries can use an index of the queue.
+    """
+    unacked = DBSession.query(SyncOLDCommand).filter(
+        SyncOLDCommand.acked.is_(False),
+        SyncOLDCommand.end > now
     ).order_by(
         asc(SyncOLDCommand.start)
-    ).first()
-    if not next_command:
-        return None
-    next_command.end = now
-    new_kwargs = {'history_id': next_command.history_id,
-                  'old_id': next_command.old_id,
-                  'acked': True,}
-    new_next_command = SyncOLDCommand(**new_kwargs)
-    DBSession.add(next_command)
-    DBSession.add(new_next_command)
+    ).limit(limit).all()
+    expired = DBSession.query(SyncOLDCommand).filter(
+        SyncOLDCommand.acked.is_(True),
+        SyncOLDCommand.leased_until < now,
+        SyncOLDCommand.end > now
+    ).order_by(
+        asc(SyncOLDCommand.start)
+    ).limit(limit).all()
+    return sorted(unacked + expired,
+                  key=lambda command: command.start)[:limit]
+
+
+def pop_sync_old_commands(limit=1, lease=DEFAULT_LEASE):
+    """Pop up to ``limit`` sync-OLD! commands that need to be run, in FIFO
+    order, by acknowledging them (see ``claim_sync_old_command``). Acked
+    commands whose leases have expired are popped again.
+    """
+    now = get_now()
+    popped = []
+    while len(popped) < limit:
+        candidates = get_pop_candidates(now, limit - len(popped))
+        claimed = [claim_sync_old_command(candidate, now, lease) for
+                   candidate in candidates]
+        claimed = [command for command in claimed if command is not None]
+        if not claimed:
+            # Concurrent pops claimed all of the candidates.
+            break
+        popped += claimed
     DBSession.flush()
-    return new_next_command
+    for command in popped:
+        record_change('sync_old_command', 'pop',
+                      serialize_sync_old_command(command))
+    return popped
+
+
+def pop_sync_old_command(lease=DEFAULT_LEASE):
+    """Get the next sync-OLD! command that needs to be run, or ``None`` if there
+    aren't any. Pop it from the end of the queue by acknowledging it."""
+    popped = pop_sync_old_commands(lease=lease)
+    return popped[0] if popped else None
 
 
 def complete_sync_old_command(sync_old_command_id):
@@ -371,4 +649,6 @@ def complete_sync_old_command(sync_old_command_id):
     command.end = now
     DBSession.add(command)
     DBSession.flush()
+    record_change('sync_old_command', 'complete',
+                  serialize_sync_old_command(command))
     return command
@@ -1,13 +1,20 @@
+import datetime
 import json
 import logging
 from logging.config import dictConfig
+import os
 import sys
+import threading
+import time
 from urllib.parse import urlparse
 
+import dtaoldm.aol as aol_mod
+import dtaoldm.writer as aol_writer
 from pyramid.config import Configurator
 from sqlalchemy.orm.exc import NoResultFound
 from wsgiref.simple_server import make_server
 
+import dativetopserver.changes as changes_mod
 import dativetopserver.models as m
 
 logging_config = dict(
@@ -33,10 +40,174 @@ dictConfig(logging_config)
 logger = logging.getLogger(__name__)
 
 
+# / (append-only log) endpoint
+
+AOL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'dativetop.aol.txt')
+
+aol_writers = {}
+aol_writers_lock = threading.Lock()
+
+
+def get_aol_path(request):
+    settings = request.registry.settings or {}
+    return settings.get('aol.path', AOL_PATH)
+
+
+def get_aol_writer(request):
+    """Return the ``AOLWriter`` for the AOL configured for this application.
+    A single writer is shared by all request threads so that the tip hash and
+    hash index of the AOL are only read from disk once.
+    """
+    aol_path = get_aol_path(request)
+    with aol_writers_lock:
+        writer = aol_writers.get(aol_path)
+        if writer is None:
+            writer = aol_writers[aol_path] = aol_writer.AOLWriter(aol_path)
+        return writer
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+STREAM_CHUNK_SIZE = 65536
+
+
+def iter_file_range(fh, length, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the next ``length`` bytes of the open file ``fh`` in chunks of at
+    most ``chunk_size`` bytes, then close ``fh``.
+    """
+    try:
+        while length > 0:
+            chunk = fh.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def get_start_position(request, writer):
+    """Return a "maybe" 2-tuple whose first element is the position of the
+    first appendable requested via the ``since`` (integrated hash) or
+    ``offset`` (position) parameter of ``request``.
+    """
+    since = request.params.get('since')
+    if since is not None:
+        position = writer.hash_index.get(since)
+        if position is None:
+            request.response.status = 404
+            return None, {'error': 'No appendable with the supplied hash'}
+        return position + 1, None
+    try:
+        offset = int(request.params['offset'])
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        request.response.status = 400
+        return None, {'error': 'Offset must be a non-negative integer'}
+    return offset, None
+
+
+def read_log(request):
+    """Return the append-only log as a JSON array of appendables.
+
+    If a ``since`` integrated hash or an ``offset`` position is supplied, only
+    the appendables after ``since`` (or from position ``offset`` on) are
+    returned, streamed as newline-delimited JSON, one appendable per line. The
+    lines are copied verbatim from the AOL file, starting at the byte offset
+    recorded in its hash index, so the cost is proportional to the number of
+    appendables returned, not to the size of the log.
+    """
+    if 'since' not in request.params and 'offset' not in request.params:
+        logger.info('Reading the AOL')
+        return aol_mod.get_aol(get_aol_path(request))
+    writer = get_aol_writer(request)
+    start, error = get_start_position(request, writer)
+    if error:
+        return error
+    fh, length = writer.open_lines(start)
+    logger.info('Streaming %s bytes of the AOL from position %s', length,
+                start)
+    response = request.response
+    response.content_type = NDJSON_CONTENT_TYPE
+    response.app_iter = iter_file_range(fh, length)
+    return response
+
+
+class BadAppendableLine(ValueError):
+    """Raised when a line of a newline-delimited JSON AOL is not an
+    appendable.
+    """
+
+
+def iter_ndjson_aol(body_file):
+    """Yield the Appendable instances on the lines of the newline-delimited
+    JSON file ``body_file``, one at a time, as they are read. Raise
+    ``BadAppendableLine`` on the first line that is not an appendable.
+    """
+    for line_number, line in enumerate(body_file, 1):
+        if not line.strip():
+            continue
+        try:
+            quad, hash_, integrated_hash = aol_mod.parse_json(
+                line.decode('utf8'))
+            appendable = aol_mod.Appendable(
+                aol_mod.Quad(*quad), hash_, integrated_hash)
+        except (ValueError, TypeError):
+            raise BadAppendableLine(
+                f'Line {line_number} of the request body is not a valid'
+                f' appendable')
+        yield appendable
+
+
+def get_ingest_batch_size(request):
+    settings = request.registry.settings or {}
+    return int(settings.get('aol.ingest_batch_size',
+                            aol_writer.DEFAULT_BATCH_SIZE))
+
+
+def append_stream_to_log(request):
+    """Merge the newline-delimited JSON AOL in the body of the request into
+    the append-only log. The body is parsed line by line as it is read, and
+    the new appendables are merged in batches (see
+    ``dtaoldm.writer.AOLWriter.merge_stream``), so the memory used does not
+    grow with the size of the body; since the body is only read as fast as
+    the batches are merged, a fast sender is slowed down by the transport.
+    Appendables merged before a bad line are kept.
+    """
+    logger.info('Appending a stream of appendables to the AOL')
+    try:
+        patch, err = get_aol_writer(request).merge_stream(
+            iter_ndjson_aol(request.body_file),
+            conflict_resolution_strategy='rebase',
+            batch_size=get_ingest_batch_size(request))
+    except BadAppendableLine as exc:
+        logger.warning(str(exc))
+        request.response.status = 400
+        return {'error': str(exc)}
+    if err:
+        logger.warning('Failed to merge mergee into target')
+        request.response.status = 400
+        return {'error': err}
+    logger.info('Returning a patch of %s appendables to the sender',
+                len(patch.appendables))
+    return patch._asdict()
+
+
 def append_to_log(request):
     """Add the sequence of appendables in the request to the append-only
-    log.
+    log. Return the patch (see ``dtaoldm.aol.Patch``) that the sender must
+    apply to its AOL in order to become identical with the merged log, as a
+    JSON object with ``base_hash`` and ``appendables`` keys.
+
+    The appendables are either a JSON array or, if the content type of the
+    request is ``application/x-ndjson``, newline-delimited JSON (see
+    ``append_stream_to_log``).
     """
+    content_type = request.headers.get('Content-Type', '')
+    if content_type.split(';')[0].strip() == NDJSON_CONTENT_TYPE:
+        return append_stream_to_log(request)
     logger.info('Appending to the AOL')
     try:
         payload = request.json_body
@@ -54,23 +225,28 @@ def append_to_log(request):
     except Exception as err:
         logger.warning('Exception when calling ``mergee = aol_mod.list_to_aol(payload)``')
         logger.warning(err)
-        raise
+        request.response.status = 400
+        return {'error': 'Request body is not a valid AOL'}
 
     logger.info('Got mergee AOL')
-    target = aol_mod.get_aol(AOL_PATH)
-    logger.info('Got target AOL')
-    merged, err = aol_mod.merge_aols(
-        target, mergee, conflict_resolution_strategy='rebase')
+    patch, err = get_aol_writer(request).merge(
+        mergee, conflict_resolution_strategy='rebase', diff_only=True)
     if err:
         logger.warning('Failed to merge mergee into target')
         request.response.status = 400
         return {'error': err}
-    logger.info('Merged mergee into target')
-    aol_mod.persist_aol(merged, AOL_PATH)
-    logger.info('Persisted mergee into target')
-    # What we want to return here is the AOL that the sender does not know
-    # about ... the patch. See ongoing work at dtaoldm/aol.py.
-    return []
+    logger.info('Returning a patch of %s appendables to the sender',
+                len(patch.appendables))
+    return patch._asdict()
+
+
+def aol(request):
+    if request.method == 'GET':
+        return read_log(request)
+    if request.method == 'PUT':
+        return append_to_log(request)
+    request.response.status = 405
+    return {'error': 'The / endpoint only recognizes GET and PUT requests.'}
 
 
 def validate_local_url(url):
@@ -263,6 +439,15 @@ def read_old(request):
     return m.serialize_old(old)
 
 
+def read_old_history(request):
+    old_id = request.matchdict['old_id']
+    history = m.get_history(m.OLD, old_id)
+    if not history:
+        request.response.status = 404
+        return {'error': 'No OLD with supplied ID'}
+    return [m.serialize_old_revision(old) for old in history]
+
+
 def update_old(request):
     old_id = request.matchdict['old_id']
     try:
@@ -379,6 +564,15 @@ def old(request):
                       ' DELETE requests.')}
 
 
+# /olds/{old_id}/history endpoint
+def old_history(request):
+    if request.method == 'GET':
+        return read_old_history(request)
+    request.response.status = 405
+    return {'error': ('The /olds/{old_id}/history endpoint only recognizes GET'
+                      ' requests.')}
+
+
 # /olds/{old_id}/state endpoint
 def old_state(request):
     if request.method == 'PUT':
@@ -426,12 +620,67 @@ def enqueue_command(request):
     return m.serialize_sync_old_command(cmd)
 
 
+def get_positive_int_param(request, name):
+    """Return the value of the positive integer query parameter ``name`` of
+    ``request`` (or ``None`` if it is absent) as a "maybe" 2-tuple.
+    """
+    value = request.params.get(name)
+    if value is None:
+        return None, None
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        return None, f'{name} must be a positive integer'
+    return value, None
+
+
+# Maximum number of seconds that a pop waits for a command to be enqueued.
+# Each waiting pop holds a server thread.
+MAX_POP_WAIT = 60
+
+
+def pop_commands(limit, lease, wait):
+    """Pop up to ``limit`` commands. If there are none, wait up to ``wait``
+    seconds for one to be enqueued.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        enqueue_count = m.sync_old_command_enqueue_count
+        commands = m.pop_sync_old_commands(limit=limit, lease=lease)
+        timeout = deadline - time.monotonic()
+        if commands or timeout <= 0:
+            return commands
+        m.wait_for_sync_old_command(enqueue_count, timeout)
+
+
 def pop_command(request):
-    command = m.pop_sync_old_command()
-    if not command:
+    """Pop the next command off of the queue. With a ``limit`` query parameter,
+    pop up to that many commands and return them as a (possibly empty) list.
+    A ``lease`` query parameter sets the number of seconds after which the
+    popped commands can be popped again unless they have been completed. A
+    ``wait`` query parameter sets the number of seconds (at most
+    ``MAX_POP_WAIT``) to wait for a command to be enqueued if the queue is
+    empty.
+    """
+    limit, error = get_positive_int_param(request, 'limit')
+    if not error:
+        lease, error = get_positive_int_param(request, 'lease')
+    if not error:
+        wait, error = get_positive_int_param(request, 'wait')
+    if error:
+        request.response.status = 400
+        return {'error': error}
+    lease = (m.DEFAULT_LEASE if lease is None else
+             datetime.timedelta(seconds=lease))
+    commands = pop_commands(limit or 1, lease, min(wait or 0, MAX_POP_WAIT))
+    if limit is not None:
+        return [m.serialize_sync_old_command(command) for command in commands]
+    if not commands:
         request.response.status = 404
         return {'error': 'No commands in the queue'}
-    return m.serialize_sync_old_command(command)
+    return m.serialize_sync_old_command(commands[0])
 
 
 def show_command(request):
@@ -476,6 +725,71 @@ def sync_old_command(request):
                       ' and DELETE requests.')}
 
 
+# /changes endpoint
+
+EVENT_STREAM_CONTENT_TYPE = 'text/event-stream'
+
+# Seconds between the keep-alive comments of an idle stream, and seconds after
+# which a stream ends. Each stream holds a server thread, so streams end
+# periodically and clients reconnect after ``RECONNECT_DELAY`` milliseconds,
+# resuming from the ID of the last event that they received.
+KEEPALIVE_INTERVAL = 15
+MAX_STREAM_DURATION = 300
+RECONNECT_DELAY = 1000
+
+
+def format_event(event, data, event_id):
+    return (f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+            ).encode('utf8')
+
+
+def iter_change_events(cursor, duration=MAX_STREAM_DURATION):
+    """Yield the server-sent events of the changes published after
+    ``cursor``, waiting for new changes for up to ``duration`` seconds. A
+    ``reset`` event means that changes may have been missed, so the client
+    must re-fetch the resources that it tracks.
+    """
+    yield f'retry: {RECONNECT_DELAY}\n\n'.encode('utf8')
+    if cursor is None:
+        cursor = changes_mod.get_head_cursor()
+        yield format_event('open', {}, cursor)
+    deadline = time.monotonic() + duration
+    while True:
+        changes, error = changes_mod.get_changes(cursor)
+        if error:
+            cursor = changes_mod.get_head_cursor()
+            yield format_event('reset', {'error': error}, cursor)
+            changes = []
+        for change in changes:
+            cursor = change.cursor
+            yield format_event('change', {'resource': change.resource,
+                                          'action': change.action,
+                                          'data': change.data}, cursor)
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return
+        if not changes_mod.wait_for_changes(
+                cursor, min(timeout, KEEPALIVE_INTERVAL)):
+            yield b': keep-alive\n\n'
+
+
+def changes(request):
+    """Stream the changes made to the resources of this server as server-sent
+    events, resuming after the cursor in the ``Last-Event-ID`` header or the
+    ``cursor`` query parameter, if either is supplied.
+    """
+    if request.method != 'GET':
+        request.response.status = 405
+        return {'error': 'The /changes endpoint only recognizes GET requests.'}
+    cursor = (request.headers.get('Last-Event-ID') or
+              request.params.get('cursor'))
+    response = request.response
+    response.content_type = EVENT_STREAM_CONTENT_TYPE
+    response.cache_control = 'no-cache'
+    response.app_iter = iter_change_events(cursor)
+    return response
+
+
 def get_ip_port():
     args = sys.argv
     ip = '127.0.0.1'
@@ -490,6 +804,7 @@ def get_ip_port():
 def main(ip, port):
     config = Configurator()
     config.include('cors')
+    config.include('compression')
     config.add_cors_preflight_handler()
 
     config.add_route('old-service', '/old_service')
@@ -527,6 +842,11 @@ def main(ip, port):
                     route_name='sync_old_commands',
                     renderer='json')
 
+    config.add_route('aol', '/')
+    config.add_view(aol,
+                    route_name='aol',
+                    renderer='json')
+
     app = config.make_wsgi_app()
     logger.info(f'Serving at http://{ip}:{port}/')
     server = make_server(ip, port, app)
@@ -9,6 +9,7 @@ with open(os.path.join(here, 'CHANGES.txt')) as f:
     CHANGES = f.read()
 
 requires = [
+    'dativetop-append-only-log-domain-model',
     'pyramid',
     'pyramid_chameleon',
     'pyramid_debugtoolbar',
@@ -44,6 +45,7 @@ setup(
     zip_safe=False,
     extras_require={
         'testing': tests_require,
+        'zstd': ['zstandard'],
     },
     install_requires=requires,
     entry_points={
@@ -0,0 +1,60 @@
+"""Change Feed Tests
+"""
+
+import transaction
+
+import dativetopserver.changes as sut
+import dativetopserver.views as views
+
+
+def test_changes_are_published_on_commit():
+    """Test that recorded changes are only published once their transaction
+    commits, and that they can be listed after a cursor.
+    """
+    cursor = sut.get_head_cursor()
+    sut.record_change('old', 'create', {'id': 'a'})
+    assert sut.get_changes(cursor) == ([], None)
+    assert not sut.wait_for_changes(cursor, 0.01)
+    transaction.commit()
+    assert sut.wait_for_changes(cursor, 0.01)
+    changes, err = sut.get_changes(cursor)
+    assert err is None
+    assert [(c.resource, c.action, c.data) for c in changes] == [
+        ('old', 'create', {'id': 'a'})]
+    assert sut.get_changes(changes[-1].cursor) == ([], None)
+    sut.record_change('old', 'delete', {'id': 'a'})
+    transaction.abort()
+    assert sut.get_changes(changes[-1].cursor) == ([], None)
+
+
+def test_unknown_and_expired_cursors():
+    """Test that cursors of other processes and cursors that have fallen out
+    of the buffer are rejected.
+    """
+    assert sut.get_changes('abc-1') == (None, 'Unknown cursor')
+    assert sut.get_changes(None) == (None, 'Unknown cursor')
+    cursor = sut.get_head_cursor()
+    for index in range(sut.BUFFER_SIZE + 1):
+        sut.record_change('old', 'update', {'id': index})
+    transaction.commit()
+    assert sut.get_changes(cursor) == (None, 'Cursor has expired')
+
+
+def test_iter_change_events():
+    """Test that the event stream opens with the current cursor, emits the
+    changes after the requested cursor, and resets on unknown cursors.
+    """
+    cursor = sut.get_head_cursor()
+    sut.record_change('dative_app', 'update', {'url': 'http://x'})
+    transaction.commit()
+    events = list(views.iter_change_events(cursor, duration=0))
+    assert events[1] == views.format_event(
+        'change',
+        {'resource': 'dative_app', 'action': 'update',
+         'data': {'url': 'http://x'}},
+        sut.get_head_cursor())
+    events = list(views.iter_change_events(None, duration=0))
+    assert events[1] == views.format_event('open', {}, sut.get_head_cursor())
+    events = list(views.iter_change_events('abc-1', duration=0))
+    assert events[1].startswith(b'id: ' + sut.get_head_cursor().encode())
+    assert b'event: reset' in events[1]
@@ -0,0 +1,112 @@
+"""Compression Tests
+"""
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import dtaoldm.aol as aol_mod
+import pytest
+from webtest import TestApp
+
+import dativetopserver.compression as sut
+
+
+def test_negotiate_encoding():
+    """Test that the most preferred supported encoding that the client accepts
+    is chosen, honouring ``q=0``.
+    """
+    assert sut.negotiate_encoding('gzip, deflate') == sut.GZIP_ENCODING
+    assert sut.negotiate_encoding('deflate, gzip;q=0') is None
+    assert sut.negotiate_encoding('') is None
+    assert sut.negotiate_encoding(None) is None
+    assert sut.negotiate_encoding('*') == sut.get_supported_encodings()[0]
+    assert sut.negotiate_encoding('zstd, gzip') == (
+        sut.get_supported_encodings()[0])
+
+
+def test_compression_round_trip():
+    """Test that compressed chunks decompress to the original body, and that
+    the decompressing request body file can be read line by line.
+    """
+    lines = [f'["line",{i}]\n'.encode('utf8') for i in range(1000)]
+    for encoding in sut.get_supported_encodings():
+        compressed = b''.join(sut.compress_iter(iter(lines), encoding))
+        assert len(compressed) < len(b''.join(lines)) / 5
+        decompressed = sut.get_decompressing_file(
+            io.BytesIO(compressed), encoding)
+        assert list(decompressed) == lines
+    gzipped = b''.join(sut.compress_iter(iter(lines), sut.GZIP_ENCODING))
+    assert gzip.decompress(gzipped) == b''.join(lines)
+    assert sut.get_decompressing_file(io.BytesIO(b''), 'br') is None
+
+
+@pytest.fixture
+def app():
+    """Yield a test app of the DativeTop Server with an empty database and
+    AOL.
+    """
+    from dativetopserver import main
+    from dativetopserver.models import DBSession
+    import dativetopserver.views as v
+    aol_path = os.path.join(tempfile.mkdtemp(), 'aol.txt')
+    try:
+        yield TestApp(main({}, **{'sqlalchemy.url': 'sqlite://',
+                                  'aol.path': aol_path}))
+    finally:
+        writer = v.aol_writers.pop(aol_path, None)
+        if writer is not None:
+            writer.close()
+        DBSession.remove()
+        shutil.rmtree(os.path.dirname(aol_path))
+
+
+def compress(body, encoding):
+    return b''.join(sut.compress_iter(iter([body]), encoding))
+
+
+def test_compressed_request_bodies(app):
+    """Test that compressed JSON and newline-delimited JSON AOLs pushed to the
+    app are decompressed and appended.
+    """
+    aol = []
+    for encoding in sut.get_supported_encodings():
+        aol_mod.append_to_aol(aol, aol_mod.fiat_entity())
+        response = app.put(
+            '/', compress(aol_mod.aol_to_json(aol).encode('utf8'), encoding),
+            headers={'Content-Type': 'application/json',
+                     'Content-Encoding': encoding})
+        assert response.json == {
+            'base_hash': aol_mod.get_tip_hash(aol), 'appendables': []}
+        aol_mod.append_to_aol(aol, aol_mod.fiat_entity())
+        body = ''.join(aol_mod.serialize_appendable(appendable) for
+                       appendable in aol).encode('utf8')
+        response = app.put(
+            '/', compress(body, encoding),
+            headers={'Content-Type': 'application/x-ndjson',
+                     'Content-Encoding': encoding})
+        assert response.json == {
+            'base_hash': aol_mod.get_tip_hash(aol), 'appendables': []}
+    assert aol_mod.get_hashes(aol) == [
+        appendable[2] for appendable in app.get('/').json]
+
+
+def test_malformed_compressed_request_bodies(app):
+    """Test that a request body that cannot be decompressed gets a 400
+    response.
+    """
+    aol = aol_mod.append_to_aol([], aol_mod.fiat_entity())
+    body = aol_mod.aol_to_json(aol).encode('utf8')
+    for encoding in sut.get_supported_encodings():
+        for content_type in ('application/json', 'application/x-ndjson'):
+            for bad_body in (b'not compressed',
+                             compress(body, encoding)[:-10]):
+                response = app.put(
+                    '/', bad_body, status=400,
+                    headers={'Content-Type': content_type,
+                             'Content-Encoding': encoding})
+                assert response.json == {'error': sut.BAD_BODY_ERR}
+    assert app.get('/').json == []
@@ -22,10 +22,12 @@ def _initTestingDB():
 
 class ModelsTests(unittest.TestCase):
     def setUp(self):
+        transaction.abort()
         self.session = _initTestingDB()
         self.config = testing.setUp()
 
     def tearDown(self):
+        transaction.abort()
         self.session.remove()
         testing.tearDown()
 
@@ -229,3 +231,124 @@ class ModelsTests(unittest.TestCase):
             m.get_sync_old_command(cmd.history_id)
         except Exception as e:
             self.assertIsInstance(e, NoResultFound)
+
+    def test_create_indexes(self):
+        import dativetopserver.models as m
+        from sqlalchemy import create_engine, inspect
+        engine = create_engine('sqlite://')
+        m.Base.metadata.create_all(engine)
+        index_name = 'ix_syncoldcommand_acked_end_start'
+        # Simulate a database created before the composite indexes existed.
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'DROP INDEX {index_name}')
+        self.assertNotIn(index_name, [
+            index['name'] for index in
+            inspect(engine).get_indexes('syncoldcommand')])
+        m.create_indexes(engine)
+        m.create_indexes(engine)  # idempotent
+        indexes = {index['name']: index['column_names'] for index in
+                   inspect(engine).get_indexes('syncoldcommand')}
+        self.assertEqual(['acked', 'end', 'start'], indexes[index_name])
+        self.assertEqual(['history_id', 'end'],
+                         indexes['ix_syncoldcommand_history_id_end'])
+        self.assertEqual(['acked', 'leased_until'],
+                         indexes['ix_syncoldcommand_acked_leased_until'])
+
+    def test_archive_closed_rows(self):
+        import datetime
+        import dativetopserver.models as m
+        engine = self.session.get_bind()
+        m.configure_archive(engine)
+        old = m.create_old('oka')
+        history_id = old.history_id
+        syncing_old = m.transition_old(old, m.old_state.syncing)
+        m.transition_old(syncing_old, m.old_state.synced)
+        transaction.commit()
+
+        # Nothing was closed long enough ago to be archived
+        counts = m.archive_closed_rows(engine, datetime.timedelta(days=1))
+        self.assertEqual(0, sum(counts.values()))
+        self.assertEqual(3, self.session.query(m.OLD).count())
+
+        counts = m.archive_closed_rows(
+            engine, datetime.timedelta(0), batch_size=1)
+        self.assertEqual(2, counts['old'])
+        self.assertEqual(1, self.session.query(m.OLD).count())
+        self.assertEqual(m.old_state.synced, m.get_old(history_id).state)
+
+        # The history spans the current and the archived rows
+        history = m.get_history(m.OLD, history_id)
+        self.assertEqual(
+            [m.old_state.not_synced, m.old_state.syncing,
+             m.old_state.synced],
+            [old.state for old in history])
+        self.assertEqual(
+            ['oka'] * 3,
+            [m.serialize_old_revision(old)['slug'] for old in history])
+
+    def test_pop_sync_old_commands(self):
+        import datetime
+        import dativetopserver.models as m
+        olds = [m.create_old(slug) for slug in ('one', 'two', 'three')]
+        commands = [m.enqueue_sync_old_command(old.history_id)[0]
+                    for old in olds]
+
+        # Batch pops are FIFO and lease the popped commands
+        popped = m.pop_sync_old_commands(limit=2)
+        self.assertEqual([old.history_id for old in olds[:2]],
+                         [command.old_id for command in popped])
+        for command in popped:
+            self.assertTrue(command.acked)
+            self.assertGreater(command.leased_until, m.get_now())
+
+        # A command that was already claimed cannot be claimed again
+        self.assertIsNone(m.claim_sync_old_command(
+            commands[0], m.get_now(), m.DEFAULT_LEASE))
+        # ... even by a pop that started before the command was claimed
+        self.assertIsNone(m.claim_sync_old_command(
+            commands[1], popped[1].start - datetime.timedelta(seconds=1),
+            m.DEFAULT_LEASE))
+
+        # A command whose lease expired is popped again
+        expired = m.pop_sync_old_commands(
+            limit=5, lease=datetime.timedelta(0))
+        self.assertEqual([olds[2].history_id],
+                         [command.old_id for command in expired])
+        repopped = m.pop_sync_old_command()
+        self.assertEqual(olds[2].history_id, repopped.old_id)
+        self.assertEqual(expired[0].history_id, repopped.history_id)
+        self.assertEqual([], m.pop_sync_old_commands(limit=5))
+
+    def test_add_missing_columns(self):
+        import dativetopserver.models as m
+        from sqlalchemy import create_engine, inspect
+        engine = create_engine('sqlite://')
+        # Simulate a database created before the leased_until column existed.
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                'CREATE TABLE syncoldcommand ('
+                ' uuid VARCHAR(36) NOT NULL,'
+                ' history_id VARCHAR(36),'
+                ' old_id INTEGER,'
+                ' acked BOOLEAN,'
+                ' start DATETIME,'
+                ' "end" DATETIME,'
+                ' PRIMARY KEY (uuid))')
+        m.migrate_db(engine)
+        m.migrate_db(engine)  # idempotent
+        self.assertIn('leased_until', [
+            column['name'] for column in
+            inspect(engine).get_columns('syncoldcommand')])
+
+    def test_wait_for_sync_old_command(self):
+        import dativetopserver.models as m
+        old_id = m.create_old('one').history_id
+        transaction.commit()
+        enqueue_count = m.sync_old_command_enqueue_count
+        self.assertFalse(m.wait_for_sync_old_command(enqueue_count, 0.01))
+
+        # Waiters are only notified once the enqueueing transaction commits
+        m.enqueue_sync_old_command(old_id)
+        self.assertFalse(m.wait_for_sync_old_command(enqueue_count, 0.01))
+        transaction.commit()
+        self.assertTrue(m.wait_for_sync_old_command(enqueue_count, 0.01))
@@ -1,3 +1,8 @@
+import io
+import json
+import os
+import shutil
+import tempfile
 import transaction
 import unittest
 from uuid import uuid4
@@ -12,6 +17,17 @@ def is_uuid_str(x):
                                  for y in x.split('-')])
 
 
+def generate_mergee():
+    """Return an AOL that creates two entities with slugs."""
+    import dtaoldm.aol as aol_mod
+    mergee = []
+    for slug in ('oka', 'bla'):
+        aol_mod.append_to_aol(mergee, aol_mod.fiat_entity())
+        aol_mod.append_to_aol(mergee, aol_mod.fiat_attribute(
+            mergee[-1].quad.entity, 'has-slug', slug))
+    return mergee
+
+
 def _initTestingDB():
     from sqlalchemy import create_engine
     from dativetopserver.models import (Base, DBSession)
@@ -24,10 +40,12 @@ def _initTestingDB():
 class ViewsTests(unittest.TestCase):
 
     def setUp(self):
+        transaction.abort()
         self.session = _initTestingDB()
         self.config = testing.setUp()
 
     def tearDown(self):
+        transaction.abort()
         self.session.remove()
         testing.tearDown()
 
@@ -365,3 +383,143 @@ class ViewsTests(unittest.TestCase):
         # Now the queue is empty
         response = v.sync_old_commands(testing.DummyRequest(method='PUT'))
         self.assertEqual('No commands in the queue', response['error'])
+
+    def set_up_aol(self):
+        """Configure an empty AOL in a temporary directory for the AOL views
+        and return its path.
+        """
+        import dativetopserver.views as v
+        aol_path = os.path.join(tempfile.mkdtemp(), 'aol.txt')
+        self.config.registry.settings['aol.path'] = aol_path
+
+        def close_writer():
+            writer = v.aol_writers.pop(aol_path, None)
+            if writer is not None:
+                writer.close()
+
+        self.addCleanup(shutil.rmtree, os.path.dirname(aol_path))
+        self.addCleanup(close_writer)
+        return aol_path
+
+    def push_aol(self, aol):
+        import dtaoldm.aol as aol_mod
+        import dativetopserver.views as v
+        return v.aol(testing.DummyRequest(
+            method='PUT', json_body=json.loads(aol_mod.aol_to_json(aol))))
+
+    def get_aol_hashes(self):
+        import dtaoldm.aol as aol_mod
+        import dativetopserver.views as v
+        return aol_mod.get_hashes(v.aol(testing.DummyRequest(method='GET')))
+
+    def test_aol_append(self):
+        import dtaoldm.aol as aol_mod
+        import dativetopserver.views as v
+        aol_path = self.set_up_aol()
+
+        # The AOL is initially empty
+        response = v.aol(testing.DummyRequest(method='GET'))
+        self.assertEqual([], response)
+
+        # Push an AOL to the server, which appends it with its writer
+        mergee = generate_mergee()
+        response = self.push_aol(mergee)
+        self.assertEqual(
+            {'base_hash': aol_mod.get_tip_hash(mergee), 'appendables': []},
+            response)
+        self.assertEqual(aol_mod.get_hashes(mergee), self.get_aol_hashes())
+        self.assertEqual(aol_mod.get_tip_hash(mergee),
+                         v.aol_writers[aol_path].tip_hash)
+
+        # Pushing the same AOL again is a no-op
+        self.push_aol(mergee)
+        self.assertEqual(aol_mod.get_hashes(mergee), self.get_aol_hashes())
+
+        # Pushing something that is not an AOL fails
+        response = v.aol(testing.DummyRequest(
+            method='PUT', json_body=[['a', 'b']]))
+        self.assertEqual('Request body is not a valid AOL', response['error'])
+
+    def test_aol_patch(self):
+        import dtaoldm.aol as aol_mod
+        self.set_up_aol()
+
+        # A diverged sender receives the patch that makes its AOL identical
+        # to the server's
+        mergee = generate_mergee()
+        server_aol = list(mergee)
+        aol_mod.append_to_aol(server_aol, aol_mod.fiat_attribute(
+            mergee[0].quad.entity, 'has-name', 'Okanagan'))
+        self.push_aol(server_aol)
+        diverged = list(mergee)
+        aol_mod.append_to_aol(diverged, aol_mod.fiat_attribute(
+            mergee[2].quad.entity, 'has-name', 'Blackfoot'))
+        response = self.push_aol(diverged)
+        patch = aol_mod.dict_to_patch(json.loads(json.dumps(response)))
+        self.assertEqual(aol_mod.get_tip_hash(mergee), patch.base_hash)
+        self.assertEqual(2, len(patch.appendables))
+        patched, err = aol_mod.apply_patch(diverged, patch)
+        self.assertIsNone(err)
+        self.assertEqual(aol_mod.get_hashes(patched), self.get_aol_hashes())
+
+    def test_aol_paging(self):
+        import dtaoldm.aol as aol_mod
+        import dativetopserver.views as v
+        self.set_up_aol()
+        mergee = generate_mergee()
+        self.push_aol(mergee)
+
+        # Fetch only the appendables after a hash or from a position, as
+        # newline-delimited JSON
+        def get_lines(**params):
+            response = v.aol(testing.DummyRequest(
+                method='GET', params=params))
+            self.assertEqual(v.NDJSON_CONTENT_TYPE, response.content_type)
+            return [aol_mod.parse_appendable(line) for line in
+                    b''.join(response.app_iter).decode('utf8').splitlines()]
+        self.assertEqual(
+            aol_mod.get_hashes(mergee[2:]),
+            aol_mod.get_hashes(get_lines(since=mergee[1].integrated_hash)))
+        self.assertEqual(
+            aol_mod.get_hashes(mergee[3:]),
+            aol_mod.get_hashes(get_lines(offset='3')))
+        self.assertEqual([], get_lines(since=mergee[-1].integrated_hash))
+        response = v.aol(testing.DummyRequest(
+            method='GET', params={'since': 'nonsense'}))
+        self.assertEqual('No appendable with the supplied hash',
+                         response['error'])
+        response = v.aol(testing.DummyRequest(
+            method='GET', params={'offset': '-1'}))
+        self.assertEqual('Offset must be a non-negative integer',
+                         response['error'])
+
+    def test_aol_ndjson_push(self):
+        import dtaoldm.aol as aol_mod
+        import dativetopserver.views as v
+        self.set_up_aol()
+        mergee = generate_mergee()
+        self.push_aol(mergee)
+
+        # Push an AOL as newline-delimited JSON
+        streamed = list(mergee)
+        aol_mod.append_to_aol(streamed, aol_mod.fiat_attribute(
+            mergee[0].quad.entity, 'has-leader', 'http://127.0.0.1:5679'))
+        body = ''.join(aol_mod.serialize_appendable(appendable) for
+                       appendable in streamed).encode('utf8')
+        response = v.aol(testing.DummyRequest(
+            method='PUT',
+            headers={'Content-Type': v.NDJSON_CONTENT_TYPE},
+            body_file=io.BytesIO(body)))
+        self.assertEqual(
+            {'base_hash': aol_mod.get_tip_hash(streamed), 'appendables': []},
+            response)
+        self.assertEqual(aol_mod.get_hashes(streamed), self.get_aol_hashes())
+
+        # A bad line is reported by its line number
+        response = v.aol(testing.DummyRequest(
+            method='PUT',
+            headers={'Content-Type': v.NDJSON_CONTENT_TYPE},
+            body_file=io.BytesIO(body + b'["a","b"]\n')))
+        self.assertEqual(
+            f'Line {len(streamed) + 1} of the request body is not a valid'
+            f' appendable', response['error'])
@@ -3,14 +3,15 @@ executing sync-OLD! commands.
 
 The SyncWorker performs these steps in a loop:
 
-1. Using DTServer, pop the next sync-OLD! command off of the queue.
+1. Using DTServer, pop the next sync-OLD! command off of the queue, waiting
+   for one to be enqueued if the queue is empty.
 2. Determine whether the OLD already exists and create it if it does not.
 3. Fetch the last modified values for each resource in the local OLD.
 4. Fetch the last modified values for each resource in the remote OLD.
 5. Compute a diff in order to determine required updates, deletes and adds.
 6. Fetch the remote resources that have been updated or added.
 7. Mutate the local OLD's SQLite db so that it matches the remote leader.
-8. Sleep for a time and then return to (1).
+8. Return to (1).
 """
 
 import datetime
@@ -36,6 +37,11 @@ logger = logging.getLogger(__name__)
 DEFAULT_LOCAL_OLD_USERNAME = 'admin'
 DEFAULT_LOCAL_OLD_PASSWORD = 'adminA_1'
 
+# How long a pop waits for a command to be enqueued if the queue is empty, and
+# how long to wait before popping again after a failed pop, in seconds.
+POP_WAIT = 30
+POP_RETRY_WAIT = 5
+
 
 def parse_datetime_string(datetime_string):
     return datetime.datetime.strptime(datetime_string, '%Y-%m-%dT%H:%M:%S.%f')
@@ -74,9 +80,15 @@ def prepare_row_for_upsert(table_name, row):
     return row
 
 
-def pop_sync_old_command(dtserver):
+def pop_sync_old_command(dtserver, wait=POP_WAIT):
+    """Pop the next sync-OLD! command, waiting up to ``wait`` seconds for one
+    to be enqueued. Return ``None`` if there is none. If the pop fails, wait
+    ``POP_RETRY_WAIT`` seconds before returning ``None``.
+    """
     try:
-        response = requests.put(f'{dtserver.url}sync_old_commands')
+        response = requests.put(f'{dtserver.url}sync_old_commands',
+                                params={'wait': wait},
+                                timeout=wait + POP_RETRY_WAIT)
         if response.status_code == 404:
             logger.debug('No sync-OLD! messages currently on the queue')
             return None
@@ -85,11 +97,11 @@ def pop_sync_old_command(dtserver):
         logger.error(
             'Received an unexpected response code %s when attempting to pop'
             ' the next sync-OLD! command.', response.status_code)
-        return None
     except Exception:
         msg = 'Failed to pop the next sync-OLD! command from DTServer'
         logger.exception(msg)
-        return None
+    time.sleep(POP_RETRY_WAIT)
+    return None
 
 
 def complete_sync_old_command(dtserver, command):
@@ -403,7 +415,6 @@ def sync_worker(dtserver, old_service, comm):
                 complete_sync_old_command(dtserver, command)
             if comm.get('exit?'):
                 break
-            time.sleep(5)
 
 
 def start_sync_worker(dtserver, old_service):
@@ -17,8 +17,10 @@ A "quad" is an EAVT 4-tuple of strings consisting of:
 
 from collections import namedtuple
 from datetime import datetime
+import functools
 import hashlib
 import json
+import multiprocessing
 import os
 import pprint
 
@@ -36,7 +38,7 @@ Quad = namedtuple(
 Appendable = namedtuple(
     'Appendable', (
         'quad',  # a 4-tuple
-        'hash',  # MD5 hash of JSON-serialized quad
+        'hash',  # digest (MD5 by default) of JSON-serialized quad
         'integrated_hash',  # hash of JSON.SERIALIZE(
                             # (<PREV_APPENDABLE_INTEGRATED_HASH>, <HASH>))
     ))
@@ -50,8 +52,11 @@ def get_now_str():
     return get_now().isoformat()
 
 
+JSON_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
 def get_json(data):
-    return json.dumps(data, separators=(',', ':'))
+    return JSON_ENCODER.encode(data)
 
 
 def parse_json(string):
@@ -62,12 +67,26 @@ def serialize_quad(quad):
     return get_json(quad)
 
 
-def get_hash(string):
-    return hashlib.md5(string.encode('utf8')).hexdigest()
+# The digest algorithms that may be used to compute the hashes and integrated
+# hashes of an AOL. Logs that use a digest other than ``DEFAULT_DIGEST`` record
+# it in their header (see ``get_aol_header``).
+MD5_DIGEST = 'md5'
+BLAKE2B_DIGEST = 'blake2b'
+DEFAULT_DIGEST = MD5_DIGEST
+
+DIGESTS = {
+    MD5_DIGEST: hashlib.md5,
+    # 16-byte digests keep BLAKE2b hashes the same length as MD5 hashes.
+    BLAKE2B_DIGEST: functools.partial(hashlib.blake2b, digest_size=16),
+}
+
 
+def get_hash(string, digest=DEFAULT_DIGEST):
+    return DIGESTS[digest](string.encode('utf8')).hexdigest()
 
-def get_hash_of_quad(quad):
-    return get_hash(serialize_quad(quad))
+
+def get_hash_of_quad(quad, digest=DEFAULT_DIGEST):
+    return get_hash(serialize_quad(quad), digest=digest)
 
 
 HAS_ATTR = 'has'
@@ -153,124 +172,570 @@ def serialize_appendable(appendable):
     return get_json(appendable) + '\n'
 
 
-def write_aol_to_file(aol, file_path):
+def serialize_header(header):
+    return get_json(header) + '\n'
+
+
+def is_header_line(line):
+    """Return ``True`` if ``line`` of a persisted AOL is its header line, i.e., a
+    JSON object, as opposed to an appendable, i.e., a JSON array.
+    """
+    return line.startswith('{')
+
+
+def get_aol_header(file_path):
+    """Return the header of the AOL file at ``file_path`` as a dict.
+
+    The header is an optional first line holding a JSON object. It is only
+    written for logs that use a non-default digest, e.g.,
+    ``{"digest":"blake2b"}``, so AOL files written before headers existed, and
+    MD5 logs generally, have none, in which case an empty dict is returned.
+    """
+    if not os.path.isfile(file_path):
+        return {}
+    with open(file_path, 'r') as fh:
+        first_line = fh.readline()
+    if is_header_line(first_line):
+        return parse_json(first_line)
+    return {}
+
+
+def get_digest_in_file(file_path):
+    """Return the name of the digest used by the AOL file at ``file_path``."""
+    return get_aol_header(file_path).get('digest', DEFAULT_DIGEST)
+
+
+def parse_appendable(line):
+    """Parse a line of a persisted AOL, as written by
+    ``serialize_appendable``, to an ``Appendable``.
+    """
+    return Appendable(*parse_json(line))
+
+
+def write_appendables(fh, appendables, offset):
+    """Write ``appendables`` to the open file ``fh``, whose current size is
+    ``offset`` bytes. Return a list of 2-tuples pairing the integrated hash of
+    each written appendable with the byte offset of its line.
+    """
+    entries = []
+    for appendable in appendables:
+        line = serialize_appendable(appendable)
+        fh.write(line)
+        entries.append((appendable.integrated_hash, offset))
+        offset += len(line.encode('utf8'))
+    return entries
+
+
+def write_aol_to_file(aol, file_path, digest=DEFAULT_DIGEST):
     """Write the entire append-only log ``aol`` to disk at path ``file_path``.
+    If ``digest`` is not the default digest, it is recorded in a header line.
     """
     with open(file_path, 'w') as fh:
-        for appendable in aol:
-            fh.write(serialize_appendable(appendable))
+        offset = 0
+        if digest != DEFAULT_DIGEST:
+            header = serialize_header({'digest': digest})
+            fh.write(header)
+            offset = len(header.encode('utf8'))
+        entries = write_appendables(fh, aol, offset)
+    if os.path.exists(get_hash_index_path(file_path)):
+        write_hash_index_file(entries, file_path)
+
+
+TAIL_BLOCK_SIZE = 4096
+
+
+def get_last_line_in_file(file_path):
+    """Return the last non-empty line of the file at path ``file_path``, or
+    ``None`` if the file has no such line.
+
+    The file is read backwards from its end in blocks of ``TAIL_BLOCK_SIZE``
+    bytes, so the cost is independent of the size of the file.
+    """
+    with open(file_path, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        position = fh.tell()
+        tail = b''
+        while position > 0:
+            block_size = min(TAIL_BLOCK_SIZE, position)
+            position -= block_size
+            fh.seek(position)
+            tail = fh.read(block_size) + tail
+            stripped = tail.rstrip(b'\n')
+            newline_index = stripped.rfind(b'\n')
+            if newline_index != -1:
+                return stripped[newline_index + 1:].decode('utf8')
+        tail = tail.rstrip(b'\n')
+        if tail:
+            return tail.decode('utf8')
+        return None
 
 
 def get_tip_hash_in_file(file_path):
     """Get the integrated hash of the last line (= EAVT quad) in the
-    append-only log at path ``file_path``.
-    Note: this is inefficient on large files. Consider doing something similar
-    to: https://stackoverflow.com/questions/136168/get-last-n-lines-of-a-file-with-python-similar-to-tail
+    append-only log at path ``file_path``. Only the end of the file is read.
     """
-    with open(file_path, 'r') as fh:
-        try:
-            return Appendable(
-                *parse_json(fh.readlines()[-1])).integrated_hash
-        except IndexError:
-            return None
+    last_line = get_last_line_in_file(file_path)
+    if last_line is None or is_header_line(last_line):
+        return None
+    return parse_appendable(last_line).integrated_hash
 
 
-def get_new_appendables(aol, tip_hash):
+# ==============================================================================
+# Hash Index
+# ==============================================================================
+#
+# A hash index maps the integrated hash of each appendable in an AOL to its
+# position in that AOL. In memory, it is a dict. On disk, it is a sidecar file
+# next to the AOL file (at ``<AOL_PATH>.idx``) where line N holds the integrated
+# hash of the Nth appendable and the byte offset of that appendable's line in
+# the AOL file, separated by a space.
+
+HASH_INDEX_SUFFIX = '.idx'
+
+
+def get_hash_index(aol):
+    """Return a dict from the integrated hashes of the appendables in ``aol`` to
+    their positions in ``aol``. AOLs that maintain their own hash index (e.g.,
+    ``dtaoldm.lazy.LazyAOL``) expose it as a ``hash_index`` attribute, which is
+    returned as is.
+    """
+    hash_index = getattr(aol, 'hash_index', None)
+    if hash_index is not None:
+        return hash_index
+    return {appendable.integrated_hash: position for
+            position, appendable in enumerate(aol)}
+
+
+def get_hash_index_path(file_path):
+    return f'{file_path}{HASH_INDEX_SUFFIX}'
+
+
+def serialize_hash_index_entry(integrated_hash, offset):
+    return f'{integrated_hash} {offset}\n'
+
+
+def write_hash_index_file(entries, file_path):
+    """Atomically (re-)write the hash index sidecar file of the AOL at
+    ``file_path`` so that it contains exactly ``entries``, a sequence of
+    (integrated hash, byte offset) 2-tuples.
+    """
+    index_path = get_hash_index_path(file_path)
+    tmp_path = f'{index_path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        for entry in entries:
+            fh.write(serialize_hash_index_entry(*entry))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, index_path)
+
+
+def append_to_hash_index_file(entries, file_path):
+    """Append ``entries`` to the hash index sidecar file of the AOL at
+    ``file_path`` and fsync it. The caller must make sure that the index is
+    consistent with the AOL before the appendables of ``entries`` were written
+    (see ``ensure_hash_index_file_consistent``).
+    """
+    with open(get_hash_index_path(file_path), 'a') as fh:
+        for entry in entries:
+            fh.write(serialize_hash_index_entry(*entry))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def build_hash_index_file(file_path):
+    """Build the hash index sidecar file of the AOL at ``file_path`` by
+    scanning the AOL once.
+    """
+    entries = []
+    offset = 0
+    with open(file_path, 'rb') as fh:
+        for line in fh:
+            line_str = line.decode('utf8')
+            if line.strip() and not is_header_line(line_str):
+                entries.append(
+                    (parse_appendable(line_str).integrated_hash, offset))
+            offset += len(line)
+    write_hash_index_file(entries, file_path)
+
+
+def is_hash_index_file_current(file_path):
+    """Return ``True`` if the hash index sidecar file of the AOL at
+    ``file_path`` exists and ends with the tip of the AOL. Only the ends of the
+    two files are read.
+    """
+    index_path = get_hash_index_path(file_path)
+    if not os.path.isfile(index_path):
+        return False
+    last_entry = get_last_line_in_file(index_path)
+    indexed_tip_hash = last_entry.split(' ')[0] if last_entry else None
+    return indexed_tip_hash == get_tip_hash_in_file(file_path)
+
+
+def is_hash_index_file_consistent(file_path):
+    """Return ``True`` if the hash index sidecar file of the AOL at
+    ``file_path`` is current (see ``is_hash_index_file_current``) and its last
+    entry gives the offset of the last line of the AOL, i.e., that offset plus
+    the length of that line is the size of the AOL file. Only the ends of the
+    two files are read, so this does not detect an index that lost entries
+    before its last one; but entries are only ever appended to an index after
+    this check, so an index can only lose its tail, e.g., in a crash.
+    """
+    if not is_hash_index_file_current(file_path):
+        return False
+    last_entry = get_last_line_in_file(get_hash_index_path(file_path))
+    if last_entry is None:
+        return True
+    integrated_hash, offset = last_entry.split(' ')
+    offset = int(offset)
+    with open(file_path, 'rb') as fh:
+        fh.seek(offset)
+        line = fh.readline()
+    try:
+        appendable = parse_appendable(line.decode('utf8'))
+    except (TypeError, ValueError):
+        return False
+    return (appendable.integrated_hash == integrated_hash and
+            offset + len(line) == os.path.getsize(file_path))
+
+
+def ensure_hash_index_file_consistent(file_path):
+    """Rebuild the hash index sidecar file of the AOL at ``file_path`` if it
+    exists but is not consistent with the AOL (see
+    ``is_hash_index_file_consistent``).
+    """
+    if (os.path.exists(get_hash_index_path(file_path)) and
+            not is_hash_index_file_consistent(file_path)):
+        build_hash_index_file(file_path)
+
+
+def read_hash_index_file(file_path):
+    """Return the hash index of the AOL at ``file_path`` as a 2-tuple: a dict
+    from integrated hashes to positions, and a list of the byte offsets of the
+    lines of the AOL file, by position. The sidecar index file is (re-)built
+    first if it is missing or inconsistent with the AOL.
+    """
+    if not is_hash_index_file_consistent(file_path):
+        build_hash_index_file(file_path)
+    positions = {}
+    offsets = []
+    with open(get_hash_index_path(file_path), 'r') as fh:
+        for position, line in enumerate(fh):
+            integrated_hash, offset = line.split(' ')
+            positions[integrated_hash] = position
+            offsets.append(int(offset))
+    return positions, offsets
+
+
+def get_hash_index_in_file(file_path):
+    """Return a dict from the integrated hashes of the appendables in the AOL at
+    ``file_path`` to their positions in that AOL, using the sidecar index file.
+    """
+    return read_hash_index_file(file_path)[0]
+
+
+def get_new_appendables(aol, tip_hash, hash_index=None):
     """Return all appendables in ``aol`` that come after the appendable with
     integrated hash ``tip_hash``.
+
+    If a ``hash_index`` of ``aol`` (see ``get_hash_index``) is supplied, the
+    position of ``tip_hash`` is looked up in it. Otherwise, ``aol`` is scanned
+    backwards from its end, since ``tip_hash`` is usually near the end.
     """
     if tip_hash is None:
         return aol
     offset = 0
-    for i, appendable in enumerate(aol):
-        if appendable.integrated_hash == tip_hash:
-            offset = i + 1
-            break
+    if hash_index is not None:
+        position = hash_index.get(tip_hash)
+        if position is not None:
+            offset = position + 1
+    else:
+        for position in range(len(aol) - 1, -1, -1):
+            if aol[position].integrated_hash == tip_hash:
+                offset = position + 1
+                break
     return aol[offset:]
 
 
 def append_aol_to_file(aol, file_path):
     """Write all of the new appendables in the append-only log ``aol`` to the
     file at path ``file_path``.
+
+    If the AOL file has a hash index sidecar file, it is kept up to date. It is
+    rebuilt first if it is not consistent with the AOL file, since appending
+    to an index that lacks entries would make it look current.
     """
+    ensure_hash_index_file_consistent(file_path)
+    offset = os.path.getsize(file_path)
     with open(file_path, 'a') as fh:
-        for appendable in get_new_appendables(
-                aol, get_tip_hash_in_file(file_path)):
-            fh.write(serialize_appendable(appendable))
+        entries = write_appendables(
+            fh,
+            get_new_appendables(aol, get_tip_hash_in_file(file_path)),
+            offset)
+    if entries and os.path.exists(get_hash_index_path(file_path)):
+        append_to_hash_index_file(entries, file_path)
 
 
-def persist_aol(aol, file_path):
-    """Write the append-only log ``aol`` to disk at path ``file_path``."""
+def persist_aol(aol, file_path, digest=DEFAULT_DIGEST):
+    """Write the append-only log ``aol`` to disk at path ``file_path``. The
+    ``digest`` is only recorded if the file does not exist yet.
+    """
     if os.path.exists(file_path):
         append_aol_to_file(aol, file_path)
     else:
-        write_aol_to_file(aol, file_path)
+        write_aol_to_file(aol, file_path, digest=digest)
+
+
+def make_appendable(quad, top_integrated_hash, digest=DEFAULT_DIGEST):
+    """Return the Appendable for EAVT quad ``quad`` when it is appended to an
+    AOL whose tip has integrated hash ``top_integrated_hash``.
+    """
+    hash_of_quad = get_hash_of_quad(quad, digest=digest)
+    integrated_hash_of_quad = get_hash(
+        get_json((top_integrated_hash, hash_of_quad)), digest=digest)
+    return Appendable(*(quad, hash_of_quad, integrated_hash_of_quad))
 
 
-def append_to_aol(aol, quad):
+def append_to_aol(aol, quad, digest=DEFAULT_DIGEST):
     """Append EAVT quad ``quad`` to the append-only log ``aol``.
 
     The AOL consists of Appendable instances, 3-tuples, 1) the EAVT quad, 2)
     the hash of that quad, and 3) the integrated hash of that quad.
     """
-    hash_of_quad = get_hash_of_quad(quad)
-    top_integrated_hash = get_tip_hash(aol)
-    integrated_hash_of_quad = get_hash(
-        get_json((top_integrated_hash, hash_of_quad)))
-    appendable = Appendable(*(quad, hash_of_quad, integrated_hash_of_quad))
-    aol.append(appendable)
+    aol.append(make_appendable(quad, get_tip_hash(aol), digest=digest))
+    return aol
+
+
+def chain_quads(quads, top_integrated_hash, digest=DEFAULT_DIGEST):
+    """Yield the Appendable for each EAVT quad in ``quads`` as if they were
+    appended one by one to an AOL whose tip has integrated hash
+    ``top_integrated_hash``.
+
+    The result is identical to repeated calls to ``make_appendable``, but each
+    quad is serialized and hashed in a single tight pass: the JSON encoder and
+    the digest constructor are looked up once, and the integrated hash source
+    ``get_json((top_integrated_hash, hash_of_quad))`` is formatted directly,
+    which is safe because hex digests never need JSON escaping.
+    """
+    new_hash = DIGESTS[digest]
+    encode = JSON_ENCODER.encode
+    integrated_hash = top_integrated_hash
+    for quad in quads:
+        hash_of_quad = new_hash(encode(quad).encode('utf8')).hexdigest()
+        if integrated_hash is None:
+            source = '[null,"%s"]' % hash_of_quad
+        else:
+            source = '["%s","%s"]' % (integrated_hash, hash_of_quad)
+        integrated_hash = new_hash(source.encode('utf8')).hexdigest()
+        yield Appendable(quad, hash_of_quad, integrated_hash)
+
+
+def append_many(aol, quads, digest=DEFAULT_DIGEST):
+    """Append the EAVT quads ``quads`` to the append-only log ``aol``, in order.
+    This is the batch analogue of ``append_to_aol``; see ``chain_quads``.
+    """
+    aol.extend(chain_quads(quads, get_tip_hash(aol), digest=digest))
     return aol
 
 
-def get_aol(file_path):
+def get_aol(file_path, processes=None):
     """Read the append-only-log stored on disk at ``file_path`` to a list of
     Appendable instances.
+
+    If ``processes`` is greater than 1, the file is split into that many chunks
+    at line boundaries and the chunks are parsed in parallel by a pool of
+    processes.
     """
     if not os.path.isfile(file_path):
         persist_aol([], file_path)
+    if processes and processes > 1:
+        aol = []
+        for chunk_aol in map_file_chunks(
+                parse_file_chunk, file_path, processes):
+            aol.extend(chunk_aol)
+        return aol
     aol = []
     with open(file_path, 'r') as fh:
         for line in fh:
-            aol.append(Appendable(*parse_json(line)))
+            if not is_header_line(line):
+                aol.append(parse_appendable(line))
     return aol
 
 
-def aol_to_domain_entities(aol, domain_constructors):
-    """Given an append-only log ``aol``, return a dict from domain entity types
-    (pluralized strings, e.g., 'old-instances') to sets of domain entity
-    namedtuples (e.g., ``OLDInstance(slug='oka', ...)``.)
+# ==============================================================================
+# Parallel Reading
+# ==============================================================================
+
+def get_file_chunks(file_path, n_chunks):
+    """Split the file at ``file_path`` into at most ``n_chunks`` byte ranges of
+    roughly equal size whose boundaries fall on line boundaries. Return a list
+    of (start, end) 2-tuples, in file order.
     """
-    ret = {f'{k}s': set() for k in domain_constructors}
-    entities = {}
-    for appendable in aol:
-        quad = appendable.quad
-        e, a, v, _ = quad
-        entities.setdefault(e, {})
-        if (a, v) in BEING_PREDS:
-            if a == HAS_ATTR:
-                entities[e]['_extant'] = True
-            else:
-                entities[e]['_extant'] = False
-        elif a == IS_A_ATTR:
-            entities[e]['_type'] = v
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as fh:
+        for i in range(1, n_chunks):
+            fh.seek(max(size * i // n_chunks, boundaries[-1]))
+            fh.readline()
+            boundaries.append(min(fh.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if start < end]
+
+
+def iter_file_chunk(file_path, start, end):
+    """Yield the Appendable instances on the lines of the file at ``file_path``
+    in the byte range [``start``, ``end``).
+    """
+    with open(file_path, 'rb') as fh:
+        fh.seek(start)
+        position = start
+        while position < end:
+            line = fh.readline()
+            if not line:
+                break
+            position += len(line)
+            line = line.decode('utf8')
+            if line.strip() and not is_header_line(line):
+                yield parse_appendable(line)
+
+
+def parse_file_chunk(chunk):
+    """Return the list of Appendable instances in ``chunk``, a (file path,
+    start, end) 3-tuple.
+    """
+    return list(iter_file_chunk(*chunk))
+
+
+def fold_file_chunk(chunk):
+    """Return the partial fold (see ``fold_aol``) of the appendables in
+    ``chunk``, a (file path, start, end) 3-tuple.
+    """
+    return fold_aol(iter_file_chunk(*chunk))
+
+
+def map_file_chunks(func, file_path, processes):
+    """Call ``func`` on each of the (file path, start, end) chunks of the file
+    at ``file_path`` in a pool of ``processes`` processes. Return the results
+    in file order.
+    """
+    chunks = [(file_path, start, end) for start, end in
+              get_file_chunks(file_path, processes)]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(func, chunks)
+
+
+def merge_folds(folds, entities=None):
+    """Merge the partial folds ``folds`` (see ``fold_aol``), which must be in
+    log order, into ``entities`` (a new dict by default). Later folds take
+    precedence over earlier ones on a per-attribute basis, exactly as if the
+    underlying appendables had been folded sequentially.
+    """
+    if entities is None:
+        entities = {}
+    for fold in folds:
+        for entity_id, attributes in fold.items():
+            entities.setdefault(entity_id, {}).update(attributes)
+    return entities
+
+
+def fold_quad(entities, quad):
+    """Fold EAVT quad ``quad`` into ``entities``, a dict from entity IDs to dicts
+    of domain-level attributes, mutating it. Return the entity ID.
+    """
+    e, a, v, _ = quad
+    entity = entities.setdefault(e, {})
+    if (a, v) in BEING_PREDS:
+        if a == HAS_ATTR:
+            entity['_extant'] = True
         else:
-            a = aol_to_domain_attr_convert(a)
-            entities[e][a] = v
+            entity['_extant'] = False
+    elif a == IS_A_ATTR:
+        entity['_type'] = v
+    else:
+        a = aol_to_domain_attr_convert(a)
+        entity[a] = v
+    return e
+
+
+def fold_aol(aol, entities=None):
+    """Fold all of the quads in the append-only log ``aol`` into ``entities``
+    (a new dict by default); see ``fold_quad``. Return ``entities``.
+    """
+    if entities is None:
+        entities = {}
+    for appendable in aol:
+        fold_quad(entities, appendable.quad)
+    return entities
+
+
+def construct_domain_entity(dom_ent_dict, domain_constructors):
+    """Construct the domain entity encoded by the folded entity dict
+    ``dom_ent_dict``. Return a 2-tuple of the pluralized entity type (e.g.,
+    'old-instances') and the domain entity namedtuple, or ``None`` if the entity
+    does not exist, is of an unknown type, or is invalid.
+    """
+    if not dom_ent_dict.get('_extant'):
+        return None
+    entity_type = dom_ent_dict.get('_type')
+    constructor = domain_constructors.get(entity_type)
+    if not constructor:
+        return None
+    domain_entity, err = constructor(**dom_ent_dict)
+    if err:
+        return None
+    return f'{entity_type}s', domain_entity
+
+
+def entities_to_domain_entities(entities, domain_constructors):
+    """Given ``entities``, a fold of an AOL (see ``fold_aol``), return a dict
+    from domain entity types (pluralized strings, e.g., 'old-instances') to
+    sets of domain entity namedtuples.
+    """
+    ret = {f'{k}s': set() for k in domain_constructors}
     for dom_ent_dict in entities.values():
-        if not dom_ent_dict.get('_extant'):
-            continue
-        entity_type = dom_ent_dict.get('_type')
-        constructor = domain_constructors.get(entity_type)
-        if not constructor:
-            continue
-        domain_entity, err = constructor(**dom_ent_dict)
-        if err:
-            continue
-        key = f'{entity_type}s'
-        ret[key].add(domain_entity)
+        constructed = construct_domain_entity(dom_ent_dict, domain_constructors)
+        if constructed:
+            key, domain_entity = constructed
+            ret[key].add(domain_entity)
     return ret
 
 
+def aol_to_domain_entities(aol, domain_constructors, processes=None):
+    """Given an append-only log ``aol``, return a dict from domain entity types
+    (pluralized strings, e.g., 'old-instances') to sets of domain entity
+    namedtuples (e.g., ``OLDInstance(slug='oka', ...)``.)
+
+    If ``processes`` is greater than 1, ``aol`` is split into that many
+    contiguous slices which are folded in parallel by a pool of processes and
+    then merged in log order.
+    """
+    if processes and processes > 1 and len(aol) > processes:
+        step = -(-len(aol) // processes)
+        slices = [aol[i:i + step] for i in range(0, len(aol), step)]
+        with multiprocessing.Pool(processes) as pool:
+            entities = merge_folds(pool.map(fold_aol, slices))
+    else:
+        entities = fold_aol(aol)
+    return entities_to_domain_entities(entities, domain_constructors)
+
+
+def file_to_domain_entities(file_path, domain_constructors, processes=None):
+    """Return the domain entities (see ``aol_to_domain_entities``) encoded by
+    the AOL stored on disk at ``file_path``.
+
+    If ``processes`` is greater than 1, chunks of the file are parsed and
+    folded in parallel by a pool of processes, so that the parent process never
+    materializes the AOL itself.
+    """
+    if processes and processes > 1:
+        entities = merge_folds(map_file_chunks(
+            fold_file_chunk, file_path, processes))
+    else:
+        entities = fold_aol(iter_file_chunk(
+            file_path, 0, os.path.getsize(file_path)))
+    return entities_to_domain_entities(entities, domain_constructors)
+
+
 def aol_to_json(aol):
     return json.dumps(aol)
 
@@ -287,11 +752,14 @@ def json_to_aol(json_aol):
 # Merge Functionality
 # ==============================================================================
 
-def find_changes(target, mergee):
+def find_changes(target, mergee, target_index=None, aliases=None):
     """Find changes, i.e., the suffix of mergee that is not in target.
 
     What: return the suffix of mergee that is not in target.
-    How: reverse pairwise iteration.
+    How: binary search (see ``get_fork_position``) for the first appendable of
+    mergee whose integrated hash is not in the hash index of target. This is
+    logarithmic in the size of mergee, plus the cost of building the hash index
+    of target if ``target_index`` (see ``get_hash_index``) is not supplied.
     Logical possibilities:
 
     1. No change
@@ -324,25 +792,54 @@ def find_changes(target, mergee):
        mergee:   a => b => c => d => e
        changes:              => d => e
 
+    If ``aliases`` is supplied, it maps integrated hashes that are not in target
+    to integrated hashes in target that they are equivalent to, e.g., the tip
+    of target before and after it was compacted (see ``dtaoldm.compaction``).
+
     .. warning:: This should maybe better be a shell out to Git ... but it's fun
 
     """
-    if not target:  # target is empty, all of mergee is new
+    if target_index is None:
+        target_index = get_hash_index(target)
+    if not target_index:  # target is empty, all of mergee is new
         return mergee
-    target_seen = []  # suffix of target hashes seen
-    mergee_seen = []  # suffix of mergee hashes seen (2-tuples with indices)
-    for i, (l, f) in enumerate(zip(reversed(target), reversed(mergee))):
-        target_hash = l.integrated_hash
-        mergee_hash = f.integrated_hash
-        if (target_hash == mergee_hash or  # (1, 4)
-                mergee_hash in target_seen):  # (3, 6)
-            return mergee[len(mergee)-i:]
-        target_seen.append(target_hash)
-        for oth_foll_hash, oth_foll_idx in reversed(mergee_seen):
-            if oth_foll_hash in target_seen:
-                return mergee[len(mergee)-oth_foll_idx:] # (2, 5)
-        mergee_seen.append((mergee_hash, i))
-    return mergee
+    return find_changes_in(target_index.__contains__, mergee, aliases=aliases)
+
+
+def get_fork_position(mergee, contains):
+    """Return the length of the longest prefix of ``mergee`` whose integrated
+    hashes all satisfy the predicate ``contains``, e.g., membership in the hash
+    index of a target AOL.
+
+    Since each integrated hash commits to all of the appendables before it, an
+    AOL that contains an appendable of ``mergee`` contains all of the ones
+    before it too. The predicate is therefore true of a prefix of ``mergee``
+    and false of the rest, and the fork point can be found by binary search,
+    with a logarithmic number of calls to ``contains``.
+    """
+    low, high = 0, len(mergee)
+    while low < high:
+        middle = (low + high) // 2
+        if contains(mergee[middle].integrated_hash):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def find_changes_in(contains, mergee, aliases=None):
+    """Return the suffix of ``mergee`` that is not in the AOL whose membership
+    predicate (see ``get_fork_position``) is ``contains``. See
+    ``find_changes`` for ``aliases``; the part of ``mergee`` after the fork
+    point is scanned backwards for aliased hashes.
+    """
+    fork = get_fork_position(mergee, contains)
+    if aliases:
+        for position in range(len(mergee) - 1, fork - 1, -1):
+            alias = aliases.get(mergee[position].integrated_hash)
+            if alias is not None and contains(alias):
+                return mergee[position + 1:]
+    return mergee[fork:]
 
 
 def get_hashes(aol):
@@ -354,9 +851,112 @@ NEED_REBASE_ERR = ('There are changes in the target AOL that are not present'
                    ' changes or try again with the "rebase" conflict'
                    ' resolution strategy.')
 
+ABORT_STRATEGY = 'abort'
+REBASE_STRATEGY = 'rebase'
+THREE_WAY_STRATEGY = 'three-way'
+REBASE_STRATEGIES = (REBASE_STRATEGY, THREE_WAY_STRATEGY)
+
+
+# ==============================================================================
+# Three-way Rebase
+# ==============================================================================
+
+Conflict = namedtuple(
+    'Conflict', (
+        'entity',
+        'attribute',  # None for the being (existence) of the entity
+        'target_quad',  # latest conflicting quad of the target's changes
+        'mergee_quad',  # latest conflicting quad of the mergee's changes
+    ))
+
+
+RebaseResult = namedtuple(
+    'RebaseResult', (
+        'merged',  # what merge_aols returns for the 'rebase' strategy
+        'conflicts',  # tuple of ``Conflict`` instances
+    ))
+
+
+def get_change_key(quad):
+    """Return the (entity, attribute) pair that ``quad`` changes. The
+    ``has being`` and ``lacks being`` quads of an entity share the key
+    (entity, None).
+    """
+    entity, attribute, value, _ = quad
+    if (attribute, value) in BEING_PREDS:
+        return entity, None
+    return entity, attribute
+
+
+def index_changes(appendables):
+    """Return a 2-tuple indexing the quads of ``appendables``: a dict from
+    change keys (see ``get_change_key``) to the latest quad with that key, and
+    a dict from entities to the latest quad that changes one of their
+    attributes (other than being).
+    """
+    latest = {}
+    entities = {}
+    for appendable in appendables:
+        quad = appendable.quad
+        key = get_change_key(quad)
+        latest[key] = quad
+        if key[1] is not None:
+            entities[key[0]] = quad
+    return latest, entities
+
+
+def filter_three_way(quads, target_changes, conflicts):
+    """Return the list of the mergee ``quads`` that can be applied on top of
+    the changes of the target, as indexed by ``index_changes``.
+
+    A mergee quad conflicts with the target's changes if the target changed
+    the same (entity, attribute) to a different value, if the target retracted
+    the entity (``lacks being``), or if it retracts an entity whose attributes
+    the target changed. Conflicting quads are not applied, but recorded in the
+    dict ``conflicts`` (from change keys to ``Conflict`` instances), which is
+    updated in place. Quads that repeat the target's change are skipped.
+    """
+    latest = target_changes[0]
+    applied = []
+    for quad in quads:
+        key = get_change_key(quad)
+        conflict = conflicts.get(key)
+        if conflict is not None:
+            conflicts[key] = conflict._replace(mergee_quad=quad)
+            continue
+        target_quad = latest.get(key)
+        if target_quad is not None and (
+                (target_quad[1], target_quad[2]) == (quad[1], quad[2])):
+            continue  # the target made the same change
+        target_quad = get_conflicting_quad(quad, key, target_changes)
+        if target_quad is None:
+            applied.append(quad)
+        else:
+            conflicts[key] = Conflict(key[0], key[1], target_quad, quad)
+    return applied
+
+
+def get_conflicting_quad(quad, key, target_changes):
+    """Return the latest quad of the target's changes that the mergee quad
+    ``quad`` (with change key ``key``) conflicts with, or ``None``.
+    """
+    latest, entities = target_changes
+    entity, attribute = key
+    if key in latest:
+        return latest[key]
+    if attribute is not None:
+        being = latest.get((entity, None))
+        if being is not None and being[1] == LACKS_ATTR:
+            return being
+        return None
+    if quad[1] == LACKS_ATTR:
+        return entities.get(entity)
+    return None
+
 
 def merge_aols(target, mergee, conflict_resolution_strategy='abort',
-               diff_only=False):
+               diff_only=False, target_index=None, digest=DEFAULT_DIGEST,
+               aliases=None):
     """Merge AOL ``mergee`` into AOL ``target``.
 
     :param list target: the AOL that will receive the changes.
@@ -365,52 +965,148 @@ def merge_aols(target, mergee, conflict_resolution_strategy='abort',
     :param str conflict_resolution_strategy: describes how to handle conflicts.
       If the strategy is 'rebase', we will append the new quads from mergee
       onto target, despite the fact that this will result in hashes for those
-      appended quads that differ from their input hashes in ``mergee``.
-    :param bool diff_only: If True, we only return the suffix of the merged
-      result that ``mergee`` would need to append to itself in order to become
-      identical with ``target``; if False, we return the entire modified
-      ``target``.
+      appended quads that differ from their input hashes in ``mergee``. If the
+      strategy is 'three-way', we rebase like 'rebase', but only append the
+      new quads from mergee that do not conflict with the new quads from
+      target (see ``filter_three_way``) and wrap what we would otherwise
+      return in a ``RebaseResult`` that also lists the conflicts.
+    :param bool diff_only: If True, ``target`` is left unmodified and we return
+      the ``Patch`` that ``mergee`` would need to apply to itself (see
+      ``apply_patch``) in order to become identical with the merged
+      ``target``; if False, we return the entire modified ``target``.
+    :param dict target_index: optional hash index of ``target`` (see
+      ``get_hash_index``), e.g., as read from the sidecar index file of a
+      persisted AOL via ``get_hash_index_in_file``.
+    :param str digest: the digest used by ``target`` (see ``DIGESTS``).
+    :param dict aliases: optional map from integrated hashes that ``target``
+      no longer contains to equivalent integrated hashes in ``target`` (see
+      ``find_changes`` and ``dtaoldm.compaction.get_aliases``).
     :returns: Always returns a 2-tuple maybe-type structure.
-
-    .. warning:: TODO: this should return a "patch". That is, instead of just
-                 returning an AOL, it should return a 2-tuple where the first
-                 element is the AOL and the second element is the hash in the
-                 ``mergee`` AOL where the patch should be applied.
-    """
-    new_from_mergee = find_changes(target, mergee)
-    if not new_from_mergee:
-        if diff_only:
-            return find_changes(mergee, target), None
-        return target, None
-    new_from_target = find_changes(mergee, target)
-    if new_from_target:
-        if conflict_resolution_strategy != 'rebase':
+    """
+    if target_index is None:
+        target_index = get_hash_index(target)
+    new_from_mergee = find_changes(target, mergee, target_index=target_index,
+                                   aliases=aliases)
+    three_way = conflict_resolution_strategy == THREE_WAY_STRATEGY
+    conflicts = {}
+
+    def result(merged):
+        if three_way:
+            merged = RebaseResult(merged, tuple(conflicts.values()))
+        return merged, None
+
+    if not new_from_mergee and not diff_only:
+        return result(target)
+    reverse_aliases = {post: pre for pre, post in (aliases or {}).items()}
+    new_from_target = find_changes(mergee, target, aliases=reverse_aliases)
+    if new_from_mergee and new_from_target:
+        if conflict_resolution_strategy not in REBASE_STRATEGIES:
             return None, NEED_REBASE_ERR
-    ret = target
-    if diff_only:
-        ret = new_from_target
-        if not ret:
-            return ret, None
-    for appendable in new_from_mergee:
-        append_to_aol(ret, appendable.quad)
-    return ret, None
+    new_quads = [appendable.quad for appendable in new_from_mergee]
+    if three_way and new_from_target:
+        new_quads = filter_three_way(
+            new_quads, index_changes(new_from_target), conflicts)
+    if not diff_only:
+        append_many(target, new_quads, digest=digest)
+        return result(target)
+    fork = len(mergee) - len(new_from_mergee)
+    base_hash = mergee[fork - 1].integrated_hash if fork else None
+    rebased = list(chain_quads(new_quads, get_tip_hash(target), digest=digest))
+    if base_hash is not None and base_hash not in target_index:
+        # mergee forks from a hash that target only knows by an alias, so all
+        # of mergee has to be replaced.
+        return result(Patch(None, list(target) + rebased))
+    if not new_from_target:
+        return result(Patch(get_tip_hash(mergee), []))
+    return result(Patch(base_hash, list(new_from_target) + rebased))
+
+
+# ==============================================================================
+# Patches
+# ==============================================================================
+
+Patch = namedtuple(
+    'Patch', (
+        'base_hash',  # integrated hash of the appendable in the recipient AOL
+                      # after which the patch applies; None for the empty AOL
+        'appendables',  # the appendables that follow base_hash
+    ))
+
+
+UNKNOWN_BASE_HASH_ERR = ('The AOL contains no appendable with the base hash of'
+                         ' the patch.')
+
+
+def apply_patch(aol, patch):
+    """Apply ``patch`` to the list of appendables ``aol`` in place: remove the
+    appendables after the one with integrated hash ``patch.base_hash`` and
+    append ``patch.appendables``. Return a "maybe" 2-tuple whose first element
+    is ``aol``.
+    """
+    length = 0
+    if patch.base_hash is not None:
+        for position in range(len(aol) - 1, -1, -1):
+            if aol[position].integrated_hash == patch.base_hash:
+                length = position + 1
+                break
+        else:
+            return None, UNKNOWN_BASE_HASH_ERR
+    del aol[length:]
+    aol.extend(patch.appendables)
+    return aol, None
+
+
+def patch_to_json(patch):
+    return json.dumps(patch._asdict())
+
+
+def dict_to_patch(patch_dict):
+    return Patch(patch_dict['base_hash'],
+                 list_to_aol(patch_dict['appendables']))
+
+
+def json_to_patch(json_patch):
+    return dict_to_patch(json.loads(json_patch))
+
+
+DIFF_TYPE_ERR = 'Diff requires that both instances be of the same type.'
 
 
 def diff(init_inst, new_inst, instance_type):
     """Return the list of quads needed to make ``init_inst`` identical to
     ``new_inst``. Both instances must be of type ``instance_type`` (a string).
+    See ``diff_many``.
     """
-    if not isinstance(init_inst, type(new_inst)):
-        return None, 'Diff requires that both instances be of the same type.'
-    init_quads = instance_to_quads(init_inst, instance_type)
-    new_quads = instance_to_quads(new_inst, instance_type)
-    diff_quads = []
-    for nq in new_quads:
-        matches = [q for q in init_quads if q.attribute == nq.attribute]
-        if matches:
-            match = matches[0]
-            if match.value != nq.value:  # updated quad
-                diff_quads.append(nq)
-        else:  # new quad; should not really be possible given record type (namedtuple)
-            diff_quads.append(nq)
+    diff_quads, err = diff_many(((init_inst, new_inst),), instance_type)
+    if err:
+        return None, err
     return diff_quads
+
+
+def diff_many(pairs, instance_type):
+    """Return the list of quads needed to make the initial instances identical
+    to the new instances in ``pairs``, an iterable of ``(init_inst,
+    new_inst)`` 2-tuples of namedtuple domain entities of type
+    ``instance_type`` (a string), as a "maybe" 2-tuple.
+
+    The field values of each pair are compared positionally and quads are only
+    built for the fields that changed, all with the same timestamp. (The being
+    and ``is-a`` quads of an instance never change, so they are not compared.)
+    """
+    now = get_now_str()
+    attributes_by_type = {}
+    diff_quads = []
+    for init_inst, new_inst in pairs:
+        if not isinstance(init_inst, type(new_inst)):
+            return None, DIFF_TYPE_ERR
+        fields = new_inst._fields
+        attributes = attributes_by_type.get(fields)
+        if attributes is None:
+            attributes = attributes_by_type[fields] = [
+                domain_to_aol_attr_convert(attr) for attr in fields]
+        entity = new_inst.id
+        for attribute, init_value, new_value in zip(
+                attributes, init_inst, new_inst):
+            if init_value != new_value:
+                diff_quads.append(Quad(entity, attribute, new_value, now))
+    return diff_quads, None
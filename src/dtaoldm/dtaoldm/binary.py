@@ -0,0 +1,339 @@
+"""Binary Append-only Log Encoding
+
+A compact binary alternative to the JSON-lines format written by
+``dtaoldm.aol.persist_aol``. It is intended for archival logs, e.g., the closed
+segments of a segmented AOL (see ``dtaoldm.segments``), which are written once
+and then only read.
+
+A binary AOL file starts with ``MAGIC`` and is followed by a sequence of
+records, each of which starts with a one-byte record tag:
+
+- ``STRING_RECORD``: adds the next string to the string table. It is followed by
+  the byte length of the UTF-8-encoded string (as a varint) and the encoded
+  string. Strings are numbered from 0 in the order of their definition, and
+  each string is defined once, right before the first record that uses it.
+- ``COMPACT_RECORD``: an appendable whose entity and attribute are strings, whose
+  time is a timestamp as written by ``dtaoldm.aol.get_now_str`` and whose hashes
+  are 16-byte (e.g., MD5) hex digests, i.e., almost every appendable. It is
+  followed by a fixed-size ``COMPACT_STRUCT``: the string table numbers of the
+  entity, the attribute and the value (or, if ``JSON_REF_FLAG`` is set, of the
+  JSON serialization of the value), the time as microseconds since the Unix
+  epoch, and the raw hash and integrated hash.
+- ``APPENDABLE_RECORD``: any other appendable. It is followed by six fields:
+  the entity, attribute, value and time of the quad, the hash and the
+  integrated hash.
+
+Each field of an ``APPENDABLE_RECORD`` starts with a one-byte field tag:
+
+- ``STRING_FIELD``: a string; followed by its number in the string table.
+- ``JSON_FIELD``: a non-string value (e.g., a boolean); followed by the number
+  of its JSON serialization in the string table.
+- ``TIMESTAMP_FIELD``: an ISO-8601 timestamp as written by
+  ``dtaoldm.aol.get_now_str``; followed by the number of microseconds since the
+  Unix epoch, as a signed 8-byte little-endian integer.
+- ``DIGEST_FIELD``: a lowercase hex digest; followed by the byte length of the
+  raw digest (one byte) and the raw digest.
+
+Since entity UUIDs, attributes and repeated values are stored once, and
+timestamps and hashes are stored as raw bytes, a binary AOL is several times
+smaller than the equivalent JSON-lines AOL. Fields are only given the compact
+encodings when decoding them gives back the identical value, so the round-trip
+to ``Appendable`` instances is always lossless::
+
+    >>> write_binary_aol(aol, 'path/to/aol.bin')
+    >>> get_binary_aol('path/to/aol.bin') == aol_mod.list_to_aol(aol)
+    True
+
+"""
+
+from datetime import datetime, timedelta
+import os
+import struct
+
+import dtaoldm.aol as aol_mod
+
+
+MAGIC = b'DTAOLB\x00\x01'
+
+STRING_RECORD = 0
+APPENDABLE_RECORD = 1
+COMPACT_RECORD = 2
+
+STRING_FIELD = 0
+JSON_FIELD = 1
+TIMESTAMP_FIELD = 2
+DIGEST_FIELD = 3
+
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+TIMESTAMP_STRUCT = struct.Struct('<q')
+COMPACT_STRUCT = struct.Struct('<IIIq16s16s')
+COMPACT_DIGEST_SIZE = 16
+JSON_REF_FLAG = 0x80000000
+
+NOT_BINARY_AOL_ERR = 'The file is not a binary AOL file.'
+
+
+# ==============================================================================
+# Encoding
+# ==============================================================================
+
+def encode_varint(n, out):
+    """Append the unsigned LEB128 encoding of integer ``n`` to bytearray
+    ``out``.
+    """
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def timestamp_to_micros(timestamp):
+    """Return the number of microseconds since the Unix epoch of the ISO-8601
+    string ``timestamp``, or ``None`` if ``timestamp`` is not a string that
+    ``datetime.isoformat`` would produce.
+    """
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            parsed = datetime.strptime(timestamp, timestamp_format)
+        except ValueError:
+            continue
+        if parsed.isoformat() != timestamp:
+            return None
+        delta = parsed - EPOCH
+        return ((delta.days * 86400 + delta.seconds) * 1000000 +
+                delta.microseconds)
+    return None
+
+
+def hex_to_digest(hex_digest):
+    """Return the raw bytes of the lowercase hex digest ``hex_digest``, or
+    ``None`` if ``hex_digest`` is not one.
+    """
+    try:
+        digest = bytes.fromhex(hex_digest)
+    except ValueError:
+        return None
+    if digest.hex() != hex_digest or len(digest) > 255:
+        return None
+    return digest
+
+
+def _get_ref(string, strings, out):
+    """Return the string table number of ``string``, first defining ``string``
+    in ``out`` if it is not in ``strings`` yet.
+    """
+    ref = strings.get(string)
+    if ref is None:
+        ref = strings[string] = len(strings)
+        data = string.encode('utf8')
+        out.append(STRING_RECORD)
+        encode_varint(len(data), out)
+        out += data
+    return ref
+
+
+def _encode_field(field, strings, out, record, is_time=False, is_hash=False):
+    if not isinstance(field, str):
+        record.append(JSON_FIELD)
+        encode_varint(_get_ref(aol_mod.get_json(field), strings, out), record)
+        return
+    if is_time:
+        micros = timestamp_to_micros(field)
+        if micros is not None:
+            record.append(TIMESTAMP_FIELD)
+            record += TIMESTAMP_STRUCT.pack(micros)
+            return
+    if is_hash:
+        digest = hex_to_digest(field)
+        if digest is not None:
+            record.append(DIGEST_FIELD)
+            record.append(len(digest))
+            record += digest
+            return
+    record.append(STRING_FIELD)
+    encode_varint(_get_ref(field, strings, out), record)
+
+
+def _encode_compact_record(appendable, strings, out):
+    """Append the ``COMPACT_RECORD`` of ``appendable`` to ``out`` and return
+    ``True``, or return ``False`` if ``appendable`` has no such record.
+    """
+    (entity, attribute, value, time), hash_, integrated_hash = appendable
+    if not (isinstance(entity, str) and isinstance(attribute, str) and
+            isinstance(time, str)):
+        return False
+    micros = timestamp_to_micros(time)
+    digest = hex_to_digest(hash_)
+    integrated_digest = hex_to_digest(integrated_hash)
+    if (micros is None or digest is None or integrated_digest is None or
+            len(digest) != COMPACT_DIGEST_SIZE or
+            len(integrated_digest) != COMPACT_DIGEST_SIZE):
+        return False
+    if isinstance(value, str):
+        value_ref = _get_ref(value, strings, out)
+    else:
+        value_ref = (_get_ref(aol_mod.get_json(value), strings, out) |
+                     JSON_REF_FLAG)
+    record = COMPACT_STRUCT.pack(
+        _get_ref(entity, strings, out), _get_ref(attribute, strings, out),
+        value_ref, micros, digest, integrated_digest)
+    out.append(COMPACT_RECORD)
+    out += record
+    return True
+
+
+def encode_appendables(appendables, strings=None):
+    """Return the binary encoding (without ``MAGIC``) of ``appendables``.
+
+    ``strings`` is the string table of the binary AOL that the encoding will be
+    appended to, a dict from strings to their numbers; it is updated in place.
+    """
+    if strings is None:
+        strings = {}
+    out = bytearray()
+    for appendable in appendables:
+        if _encode_compact_record(appendable, strings, out):
+            continue
+        (entity, attribute, value, time), hash_, integrated_hash = appendable
+        record = bytearray([APPENDABLE_RECORD])
+        _encode_field(entity, strings, out, record)
+        _encode_field(attribute, strings, out, record)
+        _encode_field(value, strings, out, record)
+        _encode_field(time, strings, out, record, is_time=True)
+        _encode_field(hash_, strings, out, record, is_hash=True)
+        _encode_field(integrated_hash, strings, out, record, is_hash=True)
+        out += record
+    return bytes(out)
+
+
+def write_binary_aol(aol, file_path):
+    """Atomically write the append-only log ``aol`` to disk at path
+    ``file_path`` in the binary format.
+    """
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(encode_appendables(aol))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, file_path)
+
+
+# ==============================================================================
+# Decoding
+# ==============================================================================
+
+def decode_varint(data, position):
+    """Return the unsigned LEB128-encoded integer in ``data`` at ``position``
+    and the position after it.
+    """
+    n = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, position
+        shift += 7
+
+
+def _decode_field(data, position, strings):
+    tag = data[position]
+    position += 1
+    if tag == TIMESTAMP_FIELD:
+        micros, = TIMESTAMP_STRUCT.unpack_from(data, position)
+        return micros_to_timestamp(micros), position + TIMESTAMP_STRUCT.size
+    if tag == DIGEST_FIELD:
+        end = position + 1 + data[position]
+        return data[position + 1:end].hex(), end
+    ref, position = decode_varint(data, position)
+    if tag == STRING_FIELD:
+        return strings[ref], position
+    return aol_mod.parse_json(strings[ref]), position
+
+
+def micros_to_timestamp(micros, dates=None):
+    """Return the ISO-8601 string of the UTC datetime ``micros`` microseconds
+    after the Unix epoch, exactly as ``datetime.isoformat`` would. ``dates`` is
+    an optional cache of the date parts of timestamps, by day since the epoch.
+    """
+    day, rem = divmod(micros, 86400000000)
+    date = dates.get(day) if dates is not None else None
+    if date is None:
+        date = (EPOCH + timedelta(days=day)).date().isoformat()
+        if dates is not None:
+            dates[day] = date
+    seconds, micro = divmod(rem, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    if micro:
+        return '%sT%02d:%02d:%02d.%06d' % (date, hour, minute, second, micro)
+    return '%sT%02d:%02d:%02d' % (date, hour, minute, second)
+
+
+def decode_appendables(data, position=0, strings=None):
+    """Yield the Appendable instances encoded in the bytes ``data`` from
+    ``position`` on. ``strings`` is the string table (a list) of the records
+    before ``position``; it is updated in place.
+    """
+    if strings is None:
+        strings = []
+    dates = {}
+    unpack_compact = COMPACT_STRUCT.unpack_from
+    compact_size = COMPACT_STRUCT.size
+    # Bypass the namedtuple constructors' argument handling in the hot loop.
+    new_tuple = tuple.__new__
+    Appendable = aol_mod.Appendable
+    Quad = aol_mod.Quad
+    end = len(data)
+    while position < end:
+        tag = data[position]
+        position += 1
+        if tag == COMPACT_RECORD:
+            (entity_ref, attribute_ref, value_ref, micros, digest,
+             integrated_digest) = unpack_compact(data, position)
+            position += compact_size
+            if value_ref & JSON_REF_FLAG:
+                value = aol_mod.parse_json(strings[value_ref ^ JSON_REF_FLAG])
+            else:
+                value = strings[value_ref]
+            yield new_tuple(Appendable, (
+                new_tuple(Quad, (
+                    strings[entity_ref], strings[attribute_ref], value,
+                    micros_to_timestamp(micros, dates))),
+                digest.hex(), integrated_digest.hex()))
+        elif tag == STRING_RECORD:
+            length, position = decode_varint(data, position)
+            strings.append(
+                bytes(data[position:position + length]).decode('utf8'))
+            position += length
+        else:
+            fields = []
+            for _ in range(6):
+                field, position = _decode_field(data, position, strings)
+                fields.append(field)
+            yield Appendable(Quad(*fields[:4]), *fields[4:])
+
+
+def is_binary_aol_file(file_path):
+    with open(file_path, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def iter_binary_aol(file_path):
+    """Yield the Appendable instances of the binary AOL at ``file_path``, in
+    log order. Raise ``ValueError`` if the file is not a binary AOL.
+    """
+    with open(file_path, 'rb') as fh:
+        data = fh.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(NOT_BINARY_AOL_ERR)
+    yield from decode_appendables(data, position=len(MAGIC))
+
+
+def get_binary_aol(file_path):
+    """Read the binary AOL at ``file_path`` to a list of Appendable instances.
+    """
+    return list(iter_binary_aol(file_path))
@@ -0,0 +1,107 @@
+"""Bloom Filters of Integrated Hashes
+
+A Bloom filter is a compact, probabilistic summary of a set of integrated
+hashes: ``bloom_contains`` never returns ``False`` for a hash that was added to
+the filter, and returns ``True`` for a hash that was not added with a
+probability of about the ``error_rate`` that the filter was sized for.
+
+The closed segments of a segmented AOL (see ``dtaoldm.segments``) carry a Bloom
+filter of their integrated hashes in a sidecar file, so that checking whether
+the AOL contains a hash only requires reading the (few) segments whose filters
+may contain it. Since integrated hashes are already uniformly distributed
+digests, the bit positions of a hash are derived from its own hex digits by
+double hashing, without hashing it again::
+
+    >>> bloom = build_bloom(aol_mod.get_hashes(aol))
+    >>> bloom_contains(bloom, aol[0].integrated_hash)
+    True
+
+"""
+
+from collections import namedtuple
+import hashlib
+import math
+import os
+import struct
+
+
+DEFAULT_ERROR_RATE = 0.01
+
+# bit count and hash count, followed by the bits
+HEADER_STRUCT = struct.Struct('<QB')
+
+# Number of hex digits of an integrated hash used for each of the two base
+# hashes of double hashing.
+HALF_HASH_DIGITS = 16
+
+
+Bloom = namedtuple(
+    'Bloom', (
+        'bit_count',  # number of bits in the filter
+        'hash_count',  # number of bit positions per hash
+        'bits',  # bytearray of ceil(bit_count / 8) bytes
+    ))
+
+
+def make_bloom(capacity, error_rate=DEFAULT_ERROR_RATE):
+    """Return an empty ``Bloom`` filter sized so that, once ``capacity`` hashes
+    have been added, its false positive rate is about ``error_rate``.
+    """
+    capacity = max(capacity, 1)
+    bit_count = max(
+        int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+    hash_count = max(int(round(bit_count / capacity * math.log(2))), 1)
+    return Bloom(bit_count, hash_count, bytearray((bit_count + 7) // 8))
+
+
+def get_bloom_positions(bloom, integrated_hash):
+    """Return the bit positions of ``integrated_hash`` in ``bloom``."""
+    if len(integrated_hash) < 2 * HALF_HASH_DIGITS:
+        integrated_hash = hashlib.md5(
+            integrated_hash.encode('utf8')).hexdigest()
+    first = int(integrated_hash[:HALF_HASH_DIGITS], 16)
+    second = int(
+        integrated_hash[HALF_HASH_DIGITS:2 * HALF_HASH_DIGITS], 16) | 1
+    return [(first + i * second) % bloom.bit_count
+            for i in range(bloom.hash_count)]
+
+
+def add_to_bloom(bloom, integrated_hash):
+    bits = bloom.bits
+    for position in get_bloom_positions(bloom, integrated_hash):
+        bits[position >> 3] |= 1 << (position & 7)
+
+
+def bloom_contains(bloom, integrated_hash):
+    """Return ``False`` if ``integrated_hash`` was definitely not added to
+    ``bloom``, else ``True``.
+    """
+    bits = bloom.bits
+    return all(bits[position >> 3] & (1 << (position & 7)) for position in
+               get_bloom_positions(bloom, integrated_hash))
+
+
+def build_bloom(integrated_hashes, error_rate=DEFAULT_ERROR_RATE):
+    """Return a ``Bloom`` filter of the sequence ``integrated_hashes``."""
+    bloom = make_bloom(len(integrated_hashes), error_rate=error_rate)
+    for integrated_hash in integrated_hashes:
+        add_to_bloom(bloom, integrated_hash)
+    return bloom
+
+
+def write_bloom_file(bloom, file_path):
+    """Atomically write ``bloom`` to the file at ``file_path``."""
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(HEADER_STRUCT.pack(bloom.bit_count, bloom.hash_count))
+        fh.write(bloom.bits)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def read_bloom_file(file_path):
+    with open(file_path, 'rb') as fh:
+        data = fh.read()
+    bit_count, hash_count = HEADER_STRUCT.unpack_from(data)
+    return Bloom(bit_count, hash_count, bytearray(data[HEADER_STRUCT.size:]))
@@ -0,0 +1,191 @@
+"""Append-only Log Compaction
+
+Functionality for replacing an append-only log with the minimal AOL that
+encodes the same domain entities.
+
+Since ``dtaoldm.aol.instance_to_quads`` emits a quad for every attribute of a
+domain entity whenever it is saved, most of the quads of a long-lived AOL
+assert values that have since been superseded. Compacting an AOL keeps only the
+latest quad for each (entity, attribute) pair, in log order, and drops the
+quads of entities whose latest being quad retracts them (``lacks being``). The
+kept quads are re-chained, so the compacted AOL has new integrated hashes.
+
+Peers that synced with the AOL before it was compacted only know the old
+integrated hashes. Each compaction is therefore recorded as a ``Compaction``
+pairing the tip of the AOL before compaction with the tip after it. These
+records are stored in a sidecar file next to an AOL file (at
+``<AOL_PATH>.compactions``) or in the directory of a segmented AOL (at
+``compactions.txt``). ``get_aliases`` turns them into the ``aliases`` argument
+of ``dtaoldm.aol.merge_aols``, so that a peer whose AOL ends at (or extends) the
+pre-compaction tip can still be merged without re-sending its whole log::
+
+    >>> compaction = compact_aol_file('path/to/aol.txt')
+    >>> aliases = get_aliases(read_compactions('path/to/aol.txt'))
+    >>> merged, err = aol_mod.merge_aols(
+    ...     aol_mod.get_aol('path/to/aol.txt'), peer_aol, aliases=aliases)
+
+"""
+
+from collections import namedtuple
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.segments as segments_mod
+
+
+COMPACTIONS_SUFFIX = '.compactions'
+COMPACTIONS_FILE_NAME = 'compactions.txt'
+
+# The key under which both ``has being`` and ``lacks being`` quads of an entity
+# are kept, since only the latest of them matters.
+_BEING_KEY = None
+
+
+Compaction = namedtuple(
+    'Compaction', (
+        'pre_tip_hash',  # integrated hash of the tip before compaction
+        'post_tip_hash',  # integrated hash of the tip after compaction
+        'pre_length',  # number of appendables before compaction
+        'post_length',  # number of appendables after compaction
+    ))
+
+
+def compact_aol(aol, digest=aol_mod.DEFAULT_DIGEST):
+    """Return the compacted AOL (see the module docstring) of ``aol``, chained
+    with ``digest``. It encodes the same domain entities as ``aol``.
+    """
+    latest = {}
+    extant = {}
+    for position, appendable in enumerate(aol):
+        entity, attribute, value, _ = appendable.quad
+        if (attribute, value) in aol_mod.BEING_PREDS:
+            extant[entity] = attribute == aol_mod.HAS_ATTR
+            attribute = _BEING_KEY
+        latest[(entity, attribute)] = position
+    positions = sorted(position for (entity, _), position in latest.items()
+                       if extant.get(entity, True))
+    return aol_mod.append_many(
+        [], [aol_mod.Quad(*aol[position].quad) for position in positions],
+        digest=digest)
+
+
+def get_compaction(aol, compacted):
+    return Compaction(
+        pre_tip_hash=aol_mod.get_tip_hash(aol),
+        post_tip_hash=aol_mod.get_tip_hash(compacted),
+        pre_length=len(aol),
+        post_length=len(compacted))
+
+
+# ==============================================================================
+# Compaction Records
+# ==============================================================================
+
+def get_compactions_path(path):
+    """Return the path of the compaction records of the AOL file or segmented
+    AOL directory at ``path``.
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, COMPACTIONS_FILE_NAME)
+    return f'{path}{COMPACTIONS_SUFFIX}'
+
+
+def record_compaction(compaction, path):
+    """Append ``compaction`` to the compaction records of the AOL at
+    ``path``.
+    """
+    with open(get_compactions_path(path), 'a') as fh:
+        fh.write(aol_mod.get_json(compaction._asdict()) + '\n')
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def read_compactions(path):
+    """Return the list of the ``Compaction``s of the AOL at ``path``, oldest
+    first.
+    """
+    compactions_path = get_compactions_path(path)
+    if not os.path.isfile(compactions_path):
+        return []
+    with open(compactions_path, 'r') as fh:
+        return [Compaction(**aol_mod.parse_json(line)) for line in fh
+                if line.strip()]
+
+
+def get_aliases(compactions):
+    """Return a dict from the pre-compaction tips of ``compactions`` to the
+    integrated hashes that they are equivalent to. When a compaction directly
+    follows another one, the earlier pre-compaction tip is mapped to the
+    latest post-compaction tip.
+    """
+    aliases = {}
+    for compaction in compactions:
+        if compaction.pre_tip_hash is None:
+            continue
+        for pre_tip_hash, post_tip_hash in aliases.items():
+            if post_tip_hash == compaction.pre_tip_hash:
+                aliases[pre_tip_hash] = compaction.post_tip_hash
+        aliases[compaction.pre_tip_hash] = compaction.post_tip_hash
+    return aliases
+
+
+# ==============================================================================
+# Compacting Persisted AOLs
+# ==============================================================================
+
+def compact_aol_file(file_path):
+    """Compact the AOL file at ``file_path`` in place. Return the
+    ``Compaction``, which is also recorded next to the file unless the AOL was
+    already minimal.
+
+    The compacted AOL is written to a temporary file which then replaces the
+    AOL file. The hash index sidecar file, if any, is rebuilt.
+    """
+    aol = aol_mod.get_aol(file_path)
+    digest = aol_mod.get_digest_in_file(file_path)
+    compacted = compact_aol(aol, digest=digest)
+    compaction = get_compaction(aol, compacted)
+    if compaction.pre_tip_hash == compaction.post_tip_hash:
+        return compaction
+    tmp_path = f'{file_path}.tmp'
+    aol_mod.write_aol_to_file(compacted, tmp_path, digest=digest)
+    with open(tmp_path, 'a') as fh:  # make the new AOL durable before the swap
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, file_path)
+    if os.path.exists(aol_mod.get_hash_index_path(file_path)):
+        aol_mod.build_hash_index_file(file_path)
+    record_compaction(compaction, file_path)
+    return compaction
+
+
+def compact_segmented_aol(dir_path):
+    """Compact the segmented AOL at ``dir_path``. Return the ``Compaction``,
+    which is also recorded in the directory unless the AOL was already
+    minimal.
+
+    The compacted AOL is written to new segment files, the manifest is then
+    atomically replaced by one that references only those, and only then are
+    the old segment files removed.
+    """
+    manifest = segments_mod.get_manifest(dir_path)
+    aol = segments_mod.get_segmented_aol(dir_path)
+    compacted = compact_aol(aol, digest=manifest.digest)
+    compaction = get_compaction(aol, compacted)
+    if compaction.pre_tip_hash == compaction.post_tip_hash:
+        return compaction
+    segment_index = segments_mod.get_next_segment_index(manifest)
+    new_segments = []
+    for start in range(0, len(compacted), manifest.segment_size):
+        new_segments.append(segments_mod.write_to_segment(
+            dir_path, segments_mod.get_empty_segment(segment_index),
+            compacted[start:start + manifest.segment_size]))
+        segment_index += 1
+    segments_mod.write_manifest(
+        manifest._replace(segments=tuple(new_segments)), dir_path)
+    record_compaction(compaction, dir_path)
+    for segment in manifest.segments:
+        os.remove(segments_mod.get_segment_path(dir_path, segment))
+        bloom_path = segments_mod.get_bloom_path(dir_path, segment)
+        if os.path.isfile(bloom_path):
+            os.remove(bloom_path)
+    return compaction
@@ -0,0 +1,223 @@
+"""Append-only Log History
+
+Functionality for "time travel" queries that return the domain entities
+encoded by an append-only log as of some point in its history, instead of its
+latest state.
+
+A point in the history of an AOL is either the integrated hash of one of its
+appendables (``as_of_hash``) or a timestamp (``as_of``). The state of an AOL as
+of a timestamp is the state encoded by its longest prefix whose quads all have
+times no later than the timestamp, i.e., the AOL as it was at that time,
+assuming that quads are appended at the time they state. (Quads merged from
+other AOLs may be appended later than their times, which is why the prefix
+ends at the first quad that is too late rather than skipping it.)
+
+The ``as_of`` and ``as_of_hash`` functions fold the AOL up to the requested
+point. For repeated queries, an ``AOLHistory`` takes a snapshot of the folded
+entity state every ``snapshot_interval`` appendables and keeps the running
+maximum of the quad times by position, which is sorted and therefore
+binary-searchable. A query then costs one binary search, a merge of the
+snapshots before the requested point, plus folding at most
+``snapshot_interval`` appendables::
+
+    >>> history = AOLHistory(aol, domain.CONSTRUCTORS)
+    >>> history.as_of('2019-07-15T17:43:57.211932')
+    {'old-instances': {OLDInstance(leader='', ...), ...}, ...}
+
+Snapshots are stored as deltas, i.e., the fold of the appendables since the
+previous snapshot, so their memory grows with the number of attribute changes
+rather than with the number of snapshots times the number of entities. They
+can be persisted to a JSON file next to the AOL file (at
+``<AOL_PATH>.history.json``) so that a cold start only indexes the
+appendables written since::
+
+    >>> with LazyAOL(aol_path) as lazy_aol:
+    ...     history = load_history(lazy_aol, aol_path, domain.CONSTRUCTORS)
+    ...     persist_history(history, aol_path)
+
+"""
+
+from bisect import bisect_right
+import os
+
+import dtaoldm.aol as aol_mod
+
+
+DEFAULT_SNAPSHOT_INTERVAL = 10000
+
+HISTORY_SUFFIX = '.history.json'
+
+UNKNOWN_HASH_ERR = 'The AOL contains no appendable with the supplied hash.'
+
+
+def get_length_as_of(aol, timestamp):
+    """Return the length of the longest prefix of ``aol`` whose quads all have
+    times no later than the ISO-8601 string ``timestamp``.
+    """
+    for position, appendable in enumerate(aol):
+        if appendable.quad[3] > timestamp:
+            return position
+    return len(aol)
+
+
+def as_of(aol, timestamp, domain_constructors):
+    """Return the domain entities (see ``dtaoldm.aol.aol_to_domain_entities``)
+    encoded by ``aol`` as of ISO-8601 timestamp ``timestamp``.
+    """
+    return aol_mod.aol_to_domain_entities(
+        aol[:get_length_as_of(aol, timestamp)], domain_constructors)
+
+
+def as_of_hash(aol, integrated_hash, domain_constructors):
+    """Return a "maybe" 2-tuple whose first element is the domain entities
+    encoded by the prefix of ``aol`` that ends with the appendable with
+    integrated hash ``integrated_hash``.
+    """
+    position = aol_mod.get_hash_index(aol).get(integrated_hash)
+    if position is None:
+        return None, UNKNOWN_HASH_ERR
+    return aol_mod.aol_to_domain_entities(
+        aol[:position + 1], domain_constructors), None
+
+
+class AOLHistory:
+    """Snapshots and a time index of the AOL ``aol`` (a list of appendables or
+    a ``dtaoldm.lazy.LazyAOL``) for answering as-of queries. Appendables that
+    are later appended to ``aol`` are indexed by calling ``update``.
+
+    If ``aol`` maintains its own hash index (e.g., a ``LazyAOL``, whose index
+    is read from the sidecar index file), it is used by ``as_of_hash``;
+    otherwise, one is built as the AOL is indexed.
+
+    :param dict domain_constructors: map from entity types to domain entity
+      constructors, e.g., ``dtaoldm.domain.CONSTRUCTORS``.
+    :param int snapshot_interval: number of appendables between snapshots.
+    :param list deltas: snapshots of the first appendables of ``aol``, as
+      persisted by ``persist_history``; ``deltas[k]`` is the fold of
+      ``aol[k * snapshot_interval:(k + 1) * snapshot_interval]``.
+    :param list max_times: time index of the same appendables.
+    """
+
+    def __init__(self, aol, domain_constructors,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL, deltas=None,
+                 max_times=None):
+        self.aol = aol
+        self.domain_constructors = domain_constructors
+        self.snapshot_interval = snapshot_interval
+        self.deltas = deltas if deltas is not None else []
+        # max_times[i] is the latest time in aol[:i + 1]
+        self.max_times = max_times if max_times is not None else []
+        self.length = len(self.max_times)
+        self.hash_index = getattr(aol, 'hash_index', None)
+        self._builds_hash_index = self.hash_index is None
+        if self._builds_hash_index:
+            self.hash_index = aol_mod.get_hash_index(aol[:self.length])
+        self._delta = {}
+        self.update()
+
+    def update(self):
+        """Index the appendables appended to the AOL since the last update."""
+        max_time = self.max_times[-1] if self.max_times else None
+        for position in range(self.length, len(self.aol)):
+            appendable = self.aol[position]
+            time = appendable.quad[3]
+            if max_time is None or time > max_time:
+                max_time = time
+            self.max_times.append(max_time)
+            if self._builds_hash_index:
+                self.hash_index[appendable.integrated_hash] = position
+            aol_mod.fold_quad(self._delta, appendable.quad)
+            self.length = position + 1
+            if self.length % self.snapshot_interval == 0:
+                self.deltas.append(self._delta)
+                self._delta = {}
+
+    def get_length_as_of(self, timestamp):
+        """Return the length of the longest prefix of the AOL whose quads all
+        have times no later than ISO-8601 timestamp ``timestamp``.
+        """
+        return bisect_right(self.max_times, timestamp)
+
+    def entities_as_of_length(self, length):
+        """Return the fold (see ``dtaoldm.aol.fold_aol``) of the first
+        ``length`` appendables of the AOL, starting from the latest snapshot
+        at or before ``length``.
+        """
+        snapshot_index = min(length // self.snapshot_interval,
+                             len(self.deltas))
+        entities = aol_mod.merge_folds(self.deltas[:snapshot_index])
+        for position in range(snapshot_index * self.snapshot_interval,
+                              length):
+            aol_mod.fold_quad(entities, self.aol[position].quad)
+        return entities
+
+    def as_of_length(self, length):
+        """Return the domain entities encoded by the first ``length``
+        appendables of the AOL.
+        """
+        return aol_mod.entities_to_domain_entities(
+            self.entities_as_of_length(length), self.domain_constructors)
+
+    def as_of(self, timestamp):
+        """Return the domain entities encoded by the AOL as of ISO-8601
+        timestamp ``timestamp``.
+        """
+        return self.as_of_length(self.get_length_as_of(timestamp))
+
+    def as_of_hash(self, integrated_hash):
+        """Return a "maybe" 2-tuple whose first element is the domain entities
+        encoded by the prefix of the AOL that ends with the appendable with
+        integrated hash ``integrated_hash``.
+        """
+        position = self.hash_index.get(integrated_hash)
+        if position is None:
+            return None, UNKNOWN_HASH_ERR
+        return self.as_of_length(position + 1), None
+
+
+def get_history_path(file_path):
+    return f'{file_path}{HISTORY_SUFFIX}'
+
+
+def persist_history(history, file_path):
+    """Atomically write the snapshots of ``history`` and the time index of the
+    appendables that they cover next to the AOL file at ``file_path``.
+    """
+    length = len(history.deltas) * history.snapshot_interval
+    history_path = get_history_path(file_path)
+    tmp_path = f'{history_path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(aol_mod.get_json({
+            'snapshot_interval': history.snapshot_interval,
+            'tip_hash': (history.aol[length - 1].integrated_hash if length
+                         else None),
+            'max_times': history.max_times[:length],
+            'deltas': history.deltas}))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, history_path)
+
+
+def load_history(aol, file_path, domain_constructors,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+    """Return the ``AOLHistory`` of ``aol``, the AOL in the file at
+    ``file_path`` (usually as a ``dtaoldm.lazy.LazyAOL``), starting from the
+    snapshots persisted next to that file. They are ignored if there are
+    none, if they were taken at another interval, or if ``aol`` does not
+    start with the appendables that they cover.
+    """
+    history_path = get_history_path(file_path)
+    if os.path.isfile(history_path):
+        with open(history_path, 'r') as fh:
+            persisted = aol_mod.parse_json(fh.read())
+        length = len(persisted['max_times'])
+        if (persisted['snapshot_interval'] == snapshot_interval and
+                length <= len(aol) and
+                (aol[length - 1].integrated_hash if length else None) ==
+                persisted['tip_hash']):
+            return AOLHistory(aol, domain_constructors,
+                              snapshot_interval=snapshot_interval,
+                              deltas=persisted['deltas'],
+                              max_times=persisted['max_times'])
+    return AOLHistory(aol, domain_constructors,
+                      snapshot_interval=snapshot_interval)
@@ -0,0 +1,106 @@
+"""Lazy Append-only Log
+
+A read-only, memory-mapped view of an AOL file that can be used wherever an
+in-memory AOL (a list of Appendable instances, as returned by
+``dtaoldm.aol.get_aol``) is expected.
+
+``get_aol`` parses every line of the AOL file up front, so its memory use grows
+with the size of the log. A ``LazyAOL`` instead memory-maps the file and uses
+the byte offsets in the hash index sidecar file (see
+``dtaoldm.aol.read_hash_index_file``) to parse an appendable only when it is
+accessed. Since the functions of ``dtaoldm.aol`` mostly look at the end of an
+AOL (e.g., ``get_tip_hash`` uses ``aol[-1]``), they typically parse only a
+handful of lines::
+
+    >>> with LazyAOL('path/to/aol.txt') as lazy_aol:
+    ...     merged, err = aol_mod.merge_aols(lazy_aol, mergee)
+    ...     aol_mod.persist_aol(merged, 'path/to/aol.txt')
+
+A ``LazyAOL`` reflects the AOL file as it was when it was opened. Appendables
+appended to it (e.g., by ``merge_aols``) are kept in memory, not written to the
+file, until the ``LazyAOL`` is persisted with ``dtaoldm.aol.persist_aol``.
+"""
+
+from array import array
+from collections.abc import Sequence
+import mmap
+import os
+
+import dtaoldm.aol as aol_mod
+
+
+class LazyAOL(Sequence):
+    """A lazy sequence of the Appendable instances of the AOL file at
+    ``file_path``. Indexing returns a single appendable; slicing returns a list
+    of appendables.
+    """
+
+    def __init__(self, file_path):
+        if not os.path.isfile(file_path):
+            aol_mod.persist_aol([], file_path)
+        positions, offsets = aol_mod.read_hash_index_file(file_path)
+        self.file_path = file_path
+        self._positions = positions
+        self._offsets = array('q', offsets)
+        self._size = os.path.getsize(file_path)
+        self._appended = []
+        self._fh = open(file_path, 'rb')
+        self._mmap = None
+        if self._size:
+            self._mmap = mmap.mmap(
+                self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def hash_index(self):
+        """The hash index of the AOL (see ``dtaoldm.aol.get_hash_index``), as
+        read from the sidecar index file and extended by any appendables
+        appended in memory.
+        """
+        return self._positions
+
+    def _parse(self, position):
+        """Parse the appendable on line ``position`` of the AOL file."""
+        start = self._offsets[position]
+        if position + 1 < len(self._offsets):
+            end = self._offsets[position + 1]
+        else:
+            end = self._size
+        return aol_mod.parse_appendable(self._mmap[start:end].decode('utf8'))
+
+    def __len__(self):
+        return len(self._offsets) + len(self._appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('AOL index out of range')
+        if index < len(self._offsets):
+            return self._parse(index)
+        return self._appended[index - len(self._offsets)]
+
+    def __iter__(self):
+        for position in range(len(self._offsets)):
+            yield self._parse(position)
+        yield from self._appended
+
+    def append(self, appendable):
+        self._positions[appendable.integrated_hash] = len(self)
+        self._appended.append(appendable)
+
+    def extend(self, appendables):
+        for appendable in appendables:
+            self.append(appendable)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
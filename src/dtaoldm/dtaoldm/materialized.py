@@ -0,0 +1,343 @@
+"""Materialized Domain Entities
+
+Functionality for maintaining the domain entities encoded by an append-only log
+incrementally, instead of re-folding the entire log with
+``dtaoldm.aol.aol_to_domain_entities`` every time they are needed.
+
+A ``DomainEntitiesView`` stores the folded entity state of an AOL together with
+the integrated hash of the tip of the AOL that it reflects. Updating the view
+only folds the appendables that come after that tip, and only the domain
+entities touched by those appendables are re-constructed (and re-validated).
+
+Views can be checkpointed to a JSON file next to the AOL file (at
+``<AOL_PATH>.view.json``) so that a cold start only needs to fold the
+appendables written since the checkpoint::
+
+    >>> view = load_checkpoint(aol_path, domain.CONSTRUCTORS)
+    >>> err = view.update_from_file(aol_path)
+    >>> view.domain_entities
+    {'old-instances': {OLDInstance(...), ...}, ...}
+    >>> persist_checkpoint(view, aol_path)
+
+An ``EAVIndex`` is maintained the same way but indexes the current value of
+each (entity, attribute) pair and the entities that have each (attribute,
+value) pair, for point queries::
+
+    >>> index = EAVIndex()
+    >>> err = index.update_from_file(aol_path)
+    >>> index.current_value(old_instance_id, 'has-state')
+    'synced'
+    >>> index.entities_with('is-a', 'old-instance')
+    {'9bc38782-99f8-4371-8b70-25c2e36c6802', ...}
+
+An ``EAVIndex`` is checkpointed the same way, at ``<AOL_PATH>.eav.json``
+(see ``load_eav_index_checkpoint``). Both kinds of view can be kept up to date
+by an ``dtaoldm.writer.AOLWriter`` as it appends (see ``AOLWriter.add_view``),
+which checkpoints them when it is closed.
+"""
+
+import abc
+import os
+
+import dtaoldm.aol as aol_mod
+
+
+CHECKPOINT_SUFFIX = '.view.json'
+EAV_CHECKPOINT_SUFFIX = '.eav.json'
+
+DIVERGED_ERR = ('The AOL does not contain the tip of the view; the view must'
+                ' be rebuilt from scratch.')
+
+
+class MaterializedView(abc.ABC):
+    """Base class of the views of an append-only log that are maintained
+    incrementally. A view records the integrated hash of the tip of the AOL
+    prefix that it reflects; subclasses implement ``apply_quad`` and
+    ``get_checkpoint_data`` and name the ``checkpoint_suffix`` of their
+    checkpoint files (see ``persist_checkpoint``).
+
+    :param str tip_hash: integrated hash of the last applied appendable.
+    :param int length: number of applied appendables.
+    :param int offset: when the view was last updated from an AOL file, the byte
+      offset in that file of the line of the last applied appendable.
+    """
+
+    checkpoint_suffix = None
+
+    def __init__(self, tip_hash=None, length=0, offset=None):
+        self.tip_hash = tip_hash
+        self.length = length
+        self.offset = offset
+
+    @abc.abstractmethod
+    def apply_quad(self, quad):
+        """Apply EAVT quad ``quad`` to the state of the view."""
+
+    @abc.abstractmethod
+    def get_checkpoint_data(self):
+        """Return a JSON-serializable dict of the state of the view, which is
+        checkpointed along with its tip (see ``persist_checkpoint``).
+        """
+
+    def apply(self, appendables):
+        """Apply ``appendables``, which must directly follow the tip of the
+        view, to the view.
+        """
+        for appendable in appendables:
+            self.apply_quad(appendable.quad)
+            self.tip_hash = appendable.integrated_hash
+            self.length += 1
+            self.offset = None
+
+    def update(self, aol, hash_index=None):
+        """Apply the appendables of ``aol`` that come after the tip of the view
+        to the view. Return an error string if ``aol`` does not contain the tip
+        of the view, else ``None``.
+        """
+        if self.tip_hash is not None:
+            if hash_index is None:
+                hash_index = aol_mod.get_hash_index(aol)
+            if self.tip_hash not in hash_index:
+                return DIVERGED_ERR
+        self.apply(aol_mod.get_new_appendables(
+            aol, self.tip_hash, hash_index=hash_index))
+        return None
+
+    def update_from_file(self, file_path):
+        """Apply the appendables in the AOL file at ``file_path`` that come
+        after the tip of the view to the view, reading only those appendables
+        from disk. Return an error string if the AOL does not contain the tip
+        of the view, else ``None``.
+        """
+        offset = self._find_tip_offset(file_path)
+        if offset is False:
+            return DIVERGED_ERR
+        with open(file_path, 'rb') as fh:
+            if offset is None:
+                offset = 0
+            else:
+                fh.seek(offset)
+                self.offset = offset
+                offset += len(fh.readline())  # the tip line
+            for line in fh:
+                line_str = line.decode('utf8')
+                if line.strip() and not aol_mod.is_header_line(line_str):
+                    self.apply([aol_mod.parse_appendable(line_str)])
+                    self.offset = offset
+                offset += len(line)
+        return None
+
+    def _find_tip_offset(self, file_path):
+        """Return the byte offset of the line of the tip of the view in the AOL
+        file at ``file_path``, ``None`` if the view is empty, or ``False`` if the
+        AOL does not contain the tip.
+        """
+        if self.tip_hash is None:
+            return None
+        if self.offset is not None:
+            with open(file_path, 'rb') as fh:
+                fh.seek(self.offset)
+                line = fh.readline()
+            if (line.strip() and
+                    aol_mod.parse_appendable(line.decode('utf8'))
+                    .integrated_hash == self.tip_hash):
+                return self.offset
+        positions, offsets = aol_mod.read_hash_index_file(file_path)
+        position = positions.get(self.tip_hash)
+        if position is None:
+            return False
+        return offsets[position]
+
+
+class DomainEntitiesView(MaterializedView):
+    """The domain entities encoded by a prefix of an append-only log.
+
+    :param dict domain_constructors: map from entity types to domain entity
+      constructors, e.g., ``dtaoldm.domain.CONSTRUCTORS``.
+    :param dict entities: folded entity state (see ``dtaoldm.aol.fold_quad``).
+
+    The remaining parameters are those of ``MaterializedView``.
+    """
+
+    checkpoint_suffix = CHECKPOINT_SUFFIX
+
+    def __init__(self, domain_constructors, entities=None, tip_hash=None,
+                 length=0, offset=None):
+        super().__init__(tip_hash=tip_hash, length=length, offset=offset)
+        self.domain_constructors = domain_constructors
+        self.entities = entities if entities is not None else {}
+        self._constructed = {}
+        self._stale = set(self.entities)
+
+    def apply_quad(self, quad):
+        self._stale.add(aol_mod.fold_quad(self.entities, quad))
+
+    def get_checkpoint_data(self):
+        return {'entities': self.entities}
+
+    @property
+    def domain_entities(self):
+        """Return a dict from domain entity types (pluralized strings, e.g.,
+        'old-instances') to sets of domain entity namedtuples, as
+        ``dtaoldm.aol.aol_to_domain_entities`` does. Only the entities changed
+        since the last call are constructed anew.
+        """
+        for entity_id in self._stale:
+            self._constructed[entity_id] = aol_mod.construct_domain_entity(
+                self.entities[entity_id], self.domain_constructors)
+        self._stale = set()
+        ret = {f'{k}s': set() for k in self.domain_constructors}
+        for constructed in self._constructed.values():
+            if constructed:
+                key, domain_entity = constructed
+                ret[key].add(domain_entity)
+        return ret
+
+
+class EAVIndex(MaterializedView):
+    """Indexes of the current state of the entities encoded by a prefix of an
+    append-only log, for point queries that do not require folding the log:
+
+    - ``eavt``: a dict from entity IDs to dicts from attributes to the
+      (value, time) 2-tuple of the latest quad with that entity and attribute.
+    - ``avet``: a dict from (attribute, value) 2-tuples to the sets of the IDs
+      of the entities whose current value for that attribute is that value.
+
+    Attributes and values are those of the quads, e.g.,
+    ``index.entities_with('is-a', 'old-instance')``. Values that are not
+    hashable are indexed under their JSON serialization. Asserting that an
+    entity has (lacks) being retracts any assertion that it lacks (has) being,
+    so ``entities_with('has', 'being')`` returns the extant entities.
+
+    :param dict eavt: initial ``eavt`` index, e.g., from a checkpoint; the
+      ``avet`` index is derived from it.
+
+    The remaining parameters are those of ``MaterializedView``.
+    """
+
+    checkpoint_suffix = EAV_CHECKPOINT_SUFFIX
+
+    def __init__(self, eavt=None, tip_hash=None, length=0, offset=None):
+        super().__init__(tip_hash=tip_hash, length=length, offset=offset)
+        self.eavt = {}
+        self.avet = {}
+        for entity, attributes in (eavt or {}).items():
+            self.eavt[entity] = {}
+            for attribute, (value, time) in attributes.items():
+                self.eavt[entity][attribute] = (value, time)
+                self.avet.setdefault(
+                    (attribute, get_value_key(value)), set()).add(entity)
+
+    def _retract(self, entity, attributes, attribute):
+        value, _ = attributes.pop(attribute)
+        key = (attribute, get_value_key(value))
+        entities = self.avet[key]
+        entities.discard(entity)
+        if not entities:
+            del self.avet[key]
+
+    def apply_quad(self, quad):
+        entity, attribute, value, time = quad
+        attributes = self.eavt.setdefault(entity, {})
+        if attribute in attributes:
+            self._retract(entity, attributes, attribute)
+        if (attribute, value) in aol_mod.BEING_PREDS:
+            opposite = (aol_mod.LACKS_ATTR if attribute == aol_mod.HAS_ATTR
+                        else aol_mod.HAS_ATTR)
+            if attributes.get(opposite, (None,))[0] == aol_mod.BEING_VAL:
+                self._retract(entity, attributes, opposite)
+        attributes[attribute] = (value, time)
+        self.avet.setdefault(
+            (attribute, get_value_key(value)), set()).add(entity)
+
+    def get_checkpoint_data(self):
+        return {'eavt': self.eavt}
+
+    def current_value(self, entity, attribute, default=None):
+        """Return the current value of ``attribute`` for ``entity``, or
+        ``default`` if the entity has never had that attribute.
+        """
+        return self.eavt.get(entity, {}).get(attribute, (default,))[0]
+
+    def current_attributes(self, entity):
+        """Return a dict from the attributes of ``entity`` to their current
+        values.
+        """
+        return {attribute: value for attribute, (value, _) in
+                self.eavt.get(entity, {}).items()}
+
+    def entities_with(self, attribute, value):
+        """Return the set of the IDs of the entities whose current value for
+        ``attribute`` is ``value``.
+        """
+        return set(self.avet.get((attribute, get_value_key(value)), ()))
+
+
+def get_value_key(value):
+    """Return ``value`` if it is hashable, else its JSON serialization."""
+    try:
+        hash(value)
+    except TypeError:
+        return aol_mod.get_json(value)
+    return value
+
+
+def get_checkpoint_path(file_path, suffix=CHECKPOINT_SUFFIX):
+    return f'{file_path}{suffix}'
+
+
+def persist_checkpoint(view, file_path):
+    """Atomically write a checkpoint of ``view`` next to the AOL file at
+    ``file_path``, at the path given by the view's ``checkpoint_suffix``.
+    """
+    checkpoint_path = get_checkpoint_path(file_path, view.checkpoint_suffix)
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(aol_mod.get_json({
+            'tip_hash': view.tip_hash,
+            'length': view.length,
+            'offset': view.offset,
+            **view.get_checkpoint_data()}))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+def read_checkpoint(file_path, suffix):
+    """Return the checkpoint with ``suffix`` next to the AOL file at
+    ``file_path`` as a dict, or ``None`` if there is no such checkpoint.
+    """
+    checkpoint_path = get_checkpoint_path(file_path, suffix)
+    if not os.path.isfile(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as fh:
+        return aol_mod.parse_json(fh.read())
+
+
+def load_checkpoint(file_path, domain_constructors):
+    """Return the ``DomainEntitiesView`` checkpointed next to the AOL file at
+    ``file_path``, or an empty view if there is no checkpoint.
+    """
+    checkpoint = read_checkpoint(file_path, CHECKPOINT_SUFFIX)
+    if checkpoint is None:
+        return DomainEntitiesView(domain_constructors)
+    return DomainEntitiesView(
+        domain_constructors,
+        entities=checkpoint['entities'],
+        tip_hash=checkpoint['tip_hash'],
+        length=checkpoint['length'],
+        offset=checkpoint['offset'])
+
+
+def load_eav_index_checkpoint(file_path):
+    """Return the ``EAVIndex`` checkpointed next to the AOL file at
+    ``file_path``, or an empty index if there is no checkpoint.
+    """
+    checkpoint = read_checkpoint(file_path, EAV_CHECKPOINT_SUFFIX)
+    if checkpoint is None:
+        return EAVIndex()
+    return EAVIndex(
+        eavt=checkpoint['eavt'],
+        tip_hash=checkpoint['tip_hash'],
+        length=checkpoint['length'],
+        offset=checkpoint['offset'])
@@ -0,0 +1,449 @@
+"""Segmented Append-only Log
+
+Functionality for persisting an append-only log across multiple fixed-size
+"segment" files instead of a single monolithic JSON-lines file.
+
+A segmented AOL is a directory containing:
+
+1. a manifest file (``manifest.json``) and
+2. one or more segment files (``segment-000000.txt``, ``segment-000001.txt``,
+   etc.), each of which uses the same JSON-lines format as the files written by
+   ``dtaoldm.aol.persist_aol`` or, once it has been closed and converted with
+   ``convert_segments_to_binary``, the binary format of ``dtaoldm.binary``
+   (``segment-000000.bin``, etc.)
+
+The manifest records the maximum number of lines per segment, the digest used
+to compute the hashes of the log (see ``dtaoldm.aol.DIGESTS``) and, for each
+segment, its file name, the integrated hashes of its first and last
+appendables, its line count, the byte length of its file and its format::
+
+    {"segment_size": 100000,
+     "digest": "md5",
+     "segments": [
+         {"file_name": "segment-000000.txt",
+          "first_hash": "7d1c...",
+          "last_hash": "3ab0...",
+          "line_count": 100000,
+          "byte_length": 21400000,
+          "format": "jsonl"},
+         {"file_name": "segment-000001.txt",
+          "first_hash": "0e9f...",
+          "last_hash": "c52d...",
+          "line_count": 1234,
+          "byte_length": 264076,
+          "format": "jsonl"}]}
+
+Only the last segment (the "active" segment) is ever written to; once a segment
+is full, it is never modified again. Getting the tip hash or the length of a
+segmented AOL only requires reading the manifest, and appending only touches
+the active segment and the manifest.
+
+A segment file is written before the manifest, so a crash in between can
+leave lines (possibly a torn one) at the end of the active segment that the
+manifest does not count. Readers only read the first ``line_count`` lines of a
+segment, and the segment file is truncated to the ``byte_length`` recorded in
+the manifest before it is appended to.
+
+Each closed segment also carries a Bloom filter of its integrated hashes (see
+``dtaoldm.bloom``) in a sidecar file named after it (``segment-000000.bloom``).
+``find_segmented_changes`` uses them to locate the point where another AOL
+forks from a segmented AOL with a binary search that only reads the segments
+whose filters may contain the probed hashes.
+"""
+
+from collections import namedtuple
+import itertools
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.binary as binary
+import dtaoldm.bloom as bloom_mod
+
+
+MANIFEST_FILE_NAME = 'manifest.json'
+DEFAULT_SEGMENT_SIZE = 100000
+
+JSONL_FORMAT = 'jsonl'
+BINARY_FORMAT = 'binary'
+SEGMENT_FILE_EXTENSIONS = {
+    JSONL_FORMAT: 'txt',
+    BINARY_FORMAT: 'bin',
+}
+BLOOM_FILE_EXTENSION = 'bloom'
+
+
+Segment = namedtuple(
+    'Segment', (
+        'file_name',  # name of the segment file, relative to the AOL directory
+        'first_hash',  # integrated hash of the first appendable in the segment
+        'last_hash',  # integrated hash of the last appendable in the segment
+        'line_count',  # number of appendables in the segment
+        'byte_length',  # size of the segment file covered by the manifest
+        'format',  # format of the segment file, "jsonl" or "binary"
+    ))
+
+
+Manifest = namedtuple(
+    'Manifest', (
+        'segment_size',  # maximum number of appendables per segment
+        'digest',  # name of the digest used by the log, e.g., "md5"
+        'segments',  # tuple of ``Segment`` instances, in log order
+    ))
+
+
+def get_segment_file_name(segment_index, segment_format=JSONL_FORMAT):
+    extension = SEGMENT_FILE_EXTENSIONS[segment_format]
+    return f'segment-{segment_index:06d}.{extension}'
+
+
+def get_next_segment_index(manifest):
+    """Return the index to name the next new segment of ``manifest`` with,
+    which follows the index in the file name of its last segment.
+    """
+    if not manifest.segments:
+        return 0
+    file_name = manifest.segments[-1].file_name
+    return int(file_name.split('-')[1].split('.')[0]) + 1
+
+
+def get_manifest_path(dir_path):
+    return os.path.join(dir_path, MANIFEST_FILE_NAME)
+
+
+def get_segment_path(dir_path, segment):
+    return os.path.join(dir_path, segment.file_name)
+
+
+def serialize_manifest(manifest):
+    return aol_mod.get_json({
+        'segment_size': manifest.segment_size,
+        'digest': manifest.digest,
+        'segments': [segment._asdict() for segment in manifest.segments]})
+
+
+def parse_manifest(string):
+    manifest = aol_mod.parse_json(string)
+    return Manifest(
+        segment_size=manifest['segment_size'],
+        digest=manifest.get('digest', aol_mod.DEFAULT_DIGEST),
+        segments=tuple(Segment(**{'format': JSONL_FORMAT,
+                                  'byte_length': None,
+                                  **segment})
+                       for segment in manifest['segments']))
+
+
+def write_manifest(manifest, dir_path):
+    """Atomically write ``manifest`` to the segmented AOL at ``dir_path``.
+
+    The manifest is written to a temporary file which then replaces the
+    existing manifest so that readers never observe a partially written one.
+    """
+    manifest_path = get_manifest_path(dir_path)
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(serialize_manifest(manifest))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, manifest_path)
+
+
+def get_manifest(dir_path, segment_size=None, digest=None):
+    """Return the manifest of the segmented AOL at ``dir_path``. If there is no
+    segmented AOL at ``dir_path``, create an empty one that uses ``digest``.
+    """
+    manifest_path = get_manifest_path(dir_path)
+    if not os.path.isfile(manifest_path):
+        os.makedirs(dir_path, exist_ok=True)
+        manifest = Manifest(
+            segment_size=segment_size or DEFAULT_SEGMENT_SIZE,
+            digest=digest or aol_mod.DEFAULT_DIGEST,
+            segments=())
+        write_manifest(manifest, dir_path)
+        return manifest
+    with open(manifest_path, 'r') as fh:
+        return parse_manifest(fh.read())
+
+
+def get_segmented_tip_hash(dir_path):
+    """Return the integrated hash at the tip of the segmented AOL at
+    ``dir_path``, or ``None`` if it is empty. Only the manifest is read.
+    """
+    segments = get_manifest(dir_path).segments
+    if not segments:
+        return None
+    return segments[-1].last_hash
+
+
+def get_segmented_aol_length(dir_path):
+    """Return the number of appendables in the segmented AOL at ``dir_path``.
+    Only the manifest is read.
+    """
+    return sum(segment.line_count for segment in
+               get_manifest(dir_path).segments)
+
+
+def get_empty_segment(segment_index):
+    """Return the ``Segment`` of a new, empty JSON-lines segment file."""
+    return Segment(
+        file_name=get_segment_file_name(segment_index),
+        first_hash=None,
+        last_hash=None,
+        line_count=0,
+        byte_length=0,
+        format=JSONL_FORMAT)
+
+
+def get_committed_byte_length(dir_path, segment):
+    """Return the number of bytes at the start of the segment file of
+    ``segment`` that the manifest covers. Manifests written before byte lengths
+    were recorded lack them, in which case the first ``line_count`` lines of
+    the file are measured.
+    """
+    if segment.byte_length is not None:
+        return segment.byte_length
+    with open(get_segment_path(dir_path, segment), 'rb') as fh:
+        return sum(len(line) for line in
+                   itertools.islice(fh, segment.line_count))
+
+
+def write_to_segment(dir_path, segment, appendables):
+    """Append ``appendables`` to the segment file of ``segment`` and return the
+    updated ``Segment``. Any bytes after the end of the segment as recorded in
+    the manifest (e.g., lines written before a crash) are truncated first.
+    """
+    byte_length = get_committed_byte_length(dir_path, segment)
+    with open(get_segment_path(dir_path, segment), 'ab') as fh:
+        fh.truncate(byte_length)
+        for appendable in appendables:
+            line = aol_mod.serialize_appendable(appendable).encode('utf8')
+            fh.write(line)
+            byte_length += len(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+    return segment._replace(
+        first_hash=segment.first_hash or appendables[0].integrated_hash,
+        last_hash=appendables[-1].integrated_hash,
+        line_count=segment.line_count + len(appendables),
+        byte_length=byte_length)
+
+
+def append_to_segmented_aol(appendables, dir_path):
+    """Append the sequence of (already chained) ``appendables`` to the
+    segmented AOL at ``dir_path``, rotating to a new segment whenever the active
+    segment is full. Return the updated manifest.
+    """
+    manifest = get_manifest(dir_path)
+    segments = list(manifest.segments)
+    appendables = list(appendables)
+    while appendables:
+        if (not segments or
+                segments[-1].line_count >= manifest.segment_size):
+            segments.append(get_empty_segment(get_next_segment_index(
+                manifest._replace(segments=segments))))
+        active = segments[-1]
+        room = manifest.segment_size - active.line_count
+        batch, appendables = appendables[:room], appendables[room:]
+        segments[-1] = write_to_segment(dir_path, active, batch)
+        if segments[-1].line_count >= manifest.segment_size:
+            write_segment_bloom(dir_path, segments[-1])
+    manifest = manifest._replace(segments=tuple(segments))
+    write_manifest(manifest, dir_path)
+    return manifest
+
+
+def persist_segmented_aol(aol, dir_path, segment_size=None, digest=None):
+    """Write the append-only log ``aol`` to the segmented AOL at ``dir_path``.
+
+    This is the segmented analogue of ``dtaoldm.aol.persist_aol``: only the
+    appendables in ``aol`` that come after the segmented AOL's tip are written.
+    The ``segment_size`` and ``digest`` are only used if the segmented AOL does
+    not exist yet.
+    """
+    get_manifest(dir_path, segment_size=segment_size, digest=digest)
+    return append_to_segmented_aol(
+        aol_mod.get_new_appendables(aol, get_segmented_tip_hash(dir_path)),
+        dir_path)
+
+
+def is_segment_closed(manifest, segment_index):
+    """Return ``True`` if the segment at ``segment_index`` in ``manifest`` will
+    never be written to again.
+    """
+    return (segment_index < len(manifest.segments) - 1 or
+            manifest.segments[segment_index].line_count >=
+            manifest.segment_size)
+
+
+def convert_segments_to_binary(dir_path):
+    """Convert the closed JSON-lines segments of the segmented AOL at
+    ``dir_path`` to the compact binary format of ``dtaoldm.binary``. Return the
+    updated manifest.
+
+    Each segment is converted by writing its binary file, then pointing the
+    manifest at it and only then removing its JSON-lines file, so that the
+    manifest always references a complete segment file.
+    """
+    manifest = get_manifest(dir_path)
+    for segment_index, segment in enumerate(manifest.segments):
+        if (segment.format == BINARY_FORMAT or
+                not is_segment_closed(manifest, segment_index)):
+            continue
+        stem = os.path.splitext(segment.file_name)[0]
+        extension = SEGMENT_FILE_EXTENSIONS[BINARY_FORMAT]
+        converted = segment._replace(
+            file_name=f'{stem}.{extension}',
+            format=BINARY_FORMAT)
+        binary.write_binary_aol(
+            list(iter_segment(dir_path, segment)),
+            get_segment_path(dir_path, converted))
+        converted = converted._replace(byte_length=os.path.getsize(
+            get_segment_path(dir_path, converted)))
+        segments = list(manifest.segments)
+        segments[segment_index] = converted
+        manifest = manifest._replace(segments=tuple(segments))
+        write_manifest(manifest, dir_path)
+        os.remove(get_segment_path(dir_path, segment))
+    return manifest
+
+
+def iter_segment(dir_path, segment):
+    """Yield the ``Appendable`` instances stored in ``segment``. Only the first
+    ``line_count`` lines of its file are read.
+    """
+    if segment.format == BINARY_FORMAT:
+        yield from itertools.islice(
+            binary.iter_binary_aol(get_segment_path(dir_path, segment)),
+            segment.line_count)
+        return
+    with open(get_segment_path(dir_path, segment), 'r') as fh:
+        for line in itertools.islice(fh, segment.line_count):
+            yield aol_mod.parse_appendable(line)
+
+
+def iter_segment_hashes(dir_path, segment):
+    """Yield the integrated hashes of the appendables in ``segment``. The
+    hashes of a JSON-lines segment are sliced off the ends of its lines
+    without parsing them.
+    """
+    if segment.format == BINARY_FORMAT:
+        yield from aol_mod.get_hashes(iter_segment(dir_path, segment))
+        return
+    with open(get_segment_path(dir_path, segment), 'r') as fh:
+        for line in itertools.islice(fh, segment.line_count):
+            yield line.rsplit('"', 2)[-2]
+
+
+def iter_segmented_aol(dir_path):
+    """Yield all of the ``Appendable`` instances of the segmented AOL at
+    ``dir_path``, in log order.
+    """
+    for segment in get_manifest(dir_path).segments:
+        yield from iter_segment(dir_path, segment)
+
+
+def get_segmented_aol(dir_path):
+    """Read the segmented AOL at ``dir_path`` to a list of Appendable
+    instances.
+    """
+    return list(iter_segmented_aol(dir_path))
+
+
+def tail_segmented_aol(dir_path, n):
+    """Return the last ``n`` appendables of the segmented AOL at ``dir_path``.
+    Only the segments that contain those appendables are read, which in the
+    common case is just the active segment.
+    """
+    if n <= 0:
+        return []
+    needed = []
+    count = 0
+    for segment in reversed(get_manifest(dir_path).segments):
+        needed.append(segment)
+        count += segment.line_count
+        if count >= n:
+            break
+    tail = []
+    for segment in reversed(needed):
+        tail.extend(iter_segment(dir_path, segment))
+    return tail[-n:]
+
+
+# ==============================================================================
+# Bloom Filters & Fork Point Search
+# ==============================================================================
+
+def get_bloom_path(dir_path, segment):
+    """Return the path of the Bloom filter sidecar file of ``segment``, which
+    is named after the segment file's stem and so survives its conversion to
+    the binary format.
+    """
+    stem = os.path.splitext(segment.file_name)[0]
+    return os.path.join(dir_path, f'{stem}.{BLOOM_FILE_EXTENSION}')
+
+
+def write_segment_bloom(dir_path, segment):
+    """Build the Bloom filter of the integrated hashes of ``segment``, write it
+    to its sidecar file and return it.
+    """
+    bloom = bloom_mod.build_bloom(list(iter_segment_hashes(dir_path, segment)))
+    bloom_mod.write_bloom_file(bloom, get_bloom_path(dir_path, segment))
+    return bloom
+
+
+def get_segment_bloom(dir_path, segment):
+    """Return the Bloom filter of ``segment``, building its sidecar file first
+    if it is missing.
+    """
+    bloom_path = get_bloom_path(dir_path, segment)
+    if not os.path.isfile(bloom_path):
+        return write_segment_bloom(dir_path, segment)
+    return bloom_mod.read_bloom_file(bloom_path)
+
+
+def get_segmented_contains(dir_path):
+    """Return a predicate that is true of the integrated hashes in the
+    segmented AOL at ``dir_path`` (as of the call).
+
+    A hash is looked up in the closed segments whose Bloom filters may
+    contain it, and in the active segment. The hashes of a segment are only
+    read the first time it has to be searched, and the filters the first time
+    the predicate is called, after which they are cached by the predicate.
+    """
+    manifest = get_manifest(dir_path)
+    blooms = {}
+    segment_hashes = {}
+
+    def contains(integrated_hash):
+        for segment_index in range(len(manifest.segments) - 1, -1, -1):
+            segment = manifest.segments[segment_index]
+            if integrated_hash in (segment.first_hash, segment.last_hash):
+                return True
+            if is_segment_closed(manifest, segment_index):
+                bloom = blooms.get(segment_index)
+                if bloom is None:
+                    bloom = blooms[segment_index] = get_segment_bloom(
+                        dir_path, segment)
+                if not bloom_mod.bloom_contains(bloom, integrated_hash):
+                    continue
+            hashes = segment_hashes.get(segment_index)
+            if hashes is None:
+                hashes = segment_hashes[segment_index] = set(
+                    iter_segment_hashes(dir_path, segment))
+            if integrated_hash in hashes:
+                return True
+        return False
+
+    return contains
+
+
+def find_segmented_changes(dir_path, mergee, aliases=None):
+    """Return the suffix of AOL ``mergee`` that is not in the segmented AOL at
+    ``dir_path``; the segmented analogue of ``dtaoldm.aol.find_changes``.
+
+    The fork point is found by binary search over ``mergee`` (see
+    ``dtaoldm.aol.get_fork_position``), so only a logarithmic number of hashes
+    is looked up, and each lookup only reads the segments whose Bloom filters
+    may contain it.
+    """
+    return aol_mod.find_changes_in(
+        get_segmented_contains(dir_path), mergee, aliases=aliases)
@@ -0,0 +1,366 @@
+"""Append-only Log Verification
+
+Functionality for proving the integrity of an AOL file, e.g., after a crash.
+
+Verifying an AOL means checking, for every appendable, that its hash is the
+hash of its quad and that its integrated hash is the hash of the integrated
+hash of the previous appendable paired with its hash (see
+``dtaoldm.aol.make_appendable``).
+
+Both checks only involve stored values, so the AOL is verified in blocks of
+``checkpoint_interval`` appendables which can be processed in parallel. Each
+block reports its first and last appendables, and the links between adjacent
+blocks are then checked sequentially.
+
+For each complete block, a checkpoint is stored in a sidecar file next to the
+AOL file (at ``<AOL_PATH>.chk``). A checkpoint records the position, byte
+offset and integrated hash of the last appendable of its block, the Merkle root
+of the integrated hashes of the block (the "block hash"), and a checkpoint hash
+that chains the block hashes of all checkpoints so far. Later verifications
+only check the appendables after the last checkpoint that still matches the
+AOL, unless a full verification is requested.
+
+Verification is also available from the command line::
+
+    $ dtaoldm-verify path/to/aol.txt --processes 4
+
+"""
+
+import argparse
+from collections import namedtuple
+import multiprocessing
+import os
+import sys
+
+import dtaoldm.aol as aol_mod
+
+
+CHECKPOINT_SUFFIX = '.chk'
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+
+
+Checkpoint = namedtuple(
+    'Checkpoint', (
+        'position',  # position of the last appendable of the block
+        'offset',  # byte offset of the line of that appendable
+        'integrated_hash',  # integrated hash of that appendable
+        'block_hash',  # Merkle root of the integrated hashes of the block
+        'checkpoint_hash',  # hash of (previous checkpoint hash, block hash)
+    ))
+
+
+BlockVerification = namedtuple(
+    'BlockVerification', (
+        'count',  # number of appendables in the block
+        'first_hash',  # hash of the first appendable
+        'first_integrated_hash',  # integrated hash of the first appendable
+        'last_integrated_hash',  # integrated hash of the last appendable
+        'last_offset',  # byte offset of the line of the last appendable
+        'block_hash',  # Merkle root of the integrated hashes of the block
+        'error_index',  # index in the block of the first invalid appendable
+        'error',  # description of the first invalid appendable, or None
+    ))
+
+
+UNPARSEABLE_ERR = 'cannot be parsed'
+BAD_HASH_ERR = 'has a hash that does not match its quad'
+BAD_INTEGRATED_HASH_ERR = ('has an integrated hash that does not match the'
+                           ' previous integrated hash and its hash')
+
+
+def get_verification_error(position, error):
+    return f'Appendable {position} {error}.'
+
+
+def get_merkle_root(hashes, digest=aol_mod.DEFAULT_DIGEST):
+    """Return the Merkle root of the sequence of hex digests ``hashes``: pairs
+    of adjacent hashes are hashed together, level by level, until one hash
+    remains. An unpaired last hash is carried up to the next level.
+    """
+    level = list(hashes)
+    if not level:
+        return None
+    while len(level) > 1:
+        next_level = [
+            aol_mod.get_hash(aol_mod.get_json(pair), digest=digest) for
+            pair in zip(level[::2], level[1::2])]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def get_checkpoint_hash(previous_checkpoint_hash, block_hash,
+                        digest=aol_mod.DEFAULT_DIGEST):
+    return aol_mod.get_hash(
+        aol_mod.get_json((previous_checkpoint_hash, block_hash)),
+        digest=digest)
+
+
+def verify_block(block):
+    """Verify the appendables of ``block``, a (file path, start, end, digest)
+    4-tuple where [``start``, ``end``) is a byte range of the AOL file at
+    ``file path`` that falls on line boundaries. Return a
+    ``BlockVerification``; the link from the previous block to the first
+    appendable is not checked.
+    """
+    file_path, start, end, digest = block
+    count = 0
+    first_hash = first_integrated_hash = previous_integrated_hash = None
+    last_offset = None
+    integrated_hashes = []
+    with open(file_path, 'rb') as fh:
+        fh.seek(start)
+        offset = start
+        while offset < end:
+            line = fh.readline()
+            if not line:
+                break
+            line_offset = offset
+            offset += len(line)
+            line = line.decode('utf8', errors='replace')
+            if not line.strip() or aol_mod.is_header_line(line):
+                continue
+            try:
+                quad, hash_, integrated_hash = aol_mod.parse_json(line)
+            except (ValueError, TypeError):
+                return BlockVerification(
+                    count, first_hash, first_integrated_hash,
+                    previous_integrated_hash, last_offset, None, count,
+                    UNPARSEABLE_ERR)
+            if hash_ != aol_mod.get_hash(aol_mod.get_json(quad),
+                                         digest=digest):
+                return BlockVerification(
+                    count, first_hash, first_integrated_hash,
+                    previous_integrated_hash, last_offset, None, count,
+                    BAD_HASH_ERR)
+            if count == 0:
+                first_hash = hash_
+                first_integrated_hash = integrated_hash
+            elif integrated_hash != aol_mod.get_hash(
+                    aol_mod.get_json((previous_integrated_hash, hash_)),
+                    digest=digest):
+                return BlockVerification(
+                    count, first_hash, first_integrated_hash,
+                    previous_integrated_hash, last_offset, None, count,
+                    BAD_INTEGRATED_HASH_ERR)
+            integrated_hashes.append(integrated_hash)
+            previous_integrated_hash = integrated_hash
+            last_offset = line_offset
+            count += 1
+    return BlockVerification(
+        count, first_hash, first_integrated_hash, previous_integrated_hash,
+        last_offset, get_merkle_root(integrated_hashes, digest=digest), None,
+        None)
+
+
+def get_blocks(file_path, start, block_size):
+    """Split the AOL file at ``file_path`` from byte offset ``start`` on into
+    byte ranges of ``block_size`` appendables (the last range may have fewer).
+    Return a list of (start, end) 2-tuples. Lines are not parsed.
+    """
+    blocks = []
+    with open(file_path, 'rb') as fh:
+        fh.seek(start)
+        block_start = offset = start
+        count = 0
+        for line in fh:
+            offset += len(line)
+            if not line.strip() or line.startswith(b'{'):
+                continue
+            count += 1
+            if count == block_size:
+                blocks.append((block_start, offset))
+                block_start = offset
+                count = 0
+        if block_start < offset:
+            blocks.append((block_start, offset))
+    return blocks
+
+
+# ==============================================================================
+# Checkpoint File
+# ==============================================================================
+
+def get_checkpoint_path(file_path):
+    return f'{file_path}{CHECKPOINT_SUFFIX}'
+
+
+def serialize_checkpoint(checkpoint):
+    return ' '.join(str(field) for field in checkpoint) + '\n'
+
+
+def parse_checkpoint(line):
+    position, offset, integrated_hash, block_hash, checkpoint_hash = (
+        line.split())
+    return Checkpoint(int(position), int(offset), integrated_hash, block_hash,
+                      checkpoint_hash)
+
+
+def write_checkpoint_file(checkpoints, file_path):
+    """Atomically (re-)write the checkpoint sidecar file of the AOL at
+    ``file_path`` so that it contains exactly ``checkpoints``.
+    """
+    checkpoint_path = get_checkpoint_path(file_path)
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        for checkpoint in checkpoints:
+            fh.write(serialize_checkpoint(checkpoint))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+def read_checkpoint_file(file_path):
+    """Return the list of checkpoints of the AOL at ``file_path``, or an empty
+    list if there is no checkpoint sidecar file.
+    """
+    checkpoint_path = get_checkpoint_path(file_path)
+    if not os.path.isfile(checkpoint_path):
+        return []
+    with open(checkpoint_path, 'r') as fh:
+        return [parse_checkpoint(line) for line in fh if line.strip()]
+
+
+def get_valid_checkpoints(checkpoints, file_path,
+                          digest=aol_mod.DEFAULT_DIGEST):
+    """Return the longest prefix of ``checkpoints`` whose checkpoint hashes
+    chain correctly and whose last checkpoint matches the AOL at ``file_path``,
+    i.e., the appendable at its offset has its integrated hash.
+    """
+    checkpoint_hash = None
+    chained = []
+    for checkpoint in checkpoints:
+        checkpoint_hash = get_checkpoint_hash(
+            checkpoint_hash, checkpoint.block_hash, digest=digest)
+        if checkpoint_hash != checkpoint.checkpoint_hash:
+            break
+        chained.append(checkpoint)
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as fh:
+        while chained:
+            checkpoint = chained[-1]
+            if checkpoint.offset < size:
+                fh.seek(checkpoint.offset)
+                line = fh.readline().decode('utf8', errors='replace')
+                try:
+                    if (aol_mod.parse_appendable(line).integrated_hash ==
+                            checkpoint.integrated_hash):
+                        return chained
+                except (ValueError, TypeError):
+                    pass
+            chained.pop()
+    return chained
+
+
+# ==============================================================================
+# Verification
+# ==============================================================================
+
+def verify_aol(file_path, processes=None,
+               checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, full=False):
+    """Verify the hashes and the hash chain of the AOL file at ``file_path``.
+
+    Only the appendables after the last valid checkpoint are verified, unless
+    ``full`` is ``True``. If ``processes`` is greater than 1, blocks are
+    verified in parallel by a pool of processes. Checkpoints are stored for
+    all newly verified complete blocks of ``checkpoint_interval`` appendables.
+
+    Return a "maybe" 2-tuple whose first element is the number of appendables
+    in the AOL that are known to be valid and whose second element describes
+    the first invalid appendable, if any.
+    """
+    digest = aol_mod.get_digest_in_file(file_path)
+    checkpoints = []
+    if not full:
+        checkpoints = get_valid_checkpoints(
+            read_checkpoint_file(file_path), file_path, digest=digest)
+    position = start = 0
+    previous_integrated_hash = checkpoint_hash = None
+    if checkpoints:
+        last = checkpoints[-1]
+        position = last.position + 1
+        previous_integrated_hash = last.integrated_hash
+        checkpoint_hash = last.checkpoint_hash
+        with open(file_path, 'rb') as fh:
+            fh.seek(last.offset)
+            start = last.offset + len(fh.readline())
+    blocks = [(file_path, block_start, block_end, digest) for
+              block_start, block_end in
+              get_blocks(file_path, start, checkpoint_interval)]
+    if processes and processes > 1 and len(blocks) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            verified, err = _check_blocks(
+                pool.imap(verify_block, blocks), position,
+                previous_integrated_hash, checkpoint_hash, checkpoints,
+                checkpoint_interval, digest)
+    else:
+        verified, err = _check_blocks(
+            map(verify_block, blocks), position, previous_integrated_hash,
+            checkpoint_hash, checkpoints, checkpoint_interval, digest)
+    write_checkpoint_file(checkpoints, file_path)
+    return verified, err
+
+
+def _check_blocks(verifications, position, previous_integrated_hash,
+                  checkpoint_hash, checkpoints, checkpoint_interval, digest):
+    """Check the links between the ``BlockVerification``s ``verifications``, in
+    log order, and extend ``checkpoints`` with the complete valid blocks.
+    Return a "maybe" 2-tuple of the number of valid appendables.
+    """
+    for verification in verifications:
+        if (verification.count and
+                verification.first_integrated_hash != aol_mod.get_hash(
+                    aol_mod.get_json((previous_integrated_hash,
+                                      verification.first_hash)),
+                    digest=digest)):
+            return position, get_verification_error(
+                position, BAD_INTEGRATED_HASH_ERR)
+        if verification.error:
+            error_position = position + verification.error_index
+            return error_position, get_verification_error(
+                error_position, verification.error)
+        position += verification.count
+        previous_integrated_hash = verification.last_integrated_hash
+        if verification.count == checkpoint_interval:
+            checkpoint_hash = get_checkpoint_hash(
+                checkpoint_hash, verification.block_hash, digest=digest)
+            checkpoints.append(Checkpoint(
+                position - 1, verification.last_offset,
+                verification.last_integrated_hash, verification.block_hash,
+                checkpoint_hash))
+    return position, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Verify the hashes and the hash chain of an append-only'
+                    ' log file.')
+    parser.add_argument('file_path', help='path to the AOL file')
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help='number of processes to verify blocks in parallel with')
+    parser.add_argument(
+        '--checkpoint-interval', type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help='number of appendables per checkpointed block')
+    parser.add_argument(
+        '--full', action='store_true',
+        help='ignore existing checkpoints and verify the entire log')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.file_path):
+        print(f'No AOL file at {args.file_path}.', file=sys.stderr)
+        return 2
+    verified, err = verify_aol(
+        args.file_path, processes=args.processes,
+        checkpoint_interval=args.checkpoint_interval, full=args.full)
+    if err:
+        print(f'Invalid: {err} The first {verified} appendables are valid.',
+              file=sys.stderr)
+        return 1
+    print(f'Valid: verified {verified} appendables.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
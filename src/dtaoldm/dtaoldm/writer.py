@@ -0,0 +1,352 @@
+"""Append-only Log Writer
+
+Functionality for incrementally appending to an append-only log that is
+persisted on disk at a single path.
+
+``dtaoldm.aol.persist_aol`` takes an entire in-memory AOL and works out which of
+its appendables are new by looking up the tip of the AOL file. When a
+long-running process (e.g., the DativeTop Server) is the only writer of an AOL
+file, it can instead keep an ``AOLWriter`` open on that file. The writer caches
+the tip hash, the byte size and (once needed) the hash index of the AOL in
+memory, so that appending a handful of quads only hashes, writes and fsyncs
+those quads, regardless of the size of the log::
+
+    >>> writer = AOLWriter('path/to/aol.txt')
+    >>> appendables = writer.append_quads(quads)
+    >>> writer.tip_hash == appendables[-1].integrated_hash
+    True
+
+"""
+
+import os
+import threading
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.compaction as compaction_mod
+import dtaoldm.materialized as materialized
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class AOLWriter:
+    """A handle on the AOL file at ``file_path`` that keeps the file open in
+    append mode. Use ``lock`` to serialize access from multiple threads;
+    ``append_quads`` and ``merge`` acquire it themselves.
+
+    If the file does not exist, it is created and uses ``digest`` (see
+    ``dtaoldm.aol.DIGESTS``); otherwise the digest recorded in the file's header
+    is used.
+    """
+
+    def __init__(self, file_path, digest=aol_mod.DEFAULT_DIGEST):
+        if not os.path.isfile(file_path):
+            aol_mod.persist_aol([], file_path, digest=digest)
+        # The writer appends to the sidecar index file without re-reading it,
+        # so it must start out consistent with the AOL.
+        aol_mod.ensure_hash_index_file_consistent(file_path)
+        self.file_path = file_path
+        self.digest = aol_mod.get_digest_in_file(file_path)
+        self.lock = threading.RLock()
+        self.tip_hash = aol_mod.get_tip_hash_in_file(file_path)
+        self.size = os.path.getsize(file_path)
+        self._hash_index = None
+        self._offsets = None
+        self.aliases = compaction_mod.get_aliases(
+            compaction_mod.read_compactions(file_path))
+        self.views = []
+        self._fh = open(file_path, 'a')
+
+    @property
+    def hash_index(self):
+        """The hash index of the AOL, a dict from integrated hashes to
+        positions. It is read from the sidecar index file on first access and
+        kept up to date in memory thereafter, as are the byte offsets of the
+        lines of the AOL file.
+        """
+        with self.lock:
+            if self._hash_index is None:
+                self._hash_index, self._offsets = (
+                    aol_mod.read_hash_index_file(self.file_path))
+            return self._hash_index
+
+    @property
+    def length(self):
+        """The number of appendables in the AOL."""
+        return len(self.hash_index)
+
+    def append_quads(self, quads):
+        """Append the EAVT quads ``quads`` to the AOL. Return the list of new
+        Appendable instances, which have been written and fsynced to disk
+        before this method returns.
+        """
+        with self.lock:
+            appendables = list(aol_mod.chain_quads(
+                quads, self.tip_hash, digest=self.digest))
+            if not appendables:
+                return appendables
+            entries = aol_mod.write_appendables(
+                self._fh, appendables, self.size)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            if os.path.exists(aol_mod.get_hash_index_path(self.file_path)):
+                # fsyncs the index too
+                aol_mod.append_to_hash_index_file(entries, self.file_path)
+            if self._hash_index is not None:
+                position = len(self._hash_index)
+                for integrated_hash, offset in entries:
+                    self._hash_index[integrated_hash] = position
+                    self._offsets.append(offset)
+                    position += 1
+            self.tip_hash = appendables[-1].integrated_hash
+            self.size = os.path.getsize(self.file_path)
+            for view in self.views:
+                view.apply(appendables)
+            return appendables
+
+    def read_appendables(self, start=0):
+        """Return the list of the Appendable instances of the AOL from
+        position ``start`` on. Only that part of the AOL file is read.
+        """
+        with self.lock:
+            if start >= self.length:
+                return []
+            return list(aol_mod.iter_file_chunk(
+                self.file_path, self._offsets[start], self.size))
+
+    def open_lines(self, start=0):
+        """Return a 2-tuple of the AOL file, opened for reading in binary mode
+        at the line of the appendable at position ``start``, and the number of
+        bytes from there to the end of the AOL. The lines are JSON arrays, one
+        per appendable. The file is opened under the lock, so the handle keeps
+        reading the same AOL even if it is compacted (which replaces the file)
+        before the caller is done.
+        """
+        with self.lock:
+            fh = open(self.file_path, 'rb')
+            offset = self.size
+            if start < self.length:
+                offset = self._offsets[start]
+            fh.seek(offset)
+            return fh, self.size - offset
+
+    def add_view(self, view):
+        """Bring ``view``, a ``dtaoldm.materialized.MaterializedView``, up to
+        date with the AOL and keep it up to date as quads are appended. Return
+        an error string if the view has diverged from the AOL, else ``None``.
+        A view loaded from a checkpoint (e.g., with
+        ``dtaoldm.materialized.load_eav_index_checkpoint``) only folds the
+        appendables written since the checkpoint.
+        """
+        with self.lock:
+            err = view.update_from_file(self.file_path)
+            if err:
+                return err
+            self.views.append(view)
+            return None
+
+    def merge(self, mergee, conflict_resolution_strategy='abort',
+              diff_only=False):
+        """Merge AOL ``mergee`` into the AOL, appending only the quads of the
+        suffix of ``mergee`` that the AOL lacks. The conflict resolution
+        strategies are those of ``dtaoldm.aol.merge_aols``. Return a "maybe"
+        2-tuple whose first element is the list of newly appended Appendable
+        instances or, if ``diff_only`` is True, the ``dtaoldm.aol.Patch`` that
+        ``mergee`` would need to apply to itself in order to become identical
+        with the merged AOL. With the 'three-way' strategy, that first element
+        is wrapped in a ``dtaoldm.aol.RebaseResult``.
+        """
+        with self.lock:
+            three_way = (conflict_resolution_strategy ==
+                         aol_mod.THREE_WAY_STRATEGY)
+            conflicts = {}
+
+            def result(merged):
+                if three_way:
+                    merged = aol_mod.RebaseResult(
+                        merged, tuple(conflicts.values()))
+                return merged, None
+
+            new_from_mergee = aol_mod.find_changes(
+                None, mergee, target_index=self.hash_index,
+                aliases=self.aliases)
+            if not new_from_mergee and not diff_only:
+                return result([])
+            mergee_index = aol_mod.get_hash_index(mergee)
+            tip_in_mergee = self.tip_hash in mergee_index or any(
+                pre_tip_hash in mergee_index for pre_tip_hash, post_tip_hash in
+                self.aliases.items() if post_tip_hash == self.tip_hash)
+            if (new_from_mergee and self.tip_hash is not None and
+                    not tip_in_mergee and conflict_resolution_strategy not in
+                    aol_mod.REBASE_STRATEGIES):
+                return None, aol_mod.NEED_REBASE_ERR
+            # The AOL has nothing that mergee lacks.
+            up_to_date = self.tip_hash is None or self.tip_hash in mergee_index
+            fork = len(mergee) - len(new_from_mergee)
+            base_hash = mergee[fork - 1].integrated_hash if fork else None
+            new_quads = [appendable.quad for appendable in new_from_mergee]
+            if three_way and new_quads and not tip_in_mergee:
+                new_quads = aol_mod.filter_three_way(
+                    new_quads, self._index_target_changes(base_hash),
+                    conflicts)
+            appended = self.append_quads(new_quads)
+            if not diff_only:
+                return result(appended)
+            if base_hash is not None and base_hash not in self.hash_index:
+                # mergee forks from a hash that the AOL only knows by an alias,
+                # so all of mergee has to be replaced.
+                return result(aol_mod.Patch(None, self.read_appendables()))
+            if up_to_date:
+                return result(aol_mod.Patch(aol_mod.get_tip_hash(mergee), []))
+            start = self.hash_index[base_hash] + 1 if fork else 0
+            return result(
+                aol_mod.Patch(base_hash, self.read_appendables(start)))
+
+    def merge_stream(self, mergee, conflict_resolution_strategy='abort',
+                     batch_size=DEFAULT_BATCH_SIZE):
+        """Merge the AOL whose Appendable instances are yielded by the iterable
+        ``mergee`` (e.g., as parsed from a request body) into the AOL, in a
+        single pass. Return a "maybe" 2-tuple whose first element is the
+        ``dtaoldm.aol.Patch`` that the mergee would need to apply to itself in
+        order to become identical with the merged AOL (see ``merge``), wrapped
+        in a ``dtaoldm.aol.RebaseResult`` with the 'three-way' strategy.
+
+        The prefix of ``mergee`` that the AOL already contains is skipped and
+        the quads of the rest are appended in batches of ``batch_size``, so
+        that only one batch of ``mergee`` is held in memory at a time. (If the
+        AOL has been compacted, the new quads are instead held until the end of
+        ``mergee``, since they may yet turn out to precede a pre-compaction
+        tip.) Conflicts are detected before the first batch is appended. If
+        ``mergee`` raises an exception, the batches appended so far are kept.
+        """
+        with self.lock:
+            hash_index = self.hash_index
+            start_tip_hash = self.tip_hash
+            base_hash = None  # the last appendable of mergee that the AOL has
+            mergee_tip_hash = None
+            forked = False
+            pending = []
+            three_way = (conflict_resolution_strategy ==
+                         aol_mod.THREE_WAY_STRATEGY)
+            # The (entity, attribute) index of the changes of the AOL that
+            # mergee lacks, built before the first batch is appended.
+            target_changes = None
+            conflicts = {}
+
+            def append_pending():
+                nonlocal target_changes
+                if three_way and pending and target_changes is None:
+                    target_changes = self._index_target_changes(base_hash)
+                return self._append_batch(
+                    pending, base_hash, start_tip_hash,
+                    conflict_resolution_strategy, target_changes, conflicts)
+
+            for appendable in mergee:
+                integrated_hash = appendable.integrated_hash
+                mergee_tip_hash = integrated_hash
+                if not forked and integrated_hash in hash_index:
+                    base_hash = integrated_hash
+                    continue
+                if self.aliases.get(integrated_hash) in hash_index:
+                    base_hash = integrated_hash
+                    forked = False
+                    pending = []
+                    continue
+                forked = True
+                pending.append(appendable.quad)
+                if len(pending) >= batch_size and not self.aliases:
+                    err = append_pending()
+                    if err:
+                        return None, err
+                    pending = []
+            err = append_pending()
+            if err:
+                return None, err
+            if base_hash is not None and base_hash not in hash_index:
+                patch = aol_mod.Patch(None, self.read_appendables())
+            elif start_tip_hash is None or base_hash == start_tip_hash:
+                patch = aol_mod.Patch(mergee_tip_hash, [])
+            else:
+                start = hash_index[base_hash] + 1 if base_hash else 0
+                patch = aol_mod.Patch(base_hash, self.read_appendables(start))
+            if three_way:
+                patch = aol_mod.RebaseResult(patch, tuple(conflicts.values()))
+            return patch, None
+
+    def _append_batch(self, quads, base_hash, start_tip_hash,
+                      conflict_resolution_strategy, target_changes=None,
+                      conflicts=None):
+        """Append ``quads`` for ``merge_stream``. Return an error string if
+        appending would require a rebase that the conflict resolution strategy
+        does not allow. If ``target_changes`` is given, only the quads that do
+        not conflict with it are appended (see
+        ``dtaoldm.aol.filter_three_way``).
+        """
+        if not quads:
+            return None
+        tip_in_mergee = (start_tip_hash is None or
+                         base_hash == start_tip_hash or
+                         self.aliases.get(base_hash) == start_tip_hash)
+        if (not tip_in_mergee and conflict_resolution_strategy not in
+                aol_mod.REBASE_STRATEGIES):
+            return aol_mod.NEED_REBASE_ERR
+        if target_changes is not None and not tip_in_mergee:
+            quads = aol_mod.filter_three_way(quads, target_changes, conflicts)
+        self.append_quads(quads)
+        return None
+
+    def _index_target_changes(self, base_hash):
+        """Return the index (see ``dtaoldm.aol.index_changes``) of the
+        appendables of the AOL after the appendable with integrated hash
+        ``base_hash`` (or an alias of it), i.e., of the changes of the AOL that
+        a mergee forking at ``base_hash`` lacks.
+        """
+        if base_hash is None:
+            return aol_mod.index_changes(self.read_appendables())
+        position = self.hash_index.get(base_hash)
+        if position is None:
+            position = self.hash_index[self.aliases[base_hash]]
+        return aol_mod.index_changes(self.read_appendables(position + 1))
+
+    def compact(self):
+        """Compact the AOL (see ``dtaoldm.compaction.compact_aol_file``) and
+        return the ``Compaction``.
+
+        The views of the writer encode the same state as the compacted AOL, so
+        they are simply moved to its tip.
+        """
+        with self.lock:
+            self._fh.close()
+            compaction = compaction_mod.compact_aol_file(self.file_path)
+            self._fh = open(self.file_path, 'a')
+            self.tip_hash = aol_mod.get_tip_hash_in_file(self.file_path)
+            self.size = os.path.getsize(self.file_path)
+            self._hash_index = None
+            self._offsets = None
+            self.aliases = compaction_mod.get_aliases(
+                compaction_mod.read_compactions(self.file_path))
+            for view in self.views:
+                view.tip_hash = self.tip_hash
+                view.length = compaction.post_length
+                view.offset = None
+            return compaction
+
+    def checkpoint_views(self):
+        """Checkpoint the views of the writer next to the AOL file (see
+        ``dtaoldm.materialized.persist_checkpoint``).
+        """
+        with self.lock:
+            for view in self.views:
+                materialized.persist_checkpoint(view, self.file_path)
+
+    def close(self):
+        """Checkpoint the views of the writer and close the AOL file."""
+        with self.lock:
+            self.checkpoint_views()
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
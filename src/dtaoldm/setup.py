@@ -52,7 +52,7 @@ setup(
     },
     entry_points={
         'console_scripts': [
-            # 'some-name = some.dot.path:som_func',
+            'dtaoldm-verify = dtaoldm.verify:main',
         ],
     },
 )
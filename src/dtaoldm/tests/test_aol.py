@@ -5,6 +5,7 @@ import os
 from pathlib import Path
 
 import dtaoldm.aol as aol_mod
+import dtaoldm.domain as domain
 import tests.utils as utils
 
 
@@ -41,3 +42,160 @@ def test_aol_persistence_existing_empty_file():
             assert fh_n.read() == fh.read()
     finally:
         utils.remove_test_files(path, path_new)
+
+
+def test_get_tip_hash_in_file():
+    """Test that ``get_tip_hash_in_file`` returns the integrated hash of the
+    last appendable, including when the last line spans several of the blocks
+    read from the end of the file, and ``None`` for an empty file.
+    """
+    try:
+        test_aol = utils.generate_test_aol()
+        path = os.path.join(utils.TMP_PATH, 'aol-tip.txt')
+        path_empty = os.path.join(utils.TMP_PATH, 'aol-tip-empty.txt')
+        Path(path_empty).touch()
+        assert aol_mod.get_tip_hash_in_file(path_empty) is None
+        aol_mod.persist_aol(test_aol[:1], path)
+        assert (aol_mod.get_tip_hash_in_file(path) ==
+                test_aol[0].integrated_hash)
+        aol_mod.persist_aol(test_aol, path)
+        assert (aol_mod.get_tip_hash_in_file(path) ==
+                aol_mod.get_tip_hash(test_aol))
+        long_aol = aol_mod.append_to_aol(
+            list(test_aol),
+            aol_mod.fiat_attribute(test_aol[0].quad.entity, 'has-name',
+                                   'x' * 3 * aol_mod.TAIL_BLOCK_SIZE))
+        aol_mod.persist_aol(long_aol, path)
+        assert (aol_mod.get_tip_hash_in_file(path) ==
+                aol_mod.get_tip_hash(long_aol))
+    finally:
+        utils.remove_test_files(path, path_empty)
+
+
+def test_hash_index_file():
+    """Test that the hash index sidecar file is built on demand, kept up to
+    date by ``persist_aol``, and rebuilt when it is out of date.
+    """
+    try:
+        test_aol = utils.generate_test_aol()
+        path = os.path.join(utils.TMP_PATH, 'aol-indexed.txt')
+        index_path = aol_mod.get_hash_index_path(path)
+        aol_mod.persist_aol(test_aol[:5], path)
+        assert not os.path.exists(index_path)
+        assert (aol_mod.get_hash_index_in_file(path) ==
+                aol_mod.get_hash_index(test_aol[:5]))
+        aol_mod.persist_aol(test_aol, path)
+        assert aol_mod.is_hash_index_file_current(path)
+        positions, offsets = aol_mod.read_hash_index_file(path)
+        assert positions == aol_mod.get_hash_index(test_aol)
+        with open(path, 'r') as fh:
+            for offset, appendable in zip(offsets, aol_mod.get_aol(path)):
+                fh.seek(offset)
+                assert aol_mod.parse_appendable(fh.readline()) == appendable
+        aol_mod.write_hash_index_file([], path)
+        assert not aol_mod.is_hash_index_file_current(path)
+        assert (aol_mod.get_hash_index_in_file(path) ==
+                aol_mod.get_hash_index(test_aol))
+        assert aol_mod.get_new_appendables(
+            test_aol, test_aol[9].integrated_hash,
+            hash_index=positions) == test_aol[10:]
+
+        # An index that lost its tail (e.g., in a crash) is rebuilt before new
+        # entries are appended to it.
+        with open(index_path, 'r') as fh:
+            index_lines = fh.readlines()
+        with open(index_path, 'w') as fh:
+            fh.writelines(index_lines[:-1])
+        longer_aol = aol_mod.append_to_aol(
+            list(test_aol), aol_mod.fiat_entity())
+        aol_mod.persist_aol(longer_aol, path)
+        assert aol_mod.is_hash_index_file_consistent(path)
+        positions, offsets = aol_mod.read_hash_index_file(path)
+        assert positions == aol_mod.get_hash_index(longer_aol)
+        assert len(offsets) == len(longer_aol)
+
+        # An index that looks current but whose last offset is wrong is not
+        # consistent
+        with open(index_path, 'r') as fh:
+            index_lines = fh.readlines()
+        tip_hash, offset = index_lines[-1].split(' ')
+        with open(index_path, 'w') as fh:
+            fh.writelines(index_lines[:-1] + [
+                aol_mod.serialize_hash_index_entry(tip_hash, int(offset) - 1)])
+        assert aol_mod.is_hash_index_file_current(path)
+        assert not aol_mod.is_hash_index_file_consistent(path)
+        assert aol_mod.get_hash_index_in_file(path) == (
+            aol_mod.get_hash_index(longer_aol))
+    finally:
+        utils.remove_test_files(path, index_path)
+
+
+def test_parallel_aol_reading():
+    """Test that reading and folding an AOL file in parallel chunks gives the
+    same results as doing so sequentially.
+    """
+    try:
+        test_aol = utils.generate_large_test_aol(20)
+        path = os.path.join(utils.TMP_PATH, 'aol-parallel.txt')
+        aol_mod.persist_aol(test_aol, path)
+        sequential_aol = aol_mod.get_aol(path)
+        assert aol_mod.get_aol(path, processes=3) == sequential_aol
+        chunks = aol_mod.get_file_chunks(path, 7)
+        assert len(chunks) == 7
+        assert chunks[0][0] == 0
+        assert chunks[-1][1] == os.path.getsize(path)
+        assert sum(len(aol_mod.parse_file_chunk((path, start, end)))
+                   for start, end in chunks) == len(test_aol)
+        domain_entities = aol_mod.aol_to_domain_entities(
+            test_aol, domain.CONSTRUCTORS)
+        assert len(domain_entities['old-instances']) == 20
+        assert aol_mod.aol_to_domain_entities(
+            test_aol, domain.CONSTRUCTORS, processes=3) == domain_entities
+        assert aol_mod.file_to_domain_entities(
+            path, domain.CONSTRUCTORS) == domain_entities
+        assert aol_mod.file_to_domain_entities(
+            path, domain.CONSTRUCTORS, processes=3) == domain_entities
+    finally:
+        utils.remove_test_files(path)
+
+
+def test_append_many():
+    """Test that ``append_many`` produces exactly the appendables that repeated
+    calls to ``append_to_aol`` produce, and that AOL files using a non-default
+    digest record it in their header and can be read, indexed and appended to.
+    """
+    try:
+        test_aol = utils.generate_test_aol()
+        quads = [appendable.quad for appendable in test_aol]
+        assert aol_mod.append_many([], quads) == test_aol
+        assert aol_mod.append_many(list(test_aol[:5]), quads[5:]) == test_aol
+        blake2b_aol = []
+        for quad in quads:
+            aol_mod.append_to_aol(blake2b_aol, quad,
+                                  digest=aol_mod.BLAKE2B_DIGEST)
+        assert aol_mod.append_many(
+            [], quads, digest=aol_mod.BLAKE2B_DIGEST) == blake2b_aol
+        assert (set(aol_mod.get_hashes(blake2b_aol)) &
+                set(aol_mod.get_hashes(test_aol))) == set()
+        path = os.path.join(utils.TMP_PATH, 'aol-blake2b.txt')
+        path_md5 = os.path.join(utils.TMP_PATH, 'aol-md5.txt')
+        aol_mod.persist_aol(test_aol, path_md5)
+        assert aol_mod.get_aol_header(path_md5) == {}
+        assert aol_mod.get_digest_in_file(path_md5) == aol_mod.MD5_DIGEST
+        aol_mod.persist_aol([], path, digest=aol_mod.BLAKE2B_DIGEST)
+        assert aol_mod.get_digest_in_file(path) == aol_mod.BLAKE2B_DIGEST
+        assert aol_mod.get_tip_hash_in_file(path) is None
+        assert aol_mod.get_aol(path) == []
+        aol_mod.persist_aol(blake2b_aol[:5], path)
+        aol_mod.persist_aol(blake2b_aol, path)
+        assert (aol_mod.get_hashes(aol_mod.get_aol(path)) ==
+                aol_mod.get_hashes(blake2b_aol))
+        assert (aol_mod.get_aol(path, processes=3) ==
+                aol_mod.get_aol(path))
+        assert (aol_mod.get_tip_hash_in_file(path) ==
+                aol_mod.get_tip_hash(blake2b_aol))
+        assert (aol_mod.get_hash_index_in_file(path) ==
+                aol_mod.get_hash_index(blake2b_aol))
+    finally:
+        utils.remove_test_files(path, path_md5,
+                                aol_mod.get_hash_index_path(path))
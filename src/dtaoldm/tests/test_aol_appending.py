@@ -51,6 +51,11 @@ def aolit(*args):
     return aol
 
 
+def tip(*args):
+    """Return the tip hash of the fake tester AOL of ``args``."""
+    return sut.get_tip_hash(aolit(*args))
+
+
 @pytest.mark.parametrize(
     'target, mergee, changes', (
 
@@ -132,11 +137,22 @@ def aolit(*args):
             mergee =[Apbl('d'), Apbl('e'),],
             changes=[Apbl('d'), Apbl('e'),],),
 
+        # 5.ii Conflict B, target new longer than all of mergee
+        ChangesCase(
+            target =[Apbl('a'), Apbl('b'), Apbl('c'), Apbl('W'), Apbl('X'),
+                     Apbl('Y'), Apbl('Z'),],
+            mergee =[Apbl('a'), Apbl('b'), Apbl('c'), Apbl('d'),],
+            changes=[Apbl('d'),],),
+
     )
 )
 def test_find_changes(target, mergee, changes):
-    """Test that aol::find_changes works as expected."""
+    """Test that aol::find_changes works as expected, with and without a
+    pre-computed hash index of the target.
+    """
     assert sut.find_changes(target, mergee) == changes
+    assert sut.find_changes(
+        target, mergee, target_index=sut.get_hash_index(target)) == changes
 
 
 MergeCase = namedtuple(
@@ -333,7 +349,7 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c',),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=aolit(),
+            merged=sut.Patch(tip('a', 'b', 'c',), []),
             err=None,),
 
         # 2. No conflict, new from target
@@ -342,7 +358,8 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c',),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=aolit('a', 'b', 'c', 'X',)[-1:],
+            merged=sut.Patch(
+                tip('a', 'b', 'c',), aolit('a', 'b', 'c', 'X',)[-1:]),
             err=None,),
 
         # 3. No conflict, new from mergee
@@ -351,7 +368,7 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c', 'd',),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=[],
+            merged=sut.Patch(tip('a', 'b', 'c', 'd',), []),
             err=None,),
 
         # 4. Conflict A, equal new, ABORT
@@ -369,7 +386,8 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c', 'd'),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('a', 'b', 'c', 'X', 'd')[-2:],
+            merged=sut.Patch(
+                tip('a', 'b', 'c',), aolit('a', 'b', 'c', 'X', 'd')[-2:]),
             err=None,),
 
         # 5. Conflict B, more target new, ABORT
@@ -387,7 +405,9 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c', 'd',),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('a', 'b', 'c', 'X', 'Y', 'd',)[-3:],
+            merged=sut.Patch(
+                tip('a', 'b', 'c',),
+                aolit('a', 'b', 'c', 'X', 'Y', 'd',)[-3:]),
             err=None,),
 
         # 6. Conflict C, more mergee new, ABORT
@@ -405,7 +425,9 @@ MergeCase = namedtuple(
             mergee=aolit('a', 'b', 'c', 'd', 'e',),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('a', 'b', 'c', 'X', 'd', 'e',)[-3:],
+            merged=sut.Patch(
+                tip('a', 'b', 'c',),
+                aolit('a', 'b', 'c', 'X', 'd', 'e',)[-3:]),
             err=None,),
 
         # 1.i. Empty, no change
@@ -414,7 +436,7 @@ MergeCase = namedtuple(
              mergee=aolit(),
              conflict_resolution_strategy='abort',
              diff_only=True,
-             merged=aolit(),
+             merged=sut.Patch(None, []),
              err=None,),
 
         # 1.ii. Short, no change
@@ -423,7 +445,7 @@ MergeCase = namedtuple(
             mergee=aolit('a',),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=[],
+            merged=sut.Patch(tip('a',), []),
             err=None,),
 
         # 2.i Short, no conflict, new from target
@@ -432,7 +454,7 @@ MergeCase = namedtuple(
             mergee=aolit(),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=aolit('X'),
+            merged=sut.Patch(None, aolit('X')),
             err=None,),
 
         # 3.i Short, no conflict, new from mergee
@@ -441,7 +463,7 @@ MergeCase = namedtuple(
             mergee=aolit('d',),
             conflict_resolution_strategy='abort',
             diff_only=True,
-            merged=[],
+            merged=sut.Patch(tip('d',), []),
             err=None,),
 
         # 4.i Short, conflict A, equal new, ABORT
@@ -459,7 +481,7 @@ MergeCase = namedtuple(
             mergee=aolit('d',),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('X', 'd',),
+            merged=sut.Patch(None, aolit('X', 'd',)),
             err=None,),
 
         # 5.i Short, conflict B, more target new, ABORT
@@ -477,7 +499,7 @@ MergeCase = namedtuple(
             mergee=aolit('d',),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('X', 'Y', 'd',),
+            merged=sut.Patch(None, aolit('X', 'Y', 'd',)),
             err=None,),
 
         # 6.i Short, conflict C, more mergee new, ABORT
@@ -495,7 +517,7 @@ MergeCase = namedtuple(
             mergee=aolit('d', 'e',),
             conflict_resolution_strategy='rebase',
             diff_only=True,
-            merged=aolit('X', 'd', 'e',),
+            merged=sut.Patch(None, aolit('X', 'd', 'e',)),
             err=None,),
 
     )
@@ -511,3 +533,100 @@ def test_merge_aols(target, mergee, conflict_resolution_strategy, diff_only,
         assert actual_err == err
     else:
         assert actual_merged == merged
+    if diff_only and not err:
+        full_merged, _ = sut.merge_aols(
+            list(target), mergee,
+            conflict_resolution_strategy=conflict_resolution_strategy)
+        assert sut.apply_patch(list(mergee), actual_merged) == (
+            full_merged, None)
+
+
+def test_apply_patch():
+    """Test that aol::apply_patch truncates the AOL at the base hash of the
+    patch, refuses patches with unknown base hashes, and that patches survive
+    the round-trip through JSON.
+    """
+    patch = sut.Patch(tip('a', 'b',), aolit('a', 'b', 'X', 'Y',)[-2:])
+    assert sut.apply_patch(aolit('a', 'b', 'c',), patch) == (
+        aolit('a', 'b', 'X', 'Y',), None)
+    assert sut.apply_patch(aolit('a', 'b', 'c',), sut.Patch(None, [])) == (
+        [], None)
+    assert sut.apply_patch(aolit('a',), patch) == (
+        None, sut.UNKNOWN_BASE_HASH_ERR)
+    assert sut.json_to_patch(sut.patch_to_json(patch)) == patch
+
+
+def quadlog(*quads):
+    """Create a tester AOL of the (entity, attribute, value) triples
+    ``quads``.
+    """
+    aol = []
+    for entity, attribute, value in quads:
+        sut.append_to_aol(aol, sut.Quad(entity, attribute, value, 't'))
+    return aol
+
+
+def test_merge_aols_three_way():
+    """Test that the 'three-way' strategy of aol::merge_aols applies the
+    changes of the mergee that do not overlap with those of the target, skips
+    the changes that the target also made, and reports the rest as conflicts
+    at the (entity, attribute) level.
+    """
+    base = [('e1', 'has', 'being'), ('e1', 'has-name', 'a'),
+            ('e2', 'has', 'being'), ('e3', 'has', 'being')]
+    target = quadlog(*base, ('e1', 'has-name', 'b'), ('e2', 'has-url', 'u'),
+                     ('e3', 'lacks', 'being'))
+    mergee = quadlog(*base, ('e1', 'has-name', 'c'), ('e1', 'has-leader', 'l'),
+                     ('e2', 'has-url', 'u'), ('e2', 'lacks', 'being'),
+                     ('e3', 'has-name', 'x'), ('e1', 'has-name', 'd'))
+    result, err = sut.merge_aols(
+        list(target), mergee, conflict_resolution_strategy='three-way')
+    assert err is None
+    assert [a.quad[:3] for a in result.merged[len(target):]] == [
+        ('e1', 'has-leader', 'l')]
+    assert result.merged == quadlog(*base, ('e1', 'has-name', 'b'),
+                                    ('e2', 'has-url', 'u'),
+                                    ('e3', 'lacks', 'being'),
+                                    ('e1', 'has-leader', 'l'))
+    assert [(c.entity, c.attribute, c.target_quad[2], c.mergee_quad[2]) for
+            c in result.conflicts] == [
+        ('e1', 'has-name', 'b', 'd'),
+        ('e2', None, 'u', 'being'),
+        ('e3', 'has-name', 'being', 'x')]
+    patch_result, err = sut.merge_aols(
+        list(target), mergee, conflict_resolution_strategy='three-way',
+        diff_only=True)
+    assert patch_result.conflicts == result.conflicts
+    assert sut.apply_patch(list(mergee), patch_result.merged) == (
+        result.merged, None)
+    assert sut.merge_aols(
+        list(target), target[:2],
+        conflict_resolution_strategy='three-way') == (
+            sut.RebaseResult(target, ()), None)
+
+
+def test_diff_many():
+    """Test that aol::diff_many returns quads for just the changed fields of
+    each pair of instances, with a single timestamp, and that aol::diff agrees
+    with it.
+    """
+    other, _ = domain.construct_old_instance(
+        slug='bla', name='Blackfoot', url='http://127.0.0.1:5679/bla')
+    other_updated = other._replace(name='Siksika')
+    quads, err = sut.diff_many(
+        ((OKA_OLD_INSTANCE, OKA_OLD_INSTANCE_UPDATED), (other, other),
+         (other, other_updated)), domain.OLD_INSTANCE_TYPE)
+    assert err is None
+    assert [quad[:3] for quad in quads] == [
+        (OKA_OLD_ID, 'has-name', 'Okanagan OLD'),
+        (OKA_OLD_ID, 'has-leader', 'http://realworldoldservice.com/oka'),
+        (OKA_OLD_ID, 'is-auto-syncing', True),
+        (other.id, 'has-name', 'Siksika')]
+    assert len({quad.time for quad in quads}) == 1
+    assert [quad[:3] for quad in sut.diff(
+        OKA_OLD_INSTANCE, OKA_OLD_INSTANCE_UPDATED,
+        domain.OLD_INSTANCE_TYPE)] == [quad[:3] for quad in quads[:3]]
+    dative_app, _ = domain.construct_dative_app(url='http://127.0.0.1:5678')
+    assert sut.diff_many(
+        ((OKA_OLD_INSTANCE, dative_app),), domain.OLD_INSTANCE_TYPE) == (
+            None, sut.DIFF_TYPE_ERR)
@@ -0,0 +1,54 @@
+"""Tests for the binary append-only log encoding
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.binary as sut
+import tests.utils as utils
+
+
+def test_binary_aol_round_trip():
+    """Test that writing an AOL in the binary format and reading it back gives
+    the identical appendables, and that the binary file is much smaller than
+    the JSON-lines file.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol.bin')
+    path_jsonl = os.path.join(utils.TMP_PATH, 'aol-jsonl.txt')
+    try:
+        test_aol = utils.generate_large_test_aol(10)
+        sut.write_binary_aol(test_aol, path)
+        assert sut.is_binary_aol_file(path)
+        assert sut.get_binary_aol(path) == test_aol
+        aol_mod.persist_aol(test_aol, path_jsonl)
+        assert not sut.is_binary_aol_file(path_jsonl)
+        assert os.path.getsize(path) * 2 < os.path.getsize(path_jsonl)
+        assert (sut.get_binary_aol(path) ==
+                aol_mod.list_to_aol(aol_mod.get_aol(path_jsonl)))
+    finally:
+        utils.remove_test_files(path, path_jsonl)
+
+
+def test_binary_aol_irregular_fields():
+    """Test that fields that cannot use the compact encodings, e.g.,
+    non-string values, timestamps in other formats and non-hex hashes, still
+    round-trip losslessly.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-irregular.bin')
+    try:
+        quads = [
+            aol_mod.Quad('e1', 'is-auto-syncing', False,
+                         '2019-07-15T17:43:57.211932'),
+            aol_mod.Quad('e1', 'has-count', 3, '2019-07-15T17:43:57'),
+            aol_mod.Quad('e1', 'has-name', 'Okanagan ÿ',
+                         '2019-07-15T17:43:57.100'),
+            aol_mod.Quad('e1', 'has-leader', None, '2019-07-15 17:43:57'),
+            aol_mod.Quad('e2', 'has-tags', ['a', {'b': 1}], None),
+            aol_mod.Quad('e2', 'has-time', '', '1969-12-31T23:59:59.999999'),
+        ]
+        test_aol = aol_mod.append_many([], quads)
+        test_aol.append(aol_mod.Appendable(quads[0], 'ABCDEF', 'not-a-hash'))
+        sut.write_binary_aol(test_aol, path)
+        assert sut.get_binary_aol(path) == test_aol
+    finally:
+        utils.remove_test_files(path)
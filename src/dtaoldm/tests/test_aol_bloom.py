@@ -0,0 +1,28 @@
+"""Tests for Bloom filters of integrated hashes
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.bloom as sut
+import tests.utils as utils
+
+
+def test_bloom():
+    """Test that a Bloom filter has no false negatives, roughly the false
+    positive rate it was sized for, and survives the round-trip to disk.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol.bloom')
+    try:
+        hashes = [aol_mod.get_hash(str(i)) for i in range(2000)]
+        bloom = sut.build_bloom(hashes[:1000], error_rate=0.01)
+        assert all(sut.bloom_contains(bloom, h) for h in hashes[:1000])
+        false_positives = sum(sut.bloom_contains(bloom, h) for h in
+                              hashes[1000:])
+        assert false_positives < 50
+        assert sut.bloom_contains(
+            sut.build_bloom(['short']), 'short')
+        sut.write_bloom_file(bloom, path)
+        assert sut.read_bloom_file(path) == bloom
+    finally:
+        utils.remove_test_files(path)
@@ -0,0 +1,133 @@
+"""Tests for append-only log compaction
+"""
+
+import os
+import shutil
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.compaction as sut
+import dtaoldm.domain as domain
+import dtaoldm.segments as segments
+import dtaoldm.writer as writer
+import tests.utils as utils
+
+
+def generate_redundant_aol():
+    """Return an AOL in which one OLDInstance is saved three times and another
+    one is created and then retracted.
+    """
+    old_instance, _ = domain.construct_old_instance(
+        slug='oka', name='Okanagan OLD', url='http://127.0.0.1:5679/oka')
+    retracted, _ = domain.construct_old_instance(
+        slug='bla', name='Blackfoot OLD', url='http://127.0.0.1:5679/bla')
+    quads = list(aol_mod.instance_to_quads(
+        old_instance, domain.OLD_INSTANCE_TYPE))
+    quads += aol_mod.instance_to_quads(retracted, domain.OLD_INSTANCE_TYPE)
+    for state in (domain.SYNCING_STATE, domain.SYNCED_STATE):
+        quads += aol_mod.instance_to_quads(
+            old_instance._replace(state=state), domain.OLD_INSTANCE_TYPE)
+    quads.append(aol_mod.Quad(retracted.id, aol_mod.LACKS_ATTR,
+                              aol_mod.BEING_VAL, aol_mod.get_now_str()))
+    return aol_mod.append_many([], quads)
+
+
+def test_compact_aol():
+    """Test that compacting an AOL keeps only the latest quad per (entity,
+    attribute) of the extant entities, and preserves the domain entities.
+    """
+    aol = generate_redundant_aol()
+    compacted = sut.compact_aol(aol)
+    assert len(aol) == 37
+    assert len(compacted) == 9
+    assert (aol_mod.aol_to_domain_entities(compacted, domain.CONSTRUCTORS) ==
+            aol_mod.aol_to_domain_entities(aol, domain.CONSTRUCTORS))
+    assert sut.compact_aol(compacted) == compacted
+    assert sut.compact_aol([]) == []
+
+
+def test_compact_aol_file_and_merge():
+    """Test that compacting an AOL file records the pre-compaction tip so that
+    a peer that was in sync before the compaction can still merge only its new
+    changes, with ``merge_aols`` and with an ``AOLWriter``.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-compaction.txt')
+    try:
+        aol = generate_redundant_aol()
+        aol_mod.persist_aol(aol, path)
+        aol_mod.get_hash_index_in_file(path)  # create the sidecar index file
+        compaction = sut.compact_aol_file(path)
+        compacted = aol_mod.get_aol(path)
+        assert compaction == sut.Compaction(
+            aol_mod.get_tip_hash(aol), aol_mod.get_tip_hash(compacted), 37, 9)
+        assert sut.read_compactions(path) == [compaction]
+        assert (aol_mod.get_hash_index_in_file(path) ==
+                aol_mod.get_hash_index(compacted))
+        assert sut.compact_aol_file(path).pre_length == 9
+        assert sut.read_compactions(path) == [compaction]
+        peer_quads = [aol_mod.fiat_attribute(aol[0].quad.entity, 'has-name',
+                                             'Okanagan')]
+        peer_aol = aol_mod.append_many(list(aol), peer_quads)
+        aliases = sut.get_aliases(sut.read_compactions(path))
+        _, err = aol_mod.merge_aols(compacted, peer_aol)
+        assert err == aol_mod.NEED_REBASE_ERR
+        merged, err = aol_mod.merge_aols(
+            list(compacted), peer_aol, aliases=aliases)
+        assert err is None
+        assert [a.quad for a in merged] == [
+            a.quad for a in compacted] + peer_quads
+        with writer.AOLWriter(path) as aol_writer:
+            appended, err = aol_writer.merge(peer_aol)
+            assert err is None
+            assert [a.quad for a in appended] == peer_quads
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path),
+                                sut.get_compactions_path(path))
+
+
+def test_aol_writer_compact():
+    """Test that an ``AOLWriter`` can compact its AOL and keep appending."""
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-compaction.txt')
+    try:
+        aol = generate_redundant_aol()
+        with writer.AOLWriter(path) as aol_writer:
+            aol_writer.append_quads([a.quad for a in aol])
+            compaction = aol_writer.compact()
+            assert aol_writer.tip_hash == compaction.post_tip_hash
+            assert aol_writer.length == 9
+            aol_writer.append_quads([aol[0].quad])
+            assert aol_writer.length == 10
+        assert len(aol_mod.get_aol(path)) == 10
+        assert aol_mod.get_tip_hash_in_file(path) == aol_writer.tip_hash
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path),
+                                sut.get_compactions_path(path))
+
+
+def test_compact_segmented_aol():
+    """Test that compacting a segmented AOL replaces its segments with new
+    ones holding the compacted AOL, and that it can be appended to afterwards.
+    """
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented-compaction')
+    try:
+        aol = generate_redundant_aol()
+        segments.persist_segmented_aol(aol, dir_path, segment_size=4)
+        compaction = sut.compact_segmented_aol(dir_path)
+        assert compaction.post_length == 9
+        manifest = segments.get_manifest(dir_path)
+        assert [s.file_name for s in manifest.segments] == [
+            'segment-000010.txt', 'segment-000011.txt', 'segment-000012.txt']
+        assert sorted(os.listdir(dir_path)) == sorted(
+            [s.file_name for s in manifest.segments] +
+            [segments.MANIFEST_FILE_NAME, sut.COMPACTIONS_FILE_NAME])
+        assert (aol_mod.list_to_aol(segments.get_segmented_aol(dir_path)) ==
+                sut.compact_aol(aol))
+        assert sut.read_compactions(dir_path) == [compaction]
+        more = aol_mod.append_many(
+            segments.get_segmented_aol(dir_path),
+            [aol_mod.fiat_attribute(aol[0].quad.entity, 'has-name', 'x')] * 4)
+        manifest = segments.persist_segmented_aol(more, dir_path)
+        assert [s.file_name for s in manifest.segments][-1] == (
+            'segment-000013.txt')
+        assert segments.get_segmented_aol_length(dir_path) == 13
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
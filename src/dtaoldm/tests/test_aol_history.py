@@ -0,0 +1,139 @@
+"""Tests for as-of (time travel) queries over the append-only log
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.domain as domain
+import dtaoldm.history as sut
+import dtaoldm.lazy as lazy
+import tests.utils as utils
+
+
+def generate_history_aol():
+    """Return an AOL in which an OLDInstance is created on 2019-07-01, starts
+    following a leader on 2019-07-02 and is synced on 2019-07-03, and the
+    OLDInstance as of each of those days.
+    """
+    old_instance, _ = domain.construct_old_instance(
+        slug='oka', name='Okanagan OLD', url='http://127.0.0.1:5679/oka')
+    following = old_instance._replace(
+        leader='https://do.onlinelinguisticdatabase.org/oka',
+        is_auto_syncing=True)
+    synced = following._replace(state=domain.SYNCED_STATE)
+    quads = [q._replace(time='2019-07-01T10:00:00.%06d' % i) for i, q in
+             enumerate(aol_mod.instance_to_quads(
+                 old_instance, domain.OLD_INSTANCE_TYPE))]
+    quads += [
+        aol_mod.Quad(old_instance.id, 'has-leader', following.leader,
+                     '2019-07-02T10:00:00'),
+        aol_mod.Quad(old_instance.id, 'is-auto-syncing', True,
+                     '2019-07-02T10:00:00.000001'),
+        aol_mod.Quad(old_instance.id, 'has-state', domain.SYNCED_STATE,
+                     '2019-07-03T10:00:00'),
+    ]
+    return aol_mod.append_many([], quads), (old_instance, following, synced)
+
+
+def get_old_instances(domain_entities):
+    return domain_entities['old-instances']
+
+
+def test_as_of():
+    """Test that ``as_of`` and ``as_of_hash`` return the domain entities at
+    historical points of the AOL.
+    """
+    aol, (old_instance, following, synced) = generate_history_aol()
+    assert get_old_instances(sut.as_of(
+        aol, '2019-06-30', domain.CONSTRUCTORS)) == set()
+    assert get_old_instances(sut.as_of(
+        aol, '2019-07-01T23:59:59', domain.CONSTRUCTORS)) == {old_instance}
+    assert get_old_instances(sut.as_of(
+        aol, '2019-07-02T12:00:00', domain.CONSTRUCTORS)) == {following}
+    assert get_old_instances(sut.as_of(
+        aol, '2020-01-01', domain.CONSTRUCTORS)) == {synced}
+    domain_entities, err = sut.as_of_hash(
+        aol, aol[-2].integrated_hash, domain.CONSTRUCTORS)
+    assert err is None
+    assert get_old_instances(domain_entities) == {following}
+    assert sut.as_of_hash(aol, 'abc', domain.CONSTRUCTORS) == (
+        None, sut.UNKNOWN_HASH_ERR)
+
+
+def test_aol_history():
+    """Test that an ``AOLHistory`` answers as-of queries from its snapshots
+    exactly as folding the AOL does, for lists and lazy AOLs, and that it
+    indexes appendables appended after it was built.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-history.txt')
+    try:
+        aol, (old_instance, following, synced) = generate_history_aol()
+        growing_aol = aol[:10]
+        history = sut.AOLHistory(growing_aol, domain.CONSTRUCTORS,
+                                 snapshot_interval=4)
+        assert len(history.deltas) == 2
+        growing_aol.extend(aol[10:])
+        history.update()
+        assert history.length == len(aol)
+        assert len(history.deltas) == 3
+        assert history.deltas[1] == aol_mod.fold_aol(aol[4:8])
+        for length in range(len(aol) + 1):
+            assert history.as_of_length(length) == (
+                aol_mod.aol_to_domain_entities(aol[:length],
+                                               domain.CONSTRUCTORS))
+        for timestamp in ('2019-06-30', '2019-07-01T10:00:00.000004',
+                          '2019-07-02T10:00:00', '2019-07-04'):
+            assert history.as_of(timestamp) == sut.as_of(
+                aol, timestamp, domain.CONSTRUCTORS)
+        assert history.as_of_hash(aol[-2].integrated_hash) == sut.as_of_hash(
+            aol, aol[-2].integrated_hash, domain.CONSTRUCTORS)
+        aol_mod.persist_aol(aol, path)
+        with lazy.LazyAOL(path) as lazy_aol:
+            history = sut.AOLHistory(lazy_aol, domain.CONSTRUCTORS,
+                                     snapshot_interval=5)
+            assert history.hash_index is lazy_aol.hash_index
+            assert get_old_instances(
+                history.as_of('2019-07-02T12:00:00')) == {following}
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path))
+
+
+def test_aol_history_persistence():
+    """Test that the snapshots of an ``AOLHistory`` can be persisted next to
+    an AOL file and resumed from, and that they are ignored if they do not
+    match the AOL.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-history-persisted.txt')
+    history_path = sut.get_history_path(path)
+    try:
+        aol, (old_instance, following, synced) = generate_history_aol()
+        aol_mod.persist_aol(aol[:10], path)
+        with lazy.LazyAOL(path) as lazy_aol:
+            history = sut.load_history(lazy_aol, path, domain.CONSTRUCTORS,
+                                       snapshot_interval=4)
+            assert history.length == 10
+            sut.persist_history(history, path)
+        aol_mod.persist_aol(aol, path)
+        with lazy.LazyAOL(path) as lazy_aol:
+            history = sut.load_history(lazy_aol, path, domain.CONSTRUCTORS,
+                                       snapshot_interval=4)
+            assert len(history.deltas) == 3
+            for length in range(len(aol) + 1):
+                assert history.as_of_length(length) == (
+                    aol_mod.aol_to_domain_entities(aol[:length],
+                                                   domain.CONSTRUCTORS))
+            assert get_old_instances(history.as_of_hash(
+                aol[-1].integrated_hash)[0]) == {synced}
+
+        # Snapshots of another interval or another AOL are ignored
+        history = sut.load_history(aol, path, domain.CONSTRUCTORS,
+                                   snapshot_interval=5)
+        assert len(history.deltas) == 2
+        other_aol = generate_history_aol()[0]
+        history = sut.load_history(other_aol, path, domain.CONSTRUCTORS,
+                                   snapshot_interval=4)
+        assert history.as_of_length(len(other_aol)) == (
+            aol_mod.aol_to_domain_entities(other_aol, domain.CONSTRUCTORS))
+    finally:
+        utils.remove_test_files(
+            path, history_path, aol_mod.get_hash_index_path(path))
@@ -0,0 +1,68 @@
+"""Tests for the lazy, memory-mapped append-only log
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.lazy as sut
+import tests.utils as utils
+
+
+def test_lazy_aol_sequence():
+    """Test that a ``LazyAOL`` behaves like the list returned by ``get_aol``
+    under ``len``, indexing, slicing and iteration.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-lazy.txt')
+    path_empty = os.path.join(utils.TMP_PATH, 'aol-lazy-empty.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        aol_mod.persist_aol(test_aol, path)
+        aol = aol_mod.get_aol(path)
+        with sut.LazyAOL(path) as lazy_aol:
+            assert len(lazy_aol) == len(aol)
+            assert lazy_aol[0] == aol[0]
+            assert lazy_aol[-1] == aol[-1]
+            assert lazy_aol[3:7] == aol[3:7]
+            assert lazy_aol[::-5] == aol[::-5]
+            assert list(lazy_aol) == aol
+            assert list(reversed(lazy_aol)) == list(reversed(aol))
+            assert aol_mod.get_tip_hash(lazy_aol) == aol_mod.get_tip_hash(aol)
+            assert aol_mod.get_hash_index(lazy_aol) == aol_mod.get_hash_index(
+                aol)
+            try:
+                lazy_aol[len(aol)]
+                assert False, 'Expected an IndexError'
+            except IndexError:
+                pass
+        with sut.LazyAOL(path_empty) as lazy_aol:
+            assert len(lazy_aol) == 0
+            assert aol_mod.get_tip_hash(lazy_aol) is None
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path),
+                                path_empty,
+                                aol_mod.get_hash_index_path(path_empty))
+
+
+def test_lazy_aol_merging():
+    """Test that a ``LazyAOL`` can be passed to ``get_new_appendables``,
+    ``find_changes`` and ``merge_aols``, and that the appendables merged into
+    it can be persisted to its file.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-lazy-merge.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        aol_mod.persist_aol(test_aol[:10], path)
+        with sut.LazyAOL(path) as lazy_aol:
+            assert (aol_mod.get_new_appendables(
+                test_aol, lazy_aol[-1].integrated_hash) == test_aol[10:])
+            assert aol_mod.find_changes(lazy_aol, test_aol) == test_aol[10:]
+            assert aol_mod.find_changes(test_aol, lazy_aol) == []
+            merged, err = aol_mod.merge_aols(lazy_aol, test_aol)
+            assert err is None
+            assert len(merged) == len(test_aol)
+            assert aol_mod.get_hashes(merged) == aol_mod.get_hashes(test_aol)
+            aol_mod.persist_aol(merged, path)
+        assert (aol_mod.get_hashes(aol_mod.get_aol(path)) ==
+                aol_mod.get_hashes(test_aol))
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path))
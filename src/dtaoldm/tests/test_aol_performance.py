@@ -14,7 +14,9 @@ Key Take-aways:
    across multiple files.
 
 3. Related to (2), reads from large AOLs should be implemented using multiple
-   processes, each responsible for a portion of the AOL.
+   processes, each responsible for a portion of the AOL. See the ``processes``
+   parameter of ``get_aol``, ``aol_to_domain_entities`` and
+   ``file_to_domain_entities``.
 
 Detailed Q&As:
 
@@ -68,6 +70,7 @@ import time
 import pytest
 
 import dtaoldm.aol as aol_mod
+import dtaoldm.domain as domain
 import tests.utils as utils
 
 
@@ -202,3 +205,46 @@ def test_large_aol_append_time():
         tot_time = t2 - t1
         runs.append((fn, tot_time))
     pprint.pprint(runs)
+
+
+@pytest.mark.skip
+def test_large_aol_parallel_read_time():
+    """Question: How long does it take to read a large AOL file from disk and
+    fold it into domain entities when the work is split across processes?
+
+    Compare the output with that of ``test_large_aol_read_time``.
+    """
+    fnames = sorted(fn for fn in os.listdir(utils.RESOURCES_PATH))
+    runs = []
+    for fn in fnames:
+        aol_path = os.path.join(utils.RESOURCES_PATH, fn)
+        for processes in (1, 2, 4, 8):
+            t1 = time.time()
+            aol_mod.get_aol(aol_path, processes=processes)
+            t2 = time.time()
+            aol_mod.file_to_domain_entities(
+                aol_path, domain.CONSTRUCTORS, processes=processes)
+            t3 = time.time()
+            runs.append((fn, processes, t2 - t1, t3 - t2))
+    pprint.pprint(runs)
+
+
+@pytest.mark.skip
+def test_append_many_time():
+    """Question: How much faster is hashing quads in batch with
+    ``append_many`` than one at a time with ``append_to_aol``, and how do the
+    digests compare?
+    """
+    quads = [appendable.quad for appendable in
+             utils.generate_large_test_aol(10000)]
+    runs = []
+    for digest in aol_mod.DIGESTS:
+        t1 = time.time()
+        aol = []
+        for quad in quads:
+            aol = aol_mod.append_to_aol(aol, quad, digest=digest)
+        t2 = time.time()
+        aol_mod.append_many([], quads, digest=digest)
+        t3 = time.time()
+        runs.append((digest, (t2 - t1) / len(quads), (t3 - t2) / len(quads)))
+    pprint.pprint(runs)
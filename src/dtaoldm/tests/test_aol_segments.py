@@ -0,0 +1,164 @@
+"""Tests for the segmented append-only log
+"""
+
+import os
+import shutil
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.segments as sut
+import tests.utils as utils
+
+
+def test_segmented_aol_persistence():
+    """Test that ``persist_segmented_aol`` rotates segments when they are full,
+    records each segment in the manifest, and that reading the segmented AOL
+    back yields the same appendables as a monolithic AOL file.
+    """
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented')
+    path = os.path.join(utils.TMP_PATH, 'aol-monolithic.txt')
+    try:
+        test_aol = utils.generate_test_aol()  # 18 appendables
+        sut.persist_segmented_aol(test_aol[:5], dir_path, segment_size=7)
+        manifest = sut.persist_segmented_aol(test_aol, dir_path)
+        assert [s.line_count for s in manifest.segments] == [7, 7, 4]
+        assert [s.file_name for s in manifest.segments] == [
+            'segment-000000.txt', 'segment-000001.txt', 'segment-000002.txt']
+        assert manifest.segments[0].first_hash == test_aol[0].integrated_hash
+        assert manifest.segments[1].first_hash == test_aol[7].integrated_hash
+        assert manifest.segments[1].last_hash == test_aol[13].integrated_hash
+        assert sut.get_segmented_tip_hash(dir_path) == aol_mod.get_tip_hash(
+            test_aol)
+        assert sut.get_segmented_aol_length(dir_path) == len(test_aol)
+        aol_mod.persist_aol(test_aol, path)
+        assert sut.get_segmented_aol(dir_path) == aol_mod.get_aol(path)
+        assert sut.tail_segmented_aol(dir_path, 7) == aol_mod.get_aol(path)[-7:]
+        assert sut.tail_segmented_aol(dir_path, 0) == []
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
+        utils.remove_test_files(path)
+
+
+def test_segmented_aol_uncommitted_lines():
+    """Test that lines written to the active segment after its last manifest
+    update (e.g., before a crash), including a torn one, are not read and are
+    truncated before the segment is appended to.
+    """
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented-uncommitted')
+    try:
+        test_aol = utils.generate_test_aol()  # 18 appendables
+        manifest = sut.persist_segmented_aol(
+            test_aol[:10], dir_path, segment_size=7)
+        active = manifest.segments[-1]
+        segment_path = sut.get_segment_path(dir_path, active)
+        assert active.byte_length == os.path.getsize(segment_path)
+        with open(segment_path, 'a') as fh:
+            fh.write(aol_mod.serialize_appendable(test_aol[10]))
+            fh.write(aol_mod.serialize_appendable(test_aol[11])[:20])
+        assert (aol_mod.list_to_aol(sut.get_segmented_aol(dir_path)) ==
+                test_aol[:10])
+        assert list(sut.iter_segment_hashes(dir_path, active)) == (
+            aol_mod.get_hashes(test_aol[7:10]))
+        sut.persist_segmented_aol(test_aol, dir_path)
+        assert (aol_mod.list_to_aol(sut.get_segmented_aol(dir_path)) ==
+                test_aol)
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
+
+
+def test_segmented_aol_empty():
+    """Test that a new segmented AOL is empty and has no tip."""
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented-empty')
+    try:
+        assert sut.get_segmented_aol(dir_path) == []
+        assert sut.get_segmented_tip_hash(dir_path) is None
+        assert sut.get_segmented_aol_length(dir_path) == 0
+        assert os.path.isfile(sut.get_manifest_path(dir_path))
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
+
+
+def test_convert_segments_to_binary():
+    """Test that ``convert_segments_to_binary`` converts only the closed
+    segments, and that the segmented AOL reads back the same appendables and
+    can still be appended to afterwards.
+    """
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented-binary')
+    try:
+        test_aol = utils.generate_test_aol()  # 18 appendables
+        sut.persist_segmented_aol(test_aol[:14], dir_path, segment_size=7)
+        manifest = sut.convert_segments_to_binary(dir_path)
+        assert [s.format for s in manifest.segments] == [
+            sut.BINARY_FORMAT, sut.BINARY_FORMAT]
+        assert sorted(os.listdir(dir_path)) == [
+            'manifest.json', 'segment-000000.bin', 'segment-000000.bloom',
+            'segment-000001.bin', 'segment-000001.bloom']
+        manifest = sut.persist_segmented_aol(test_aol, dir_path)
+        manifest = sut.convert_segments_to_binary(dir_path)
+        assert [s.format for s in manifest.segments] == [
+            sut.BINARY_FORMAT, sut.BINARY_FORMAT, sut.JSONL_FORMAT]
+        assert (aol_mod.list_to_aol(sut.get_segmented_aol(dir_path)) ==
+                test_aol)
+        assert (aol_mod.list_to_aol(sut.tail_segmented_aol(dir_path, 8)) ==
+                test_aol[-8:])
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
+
+
+def test_find_segmented_changes(monkeypatch):
+    """Test that ``find_segmented_changes`` agrees with
+    ``dtaoldm.aol.find_changes``, that closed segments get Bloom filters, and
+    that locating the fork point only reads the active segment and the closed
+    segments whose filters report a probed hash.
+    """
+    dir_path = os.path.join(utils.TMP_PATH, 'aol-segmented-bloom')
+    try:
+        test_aol = utils.generate_test_aol()  # 18 appendables
+        manifest = sut.persist_segmented_aol(
+            test_aol, dir_path, segment_size=4)
+        assert [os.path.isfile(sut.get_bloom_path(dir_path, segment)) for
+                segment in manifest.segments] == [True] * 4 + [False]
+        assert list(sut.iter_segment_hashes(
+            dir_path, manifest.segments[1])) == aol_mod.get_hashes(
+                test_aol[4:8])
+        diverged = aol_mod.append_to_aol(
+            list(test_aol[:9]), aol_mod.fiat_attribute(
+                test_aol[0].quad.entity, 'has-name', 'Nsyilxcen'))
+        unrelated = aol_mod.append_to_aol([], aol_mod.fiat_entity())
+        for mergee in ([], test_aol[:3], test_aol, diverged, unrelated):
+            assert sut.find_segmented_changes(dir_path, mergee) == (
+                aol_mod.find_changes(test_aol, mergee))
+        # Bloom filters have false positives, so the segments that are read
+        # are checked against the ones whose filters report a probed hash.
+        read_segments = []
+        reporting_segments = {manifest.segments[-1].file_name}
+        bloom_segments = {}
+        iter_segment_hashes = sut.iter_segment_hashes
+        get_segment_bloom = sut.get_segment_bloom
+        bloom_contains = sut.bloom_mod.bloom_contains
+
+        def counting_iter_segment_hashes(dir_path, segment):
+            read_segments.append(segment.file_name)
+            return iter_segment_hashes(dir_path, segment)
+
+        def recording_get_segment_bloom(dir_path, segment):
+            bloom = get_segment_bloom(dir_path, segment)
+            bloom_segments[id(bloom)] = segment.file_name
+            return bloom
+
+        def recording_bloom_contains(bloom, integrated_hash):
+            if bloom_contains(bloom, integrated_hash):
+                reporting_segments.add(bloom_segments[id(bloom)])
+                return True
+            return False
+
+        monkeypatch.setattr(
+            sut, 'iter_segment_hashes', counting_iter_segment_hashes)
+        monkeypatch.setattr(
+            sut, 'get_segment_bloom', recording_get_segment_bloom)
+        monkeypatch.setattr(
+            sut.bloom_mod, 'bloom_contains', recording_bloom_contains)
+        assert sut.find_segmented_changes(dir_path, diverged) == diverged[9:]
+        assert len(read_segments) == len(set(read_segments))
+        assert set(read_segments) <= reporting_segments
+    finally:
+        shutil.rmtree(dir_path, ignore_errors=True)
@@ -0,0 +1,82 @@
+"""Tests for append-only log verification
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.verify as sut
+import tests.utils as utils
+
+
+def get_test_paths(name):
+    path = os.path.join(utils.TMP_PATH, name)
+    return path, sut.get_checkpoint_path(path)
+
+
+def test_verify_aol():
+    """Test that a valid AOL verifies, sequentially and in parallel, and that
+    checkpoints are written for complete blocks and used by later
+    verifications.
+    """
+    path, checkpoint_path = get_test_paths('aol-verify.txt')
+    try:
+        test_aol = utils.generate_large_test_aol(5)  # 45 appendables
+        aol_mod.persist_aol(test_aol[:30], path)
+        assert sut.verify_aol(path, checkpoint_interval=7) == (30, None)
+        checkpoints = sut.read_checkpoint_file(path)
+        assert [c.position for c in checkpoints] == [6, 13, 20, 27]
+        assert checkpoints[-1].integrated_hash == test_aol[27].integrated_hash
+        aol_mod.persist_aol(test_aol, path)
+        assert sut.verify_aol(path, checkpoint_interval=7) == (45, None)
+        assert [c.position for c in sut.read_checkpoint_file(path)] == [
+            6, 13, 20, 27, 34, 41]
+        assert sut.read_checkpoint_file(path)[:4] == checkpoints
+        assert sut.verify_aol(
+            path, processes=3, checkpoint_interval=7, full=True) == (45, None)
+        assert sut.main([path, '--checkpoint-interval', '7']) == 0
+    finally:
+        utils.remove_test_files(path, checkpoint_path)
+
+
+def test_verify_aol_with_digest():
+    """Test that AOLs using a non-default digest verify."""
+    path, checkpoint_path = get_test_paths('aol-verify-blake2b.txt')
+    try:
+        quads = [a.quad for a in utils.generate_test_aol()]
+        aol_mod.persist_aol(
+            aol_mod.append_many([], quads, digest=aol_mod.BLAKE2B_DIGEST),
+            path, digest=aol_mod.BLAKE2B_DIGEST)
+        assert sut.verify_aol(path, checkpoint_interval=4) == (18, None)
+    finally:
+        utils.remove_test_files(path, checkpoint_path)
+
+
+def test_verify_aol_detects_corruption():
+    """Test that tampered quads, broken chain links and torn lines are
+    reported at the position of the first invalid appendable.
+    """
+    path, checkpoint_path = get_test_paths('aol-verify-corrupt.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        tampered = list(test_aol)
+        quad = tampered[10].quad._replace(value='tampered')
+        tampered[10] = tampered[10]._replace(quad=quad)
+        aol_mod.write_aol_to_file(tampered, path)
+        verified, err = sut.verify_aol(path, checkpoint_interval=4)
+        assert verified == 10
+        assert err == sut.get_verification_error(10, sut.BAD_HASH_ERR)
+        assert [c.position for c in sut.read_checkpoint_file(path)] == [3, 7]
+        unchained = list(test_aol)
+        unchained[8] = aol_mod.make_appendable(unchained[8].quad, None)
+        aol_mod.write_aol_to_file(unchained, path)
+        assert sut.verify_aol(path, checkpoint_interval=4) == (
+            8, sut.get_verification_error(8, sut.BAD_INTEGRATED_HASH_ERR))
+        aol_mod.write_aol_to_file(test_aol, path)
+        assert sut.verify_aol(path, checkpoint_interval=4) == (18, None)
+        with open(path, 'a') as fh:
+            fh.write('[["torn')
+        assert sut.verify_aol(path, checkpoint_interval=4) == (
+            18, sut.get_verification_error(18, sut.UNPARSEABLE_ERR))
+        assert sut.main([path]) == 1
+    finally:
+        utils.remove_test_files(path, checkpoint_path)
@@ -0,0 +1,272 @@
+"""Tests for incrementally appending to an AOL file with an ``AOLWriter``
+"""
+
+import os
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.compaction as compaction_mod
+import dtaoldm.materialized as materialized
+import dtaoldm.writer as sut
+import tests.utils as utils
+
+
+def test_aol_writer_append_quads():
+    """Test that appending quads with an ``AOLWriter`` produces the same file
+    as ``persist_aol`` and keeps the writer's cached tip, length and hash index
+    (and the sidecar index file) up to date.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer.txt')
+    path_persist = os.path.join(utils.TMP_PATH, 'aol-writer-persist.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        aol_mod.persist_aol(test_aol[:5], path)
+        aol_mod.persist_aol(test_aol, path_persist)
+        with sut.AOLWriter(path) as writer:
+            assert writer.tip_hash == test_aol[4].integrated_hash
+            assert writer.length == 5
+            appendables = writer.append_quads(
+                [appendable.quad for appendable in test_aol[5:]])
+            assert appendables == test_aol[5:]
+            assert writer.tip_hash == aol_mod.get_tip_hash(test_aol)
+            assert writer.length == len(test_aol)
+            assert writer.hash_index == aol_mod.get_hash_index(test_aol)
+            assert writer.append_quads([]) == []
+        with open(path, 'r') as fh, open(path_persist, 'r') as fh_p:
+            assert fh.read() == fh_p.read()
+        assert aol_mod.is_hash_index_file_current(path)
+
+        # A writer opened on an AOL whose index lost its tail (e.g., in a
+        # crash) rebuilds the index before appending to it.
+        index_path = aol_mod.get_hash_index_path(path)
+        with open(index_path, 'r') as fh:
+            index_lines = fh.readlines()
+        with open(index_path, 'w') as fh:
+            fh.writelines(index_lines[:-1])
+        quad = aol_mod.fiat_entity()
+        with sut.AOLWriter(path) as writer:
+            writer.append_quads([quad])
+        assert aol_mod.is_hash_index_file_consistent(path)
+        assert aol_mod.get_hash_index_in_file(path) == (
+            aol_mod.get_hash_index(aol_mod.append_to_aol(
+                list(test_aol), quad)))
+    finally:
+        utils.remove_test_files(
+            path, path_persist, aol_mod.get_hash_index_path(path))
+
+
+def test_aol_writer_merge():
+    """Test that ``AOLWriter.merge`` only appends the changes from the mergee
+    and honours the conflict resolution strategy.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-merge.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        with sut.AOLWriter(path) as writer:
+            assert writer.tip_hash is None
+            appended, err = writer.merge(test_aol[:10])
+            assert (appended, err) == (test_aol[:10], None)
+            appended, err = writer.merge(test_aol[:10])
+            assert (appended, err) == ([], None)
+            appended, err = writer.merge(test_aol)
+            assert (appended, err) == (test_aol[10:], None)
+            diverged = aol_mod.append_to_aol(
+                list(test_aol[:12]), aol_mod.fiat_attribute(
+                    test_aol[0].quad.entity, 'has-name', 'Nsyilxcen'))
+            appended, err = writer.merge(diverged)
+            assert (appended, err) == (None, aol_mod.NEED_REBASE_ERR)
+            appended, err = writer.merge(
+                diverged, conflict_resolution_strategy='rebase')
+            assert err is None
+            assert [a.quad for a in appended] == [diverged[-1].quad]
+        assert aol_mod.get_aol(path)[-1].integrated_hash == (
+            appended[-1].integrated_hash)
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path))
+
+
+def test_aol_writer_views():
+    """Test that views added to an ``AOLWriter`` are brought up to date with
+    the AOL and kept up to date as quads are appended.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-views.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        aol_mod.persist_aol(test_aol[:5], path)
+        index = materialized.EAVIndex()
+        with sut.AOLWriter(path) as writer:
+            assert writer.add_view(index) is None
+            assert index.tip_hash == test_aol[4].integrated_hash
+            writer.append_quads([a.quad for a in test_aol[5:]])
+            assert index.tip_hash == writer.tip_hash
+            assert index.length == len(test_aol)
+            expected = materialized.EAVIndex()
+            expected.apply(test_aol)
+            assert index.eavt == expected.eavt
+            assert index.avet == expected.avet
+            stale = materialized.EAVIndex()
+            stale.apply(utils.generate_test_aol()[:2])
+            assert writer.add_view(stale) == materialized.DIVERGED_ERR
+            assert len(writer.views) == 1
+
+        # Closing the writer checkpoints its views, so that a view loaded
+        # from its checkpoint only folds the appendables written since.
+        checkpointed = materialized.load_eav_index_checkpoint(path)
+        assert checkpointed.tip_hash == index.tip_hash
+        assert checkpointed.eavt == index.eavt
+        assert checkpointed.avet == index.avet
+        quads = [aol_mod.fiat_entity()]
+        with sut.AOLWriter(path) as writer:
+            writer.append_quads(quads)
+            assert writer.add_view(checkpointed) is None
+            assert checkpointed.length == len(test_aol) + 1
+            assert checkpointed.entities_with(
+                aol_mod.HAS_ATTR, aol_mod.BEING_VAL) >= {quads[0].entity}
+    finally:
+        utils.remove_test_files(
+            path, aol_mod.get_hash_index_path(path),
+            materialized.get_checkpoint_path(
+                path, materialized.EAV_CHECKPOINT_SUFFIX))
+
+
+def test_aol_writer_merge_diff_only():
+    """Test that ``AOLWriter.merge`` with ``diff_only=True`` returns the same
+    patches as ``dtaoldm.aol.merge_aols`` and that applying them to the
+    mergees reproduces the AOL file.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-merge-diff-only.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        diverged = aol_mod.append_to_aol(
+            list(test_aol[:12]), aol_mod.fiat_attribute(
+                test_aol[0].quad.entity, 'has-name', 'Nsyilxcen'))
+        aol_mod.persist_aol(test_aol[:15], path)
+        with sut.AOLWriter(path) as writer:
+            for mergee in ([], test_aol[:10], test_aol[:15], test_aol,
+                           diverged):
+                target = aol_mod.get_aol(path)
+                expected, _ = aol_mod.merge_aols(
+                    target, mergee, conflict_resolution_strategy='rebase',
+                    diff_only=True)
+                patch, err = writer.merge(
+                    mergee, conflict_resolution_strategy='rebase',
+                    diff_only=True)
+                assert err is None
+                assert aol_mod.get_hashes(patch.appendables) == (
+                    aol_mod.get_hashes(expected.appendables))
+                assert patch.base_hash == expected.base_hash
+                patched, err = aol_mod.apply_patch(list(mergee), patch)
+                assert err is None
+                assert aol_mod.get_hashes(patched) == aol_mod.get_hashes(
+                    aol_mod.get_aol(path))
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path))
+
+
+def test_aol_writer_open_lines():
+    """Test that ``AOLWriter.open_lines`` positions the returned file at the
+    line of the requested appendable and bounds it by the end of the AOL.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-open-lines.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        aol_mod.persist_aol(test_aol, path, digest=aol_mod.BLAKE2B_DIGEST)
+        with sut.AOLWriter(path) as writer:
+            for start in (0, 5, len(test_aol), len(test_aol) + 3):
+                fh, length = writer.open_lines(start)
+                with fh:
+                    lines = fh.read(length).decode('utf8').splitlines()
+                assert [aol_mod.parse_appendable(line) for line in lines] == (
+                    aol_mod.get_aol(path)[start:])
+    finally:
+        utils.remove_test_files(path, aol_mod.get_hash_index_path(path))
+
+
+def test_aol_writer_merge_stream():
+    """Test that ``AOLWriter.merge_stream`` consumes the mergee in a single
+    pass and returns the same patches as ``AOLWriter.merge`` with
+    ``diff_only=True``.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-merge-stream.txt')
+    path_expected = os.path.join(
+        utils.TMP_PATH, 'aol-writer-merge-stream-expected.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        diverged = aol_mod.append_to_aol(
+            list(test_aol[:12]), aol_mod.fiat_attribute(
+                test_aol[0].quad.entity, 'has-name', 'Nsyilxcen'))
+        with sut.AOLWriter(path) as writer, \
+                sut.AOLWriter(path_expected) as expected_writer:
+            assert writer.merge_stream(iter(diverged), batch_size=3) == (
+                aol_mod.Patch(aol_mod.get_tip_hash(diverged), []), None)
+            writer.compact()
+            expected_writer.merge(diverged)
+            expected_writer.compact()
+            for mergee in ([], test_aol[:10], test_aol[:15], test_aol,
+                           diverged):
+                expected = expected_writer.merge(
+                    mergee, conflict_resolution_strategy='rebase',
+                    diff_only=True)
+                patch = writer.merge_stream(
+                    iter(mergee), conflict_resolution_strategy='rebase',
+                    batch_size=3)
+                assert patch == expected
+                assert writer.tip_hash == expected_writer.tip_hash
+            tip_hash = writer.tip_hash
+            unrelated = aol_mod.append_to_aol([], aol_mod.fiat_entity())
+            assert writer.merge_stream(iter(unrelated)) == (
+                None, aol_mod.NEED_REBASE_ERR)
+            assert writer.tip_hash == tip_hash
+    finally:
+        utils.remove_test_files(
+            path, aol_mod.get_hash_index_path(path),
+            compaction_mod.get_compactions_path(path), path_expected,
+            aol_mod.get_hash_index_path(path_expected),
+            compaction_mod.get_compactions_path(path_expected))
+
+
+def test_aol_writer_merge_three_way():
+    """Test that ``AOLWriter.merge`` and ``AOLWriter.merge_stream`` implement
+    the 'three-way' strategy like ``dtaoldm.aol.merge_aols``.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-writer-merge-three-way.txt')
+    path_stream = os.path.join(
+        utils.TMP_PATH, 'aol-writer-merge-three-way-stream.txt')
+    try:
+        test_aol = utils.generate_test_aol()
+        entity = test_aol[0].quad.entity
+        target = aol_mod.append_to_aol(
+            list(test_aol), aol_mod.fiat_attribute(entity, 'has-name', 'a'))
+        mergee = list(test_aol)
+        for attribute, value in (('has-name', 'b'), ('has-leader', 'l'),
+                                 ('has-url', 'u')):
+            aol_mod.append_to_aol(
+                mergee, aol_mod.fiat_attribute(entity, attribute, value))
+        expected, err = aol_mod.merge_aols(
+            list(target), mergee, conflict_resolution_strategy='three-way',
+            diff_only=True)
+        assert err is None
+        assert len(expected.conflicts) == 1
+        with sut.AOLWriter(path) as writer, \
+                sut.AOLWriter(path_stream) as stream_writer:
+            writer.merge(target)
+            stream_writer.merge(target)
+            result, err = writer.merge(
+                mergee, conflict_resolution_strategy='three-way',
+                diff_only=True)
+            stream_result, stream_err = stream_writer.merge_stream(
+                iter(mergee), conflict_resolution_strategy='three-way',
+                batch_size=1)
+            for actual in (result, stream_result):
+                assert actual.merged.base_hash == expected.merged.base_hash
+                assert aol_mod.get_hashes(actual.merged.appendables) == (
+                    aol_mod.get_hashes(expected.merged.appendables))
+                assert [(c.entity, c.attribute, list(c.target_quad),
+                         list(c.mergee_quad)) for c in actual.conflicts] == [
+                    (c.entity, c.attribute, list(c.target_quad),
+                     list(c.mergee_quad)) for c in expected.conflicts]
+            assert err is None and stream_err is None
+        assert aol_mod.get_aol(path) == aol_mod.get_aol(path_stream)
+    finally:
+        utils.remove_test_files(
+            path, aol_mod.get_hash_index_path(path), path_stream,
+            aol_mod.get_hash_index_path(path_stream))
@@ -0,0 +1,138 @@
+"""Tests for materialized (incrementally maintained) domain entities
+"""
+
+import os
+
+import pytest
+
+import dtaoldm.aol as aol_mod
+import dtaoldm.domain as domain
+import dtaoldm.materialized as sut
+import tests.utils as utils
+from tests.test_domain_aol import generate_test_aol
+
+
+def test_view_update():
+    """Test that incrementally updating a view yields the same domain entities
+    as folding the whole AOL, and that a diverged AOL is detected.
+    """
+    aol, true_domain_entities = generate_test_aol()
+    view = sut.DomainEntitiesView(domain.CONSTRUCTORS)
+    assert view.update(aol[:7]) is None
+    assert view.domain_entities == aol_mod.aol_to_domain_entities(
+        aol[:7], domain.CONSTRUCTORS)
+    assert view.update(aol) is None
+    assert view.domain_entities == true_domain_entities
+    assert (view.tip_hash, view.length) == (aol[-1].integrated_hash, len(aol))
+    assert view.update(aol) is None
+    assert view.length == len(aol)
+    assert view.update(aol[:3]) == sut.DIVERGED_ERR
+
+
+def test_view_checkpoint():
+    """Test that a view can be checkpointed next to an AOL file and brought up
+    to date from the file after more appendables have been persisted.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-view.txt')
+    try:
+        aol, true_domain_entities = generate_test_aol()
+        aol_mod.persist_aol(aol[:20], path)
+        view = sut.load_checkpoint(path, domain.CONSTRUCTORS)
+        assert view.length == 0
+        assert view.update_from_file(path) is None
+        assert view.length == 20
+        sut.persist_checkpoint(view, path)
+        aol_mod.persist_aol(aol, path)
+        view = sut.load_checkpoint(path, domain.CONSTRUCTORS)
+        assert view.tip_hash == aol[19].integrated_hash
+        assert view.update_from_file(path) is None
+        assert view.length == len(aol)
+        assert view.domain_entities == true_domain_entities
+        assert view.update_from_file(path) is None
+        assert view.length == len(aol)
+
+        # A view built in memory locates its tip via the hash index
+        view = sut.DomainEntitiesView(domain.CONSTRUCTORS)
+        view.apply(aol[:10])
+        assert view.update_from_file(path) is None
+        assert view.domain_entities == true_domain_entities
+    finally:
+        utils.remove_test_files(
+            path, sut.get_checkpoint_path(path),
+            aol_mod.get_hash_index_path(path))
+
+
+def test_eav_index():
+    """Test that an ``EAVIndex`` answers point queries with the current state
+    of the entities, including after attribute updates and retractions of
+    being.
+    """
+    aol, _ = generate_test_aol()
+    index = sut.EAVIndex()
+    assert index.update(aol) is None
+    entities = aol_mod.fold_aol(aol)
+    old_ids = {e for e, attrs in entities.items()
+               if attrs.get('_type') == domain.OLD_INSTANCE_TYPE}
+    assert index.entities_with(aol_mod.IS_A_ATTR,
+                               domain.OLD_INSTANCE_TYPE) == old_ids
+    old_id = sorted(old_ids)[0]
+    assert (index.current_value(old_id, 'has-slug') ==
+            entities[old_id]['slug'])
+    assert index.current_value(old_id, 'has-nothing', 'dflt') == 'dflt'
+    assert index.current_attributes(old_id)['is-auto-syncing'] is False
+    aol = aol_mod.append_many(aol, [
+        aol_mod.fiat_attribute(old_id, 'has-slug', 'new'),
+        aol_mod.Quad(old_id, aol_mod.LACKS_ATTR, aol_mod.BEING_VAL,
+                     aol_mod.get_now_str()),
+    ])
+    assert index.update(aol) is None
+    assert index.current_value(old_id, 'has-slug') == 'new'
+    assert old_id in index.entities_with('has-slug', 'new')
+    assert old_id not in index.entities_with(
+        'has-slug', entities[old_id]['slug'])
+    assert old_id not in index.entities_with(
+        aol_mod.HAS_ATTR, aol_mod.BEING_VAL)
+    assert index.current_value(old_id, aol_mod.HAS_ATTR) is None
+    assert index.update(aol[:3]) == sut.DIVERGED_ERR
+
+
+def test_eav_index_checkpoint():
+    """Test that an ``EAVIndex`` can be checkpointed next to an AOL file and
+    brought up to date from the file after more appendables have been
+    persisted.
+    """
+    path = os.path.join(utils.TMP_PATH, 'aol-eav-index.txt')
+    try:
+        aol, _ = generate_test_aol()
+        aol_mod.persist_aol(aol[:20], path)
+        index = sut.load_eav_index_checkpoint(path)
+        assert index.length == 0
+        assert index.update_from_file(path) is None
+        sut.persist_checkpoint(index, path)
+        aol_mod.persist_aol(aol, path)
+        index = sut.load_eav_index_checkpoint(path)
+        assert index.tip_hash == aol[19].integrated_hash
+        assert index.update_from_file(path) is None
+        expected = sut.EAVIndex()
+        expected.apply(aol)
+        assert index.length == len(aol)
+        assert index.eavt == expected.eavt
+        assert index.avet == expected.avet
+    finally:
+        utils.remove_test_files(
+            path, aol_mod.get_hash_index_path(path),
+            sut.get_checkpoint_path(path, sut.EAV_CHECKPOINT_SUFFIX))
+
+
+def test_incomplete_view():
+    """Test that a view that does not implement ``apply_quad`` cannot be
+    created.
+    """
+
+    class IncompleteView(sut.MaterializedView):
+
+        def get_checkpoint_data(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        IncompleteView()